@@ -0,0 +1,159 @@
+"""声明式警报规则
+
+每条规则描述一类要报警的交易：金额范围、市场类别、钱包条件（账号年龄 / 历史交易笔数）
+和输出目的地。规则在启动时从 JSON 配置（RULES_FILE，默认 alert_rules.json）加载并编译一次，
+扫描时对每笔交易同时评估：
+
+    [
+      {"name": "政治", "categories": ["政治"], "max_account_age_days": 10, "min_trade_count": 10,
+       "destinations": ["telegram", "csv", "sheets", "history"]},
+      {"name": "巨鲸", "min_bet": 100000, "destinations": ["telegram", "csv"]}
+    ]
+
+字段：
+- name: 规则名称（唯一）
+- min_bet / max_bet: 金额范围（USDC，含两端），min_bet 默认取 MIN_BET_USD
+- categories: 只匹配这些类别，省略表示全部类别
+- max_account_age_days: 账号年龄 <= 该天数时命中
+- min_trade_count: 历史交易笔数 < 该值时命中
+- wallet_match: 同时设置上面两项时的组合方式，"any"（默认，与原判定规则一致）或 "all"；
+  两项都不设置时不检查钱包，也不会为它查询钱包信息
+- destinations: telegram / csv / sheets / history 的子集，默认全部
+- enabled: 设为 false 时跳过
+
+一笔交易命中多条规则时只报警一次，输出到所有命中规则目的地的并集。
+没有配置文件时使用 default_rules()，与原来的硬编码逻辑等价。
+"""
+import json
+import os
+
+DESTINATIONS = ("telegram", "csv", "sheets", "history")
+WALLET_MATCH_MODES = ("any", "all")
+_FIELDS = {"name", "enabled", "min_bet", "max_bet", "categories", "max_account_age_days",
+           "min_trade_count", "wallet_match", "destinations", "description"}
+
+
+class Rule:
+    """编译后的单条规则"""
+
+    __slots__ = ("name", "min_bet", "max_bet", "categories", "max_account_age_days",
+                 "min_trade_count", "wallet_match", "destinations", "needs_wallet")
+
+    def __init__(self, name, min_bet, max_bet=None, categories=None, max_account_age_days=None,
+                 min_trade_count=None, wallet_match="any", destinations=DESTINATIONS):
+        if wallet_match not in WALLET_MATCH_MODES:
+            raise ValueError(f"规则 {name}: wallet_match 只能是 {'/'.join(WALLET_MATCH_MODES)}")
+        unknown = [d for d in destinations if d not in DESTINATIONS]
+        if unknown:
+            raise ValueError(f"规则 {name}: 未知的目的地 {unknown}，可选 {list(DESTINATIONS)}")
+        self.name = name
+        self.min_bet = float(min_bet)
+        self.max_bet = float(max_bet) if max_bet is not None else None
+        self.categories = frozenset(categories) if categories else None
+        self.max_account_age_days = int(max_account_age_days) if max_account_age_days is not None else None
+        self.min_trade_count = int(min_trade_count) if min_trade_count is not None else None
+        self.wallet_match = wallet_match
+        self.destinations = tuple(dict.fromkeys(destinations))
+        self.needs_wallet = self.max_account_age_days is not None or self.min_trade_count is not None
+
+    @classmethod
+    def from_config(cls, spec, default_min_bet):
+        name = spec.get("name")
+        if not name:
+            raise ValueError(f"规则缺少 name: {spec}")
+        unknown = set(spec) - _FIELDS
+        if unknown:
+            raise ValueError(f"规则 {name}: 未知字段 {sorted(unknown)}")
+        return cls(
+            name,
+            spec.get("min_bet", default_min_bet),
+            spec.get("max_bet"),
+            spec.get("categories"),
+            spec.get("max_account_age_days"),
+            spec.get("min_trade_count"),
+            spec.get("wallet_match", "any"),
+            spec.get("destinations", DESTINATIONS),
+        )
+
+    def accepts(self, amount, category):
+        """金额和类别是否满足（不需要钱包信息）"""
+        if amount < self.min_bet or (self.max_bet is not None and amount > self.max_bet):
+            return False
+        return self.categories is None or category in self.categories
+
+    def matches_wallet(self, days_old, bet_count):
+        """钱包条件是否满足；days_old 为 None（创建时间未知）时账号年龄条件不成立"""
+        if not self.needs_wallet:
+            return True
+        checks = []
+        if self.max_account_age_days is not None:
+            checks.append(days_old is not None and days_old <= self.max_account_age_days)
+        if self.min_trade_count is not None:
+            checks.append(bet_count is not None and bet_count < self.min_trade_count)
+        return any(checks) if self.wallet_match == "any" else all(checks)
+
+
+class RuleEngine:
+    """一组规则：先按金额和类别筛出可能命中的规则，再用一次钱包查询评估全部规则"""
+
+    def __init__(self, rules, source=None):
+        names = [r.name for r in rules]
+        duplicates = sorted({n for n in names if names.count(n) > 1})
+        if duplicates:
+            raise ValueError(f"规则名称重复: {duplicates}")
+        if not rules:
+            raise ValueError("至少需要一条启用的规则")
+        self.rules = list(rules)
+        self.source = source
+        # 拉取交易和候选筛选用所有规则中最低的金额阈值
+        self.min_bet = min(r.min_bet for r in self.rules)
+
+    def __len__(self):
+        return len(self.rules)
+
+    def applicable(self, amount, category):
+        return [r for r in self.rules if r.accepts(amount, category)]
+
+    @staticmethod
+    def wallet_requirements(rules):
+        """返回 (是否查询钱包, 交易笔数需查到的下限, 是否需要账号创建时间)
+
+        交易笔数只需查到这些规则中最大的 min_trade_count；没有规则检查笔数时查 1 条即可。
+        """
+        wallet_rules = [r for r in rules if r.needs_wallet]
+        if not wallet_rules:
+            return False, None, False
+        counts = [r.min_trade_count for r in wallet_rules if r.min_trade_count is not None]
+        need_created = any(r.max_account_age_days is not None for r in wallet_rules)
+        return True, max(counts) if counts else 1, need_created
+
+    @staticmethod
+    def evaluate(rules, days_old, bet_count):
+        return [r for r in rules if r.matches_wallet(days_old, bet_count)]
+
+    @staticmethod
+    def destinations(rules):
+        """命中规则目的地的并集（保持顺序）"""
+        return tuple(dict.fromkeys(d for r in rules for d in r.destinations))
+
+
+def default_rules(min_bet, max_account_age_days, min_trade_count):
+    """与原硬编码逻辑等价：所有类别写入 CSV / Sheets / 历史，只有政治类推送 Telegram"""
+    wallet = {"max_account_age_days": max_account_age_days, "min_trade_count": min_trade_count}
+    return [
+        Rule("政治", min_bet, categories=["政治"], destinations=DESTINATIONS, **wallet),
+        Rule("默认", min_bet, destinations=("csv", "sheets", "history"), **wallet),
+    ]
+
+
+def load_rules(path, min_bet, max_account_age_days, min_trade_count):
+    """从 JSON 文件加载并编译规则；文件不存在时使用默认规则，配置有误时抛出 ValueError"""
+    if not path or not os.path.exists(path):
+        return RuleEngine(default_rules(min_bet, max_account_age_days, min_trade_count))
+    with open(path, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    specs = config.get("rules") if isinstance(config, dict) else config
+    if not isinstance(specs, list):
+        raise ValueError(f"{path}: 应为规则列表或 {{\"rules\": [...]}}")
+    rules = [Rule.from_config(spec, min_bet) for spec in specs if spec.get("enabled", True)]
+    return RuleEngine(rules, source=path)
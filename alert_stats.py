@@ -0,0 +1,178 @@
+"""持久化的警报时间分桶计数
+
+每条警报触发时按分钟 / 小时 / 天三种粒度、按类别 / 市场 / 钱包累加计数和金额，
+保存在状态库的 alert_buckets 表中。汇总（最近一小时的分类统计、热门市场、重复出现的钱包）
+直接汇总对应窗口内的桶，不需要重新扫描历史，也不受单次运行拉取了多少交易、运行是否失败的影响。
+
+各粒度的桶只保留覆盖查询窗口所需的时间：
+- 分钟桶：3 小时（最近一小时的滚动窗口精确到分钟）
+- 小时桶：8 天（24 小时 / 7 天窗口）
+- 天桶：400 天
+
+每条警报同时写入三种粒度（相当于实时上卷），写入先在内存合并，flush() 时一次 UPSERT，
+多个进程 / 节点共享状态库时计数直接累加。
+
+已发送汇总覆盖到的时间点保存在 cache_meta（summary_until），下一次汇总从这里开始，
+定时任务提前或推迟启动时同一条警报不会出现在两次汇总里。汇总只统计已结束的桶，
+汇总之后仍落在当前桶里的警报计入下一次汇总。
+"""
+import threading
+import time
+
+MINUTE = 60
+HOUR = 3600
+DAY = 86400
+# 粒度（秒） -> 保留的桶数
+RESOLUTIONS = {MINUTE: 180, HOUR: 8 * 24, DAY: 400}
+DIMENSIONS = ("total", "category", "market", "wallet")
+
+
+class AlertStats:
+    """警报计数（线程安全），持久化到状态库的 alert_buckets 表"""
+
+    def __init__(self, conn):
+        self._conn = conn
+        self._lock = threading.Lock()
+        self._pending = {}  # (粒度, 桶, 维度, 键) -> [警报数, 金额, 显示名]
+        self.counters = {"recorded": 0, "flushed_rows": 0, "pruned_rows": 0}
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS alert_buckets (
+                resolution INTEGER NOT NULL,
+                bucket INTEGER NOT NULL,
+                dimension TEXT NOT NULL,
+                key TEXT NOT NULL,
+                label TEXT,
+                alerts INTEGER NOT NULL,
+                volume REAL NOT NULL,
+                PRIMARY KEY (resolution, bucket, dimension, key)
+            ) WITHOUT ROWID"""
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS cache_meta (key TEXT PRIMARY KEY, value REAL)")
+        self._conn.commit()
+
+    def record(self, category, market, wallet, amount, wallet_name=None, ts=None):
+        """记录一条已触发的警报"""
+        ts = time.time() if ts is None else ts
+        keys = (("total", "", None), ("category", category or "其他", None),
+                ("market", market or "", None), ("wallet", wallet or "", wallet_name))
+        with self._lock:
+            for resolution in RESOLUTIONS:
+                bucket = int(ts // resolution)
+                for dimension, key, label in keys:
+                    entry = self._pending.get((resolution, bucket, dimension, key))
+                    if entry is None:
+                        entry = self._pending[(resolution, bucket, dimension, key)] = [0, 0.0, None]
+                    entry[0] += 1
+                    entry[1] += amount or 0.0
+                    if label:
+                        entry[2] = label
+            self.counters["recorded"] += 1
+
+    def record_alert(self, alert, ts=None):
+        """从 process_trades 返回的警报行记录"""
+        amount = alert.get("bet_size_usdc")
+        return self.record(alert.get("category"), alert.get("market"), alert.get("user_address"),
+                           amount if isinstance(amount, (int, float)) else 0.0, alert.get("user_name"), ts)
+
+    def flush(self, now=None):
+        """写入内存中的计数并删除过期的桶，返回写入的行数"""
+        now = time.time() if now is None else now
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            rows = [(resolution, bucket, dimension, key, label, alerts, volume)
+                    for (resolution, bucket, dimension, key), (alerts, volume, label) in pending.items()]
+            self._conn.executemany(
+                """INSERT INTO alert_buckets (resolution, bucket, dimension, key, label, alerts, volume)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT (resolution, bucket, dimension, key) DO UPDATE SET
+                       alerts = alerts + excluded.alerts,
+                       volume = volume + excluded.volume,
+                       label = COALESCE(excluded.label, label)""",
+                rows,
+            )
+            pruned = 0
+            for resolution, keep in RESOLUTIONS.items():
+                cursor = self._conn.execute(
+                    "DELETE FROM alert_buckets WHERE resolution = ? AND bucket <= ?",
+                    (resolution, int(now // resolution) - keep),
+                )
+                pruned += cursor.rowcount
+            self._conn.commit()
+            self.counters["flushed_rows"] += len(rows)
+            self.counters["pruned_rows"] += pruned
+            return len(rows)
+
+    @staticmethod
+    def resolution_for(seconds):
+        """能覆盖窗口的最细粒度"""
+        for resolution, keep in sorted(RESOLUTIONS.items()):
+            if seconds <= resolution * (keep - 1):
+                return resolution
+        return DAY
+
+    def window(self, seconds, top=5, now=None, since=None, closed=False):
+        """最近 seconds 秒（指定 since 时不早于 since）的汇总：总数、金额、分类计数、热门市场和重复出现（>= 2 次）的钱包
+
+        窗口按所选粒度对齐到整桶（最近一小时按分钟、24 小时按小时）。closed=True 时不包含当前未结束的桶，
+        返回的 until 为当前桶的起点，可作为下一次汇总的 since：之后记录在当前桶里的警报留给下一次汇总。
+        since 早于 seconds 秒之前时窗口截断为 seconds 秒，capped 为 True（since 到窗口起点之间的警报不计入）。
+        """
+        self.flush(now)
+        now = time.time() if now is None else now
+        capped = False
+        if since is not None:
+            capped = now - since > seconds
+            seconds = max(0, min(seconds, now - since))
+        resolution = self.resolution_for(seconds)
+        current = int(now // resolution)
+        last = current - 1 if closed else current
+        first = last - max(1, -(-int(seconds) // resolution)) + 1
+        if since is not None:
+            first = max(first, -(-int(since) // resolution))
+        with self._lock:
+            rows = self._conn.execute(
+                """SELECT dimension, key, MAX(label), SUM(alerts), SUM(volume) FROM alert_buckets
+                   WHERE resolution = ? AND bucket BETWEEN ? AND ?
+                   GROUP BY dimension, key""",
+                (resolution, first, last),
+            ).fetchall()
+        result = {"seconds": seconds, "resolution": resolution, "since": first * resolution,
+                  "until": (last + 1) * resolution, "capped": capped,
+                  "alerts": 0, "volume": 0.0,
+                  "categories": {}, "top_markets": [], "repeat_wallets": []}
+        markets, wallets = [], []
+        for dimension, key, label, alerts, volume in rows:
+            if dimension == "total":
+                result["alerts"], result["volume"] = alerts, round(volume, 2)
+            elif dimension == "category":
+                result["categories"][key] = alerts
+            elif dimension == "market" and key:
+                markets.append({"market": key, "alerts": alerts, "volume": round(volume, 2)})
+            elif dimension == "wallet" and key and alerts >= 2:
+                wallets.append({"address": key, "name": label, "alerts": alerts, "volume": round(volume, 2)})
+        result["top_markets"] = sorted(markets, key=lambda m: (-m["alerts"], -m["volume"]))[:top]
+        result["repeat_wallets"] = sorted(wallets, key=lambda w: (-w["alerts"], -w["volume"]))[:top]
+        return result
+
+    def summary_until(self):
+        """上一次已发送汇总覆盖到的时间点，没有时返回 None"""
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM cache_meta WHERE key = 'summary_until'").fetchone()
+        return row[0] if row else None
+
+    def mark_summary(self, until):
+        """汇总已发送（或已加入发送队列）后记录覆盖到的时间点"""
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO cache_meta (key, value) VALUES ('summary_until', ?)", (until,))
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats["pending"] = len(self._pending)
+            return stats
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._conn.close()
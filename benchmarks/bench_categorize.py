@@ -0,0 +1,117 @@
+"""categorize_market 微基准
+
+用法: python benchmarks/bench_categorize.py [重复轮数]
+
+对一组真实风格的 Polymarket 市场标题，比较旧的逐关键词子串扫描与
+预编译正则匹配器的吞吐量，并输出每百万标题耗时和两者分类不同的标题。
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from polymarket_agent import CATEGORY_KEYWORDS, categorize_market  # noqa: E402
+
+TITLES = [
+    "Will Donald Trump win the 2028 US Presidential Election?",
+    "Presidential Election Winner 2028",
+    "Will JD Vance be the 2028 Republican presidential nominee?",
+    "Democratic Presidential Nominee 2028",
+    "Will Gavin Newsom announce a presidential run before 2027?",
+    "NYC Mayoral Election: Zohran Mamdani vs Andrew Cuomo",
+    "Who will Trump nominate as Fed Chair?",
+    "Fed decision in December?",
+    "Will the Fed cut interest rates by 50 bps in March?",
+    "Russia x Ukraine ceasefire in 2026?",
+    "Will Israel strike Iran before July?",
+    "Will the US acquire Greenland in 2026?",
+    "Portugal Presidential Election: Antonio Jose Seguro vs Andre Ventura",
+    "Venezuela regime change by end of year?",
+    "Epstein files released in full by March 31?",
+    "Will the Supreme Court rule on tariffs by June?",
+    "Senate control after the 2026 midterms",
+    "Will Elon Musk launch a new political party?",
+    "Bitcoin above $120,000 on December 31?",
+    "Will Ethereum hit $5,000 in January?",
+    "Solana ETF approved by SEC in 2026?",
+    "XRP all time high by June 30?",
+    "Will Coinbase list a new memecoin this week?",
+    "Dogecoin up or down on Friday?",
+    "Will USDT lose its peg in 2026?",
+    "MicroStrategy buys more Bitcoin this week?",
+    "Lakers vs. Celtics",
+    "NBA Champion 2026",
+    "Will the Chiefs win Super Bowl LX?",
+    "Eagles vs. Cowboys: Who will win?",
+    "Premier League Winner 2025-26",
+    "Arsenal vs. Manchester City",
+    "Real Madrid vs. Barcelona: El Clasico",
+    "Champions League Winner",
+    "Will Messi play in the 2026 World Cup?",
+    "T1 vs Gen.G - LCK Finals",
+    "Oilers vs. Panthers Game 7",
+    "UFC 320: Jones vs. Aspinall",
+    "Stade Rennais vs. Le Havre",
+    "Will the S&P 500 close above 7,000 this year?",
+    "Nasdaq up or down on Monday?",
+    "US recession in 2026?",
+    "Will CPI come in above 3.0% for January?",
+    "Nvidia earnings beat expectations?",
+    "Largest company in the world at end of 2026?",
+    "Will unemployment rate exceed 4.5% in March?",
+    "Will it rain in Indiana on Saturday?",
+    "Who will win the second season of The Traitors?",
+    "Taylor Swift album release before October?",
+    "Will OpenAI release GPT-6 in 2026?",
+    "Highest grossing movie of 2026?",
+    "Time Person of the Year 2026",
+    "Will a solution to the Riemann Hypothesis be published?",
+    "Will SpaceX land Starship on Mars before 2030?",
+    "Oscars 2026: Best Picture Winner",
+    "Highest temperature in London on Tuesday?",
+    "Will Apple announce a foldable iPhone?",
+    "2028年美国总统选举获胜者",
+    "比特币年底价格",
+    "世界杯冠军",
+]
+
+
+def legacy_categorize(market_title):
+    """旧实现：每次调用都对全部关键词做 lower() 和子串扫描"""
+    if not market_title:
+        return "其他"
+    title_lower = market_title.lower()
+    for category, keywords in CATEGORY_KEYWORDS.items():
+        for keyword in keywords:
+            if keyword.lower() in title_lower:
+                return category
+    return "其他"
+
+
+def bench(func, titles, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for title in titles:
+            func(title)
+    elapsed = time.perf_counter() - start
+    n = rounds * len(titles)
+    return n / elapsed, elapsed / n * 1_000_000
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    print(f"标题数: {len(TITLES)}  轮数: {rounds}")
+    for name, func in (("legacy substring", legacy_categorize), ("compiled regex", categorize_market)):
+        rate, per_million = bench(func, TITLES, rounds)
+        print(f"{name:>18}: {rate:>12,.0f} titles/s  {per_million:8.2f} s / 1M titles")
+
+    changed = [(t, legacy_categorize(t), categorize_market(t)) for t in TITLES if legacy_categorize(t) != categorize_market(t)]
+    if changed:
+        print("\n分类发生变化的标题:")
+        for title, old, new in changed:
+            print(f"  {old} -> {new}: {title}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""run_task 离线基准
+
+用法: python benchmarks/bench_run_task.py [--runs 3] [--warm] [--fixtures DIR]
+                                          [--latency-ms 30] [--jitter-ms 10]
+                                          [--error-rate 0.02] [--rate-limit-rate 0.01]
+
+启动 benchmarks/stub_api.py 的本地替身（Data API、Gamma API、Telegram、Google Sheets），
+通过环境变量把 polymarket_agent 指向它，在临时目录中执行完整的扫描流程，输出：
+- 每轮墙钟时间和警报数
+- 每轮各接口的请求数（含注入的错误）
+- 各阶段耗时（polymarket_agent.METRICS 的计时区间：fetch、dedup、enrichment、persistence 等）
+
+--workers N 时按钱包哈希分给 N 个工作进程（ShardPool），阶段耗时只包含协调进程。
+
+默认每轮都是冷启动（空的状态库和缓存）；--warm 时复用同一个状态库，
+只清空去重记录和游标，用于衡量钱包/市场缓存命中后的开销。
+不指定 --fixtures 时使用 stub_api.generate_fixtures() 生成的确定性合成数据。
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from io import StringIO
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.join(BENCH_DIR, ".."))
+
+from stub_api import StubServer, StubState, generate_fixtures, load_fixtures  # noqa: E402
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="run_task 离线基准")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--warm", action="store_true", help="复用状态库（钱包/市场缓存已预热）")
+    parser.add_argument("--fixtures", help="fixtures 目录，不指定则使用合成数据")
+    parser.add_argument("--trades", type=int, default=300, help="合成数据的交易笔数")
+    parser.add_argument("--wallets", type=int, default=120, help="合成数据的钱包数")
+    parser.add_argument("--latency-ms", type=float, default=30)
+    parser.add_argument("--jitter-ms", type=float, default=10)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="注入 502 的比例")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="注入 429 的比例")
+    parser.add_argument("--telegram-pacing", action="store_true", help="保留 Telegram 限速（默认关闭）")
+    parser.add_argument("--workers", type=int, default=0, help="本地分片工作进程数（0 表示单进程）")
+    parser.add_argument("--verbose", action="store_true", help="显示扫描过程的输出")
+    return parser.parse_args()
+
+
+def configure_env(base_url, telegram_pacing):
+    """在导入 polymarket_agent 之前设置环境变量"""
+    os.environ.update({
+        "DATA_API_URL": base_url,
+        "GAMMA_API_URL": base_url,
+        "TELEGRAM_API_URL": base_url,
+        "TELEGRAM_TOKEN": "000000:bench",
+        "METRICS_FILE": "",
+        "GOOGLE_SHEETS_WEBHOOK": f"{base_url}/sheets",
+        "GOOGLE_SHEETS_BATCH": "1",
+        "HTTP_MAX_RETRIES": os.environ.get("HTTP_MAX_RETRIES", "3"),
+    })
+    if not telegram_pacing:
+        os.environ.update({"TELEGRAM_MIN_INTERVAL": "0", "TELEGRAM_PER_MINUTE": "0"})
+
+
+def stage_seconds(agent):
+    return {stage: stats["seconds"] for stage, stats in agent.METRICS.snapshot()["stages"].items()}
+
+
+def reset_for_warm_run(workdir, agent):
+    """保留钱包/市场缓存，清空去重记录和游标，让同一批交易重新走完整流程"""
+    cursor_path = os.path.join(workdir, agent.INGEST_CURSOR_FILE)
+    if os.path.exists(cursor_path):
+        os.remove(cursor_path)
+    db_path = os.path.join(workdir, agent.STATE_DB_FILE)
+    if os.path.exists(db_path):
+        conn = sqlite3.connect(db_path)
+        with conn:
+            conn.execute("DELETE FROM sent_trades")
+        conn.close()
+
+
+def run_once(agent, stub, workdir, verbose, workers=0):
+    stub.reset()
+    previous = os.getcwd()
+    os.chdir(workdir)
+    output = StringIO()
+    try:
+        start = time.perf_counter()
+        if verbose:
+            agent.run_task(workers)
+        else:
+            with redirect_stdout(output):
+                agent.run_task(workers)
+        elapsed = time.perf_counter() - start
+    finally:
+        os.chdir(previous)
+    return elapsed, dict(stub.counts), dict(stub.injected), len(stub.telegram_messages), len(stub.sheet_rows)
+
+
+def main():
+    args = parse_args()
+    if args.fixtures:
+        fixtures = load_fixtures(args.fixtures)
+        source = args.fixtures
+    else:
+        fixtures = generate_fixtures(trades=args.trades, wallets=args.wallets)
+        source = f"合成数据 ({args.trades} 笔交易, {args.wallets} 个钱包)"
+
+    state = StubState(fixtures, args.latency_ms, args.jitter_ms, args.error_rate, args.rate_limit_rate)
+    with StubServer(state) as stub:
+        configure_env(stub.base_url, args.telegram_pacing)
+        import polymarket_agent as agent
+
+        print(f"fixtures: {source}")
+        print(f"替身: {stub.base_url}  延迟 {args.latency_ms}±{args.jitter_ms}ms  "
+              f"502 {args.error_rate:.1%}  429 {args.rate_limit_rate:.1%}  模式: {'warm' if args.warm else 'cold'}")
+
+        with tempfile.TemporaryDirectory(prefix="bench_run_task_") as root:
+            shared = os.path.join(root, "warm")
+            os.makedirs(shared)
+            if args.warm:
+                run_once(agent, state, shared, False, args.workers)
+            for i in range(args.runs):
+                if args.warm:
+                    workdir = shared
+                    reset_for_warm_run(workdir, agent)
+                else:
+                    workdir = os.path.join(root, f"cold{i}")
+                    os.makedirs(workdir)
+                before = stage_seconds(agent)
+                elapsed, counts, injected, messages, rows = run_once(agent, state, workdir, args.verbose, args.workers)
+                stages = {k: v - before.get(k, 0.0) for k, v in stage_seconds(agent).items()}
+
+                print(f"\n=== 第 {i + 1} 轮: {elapsed:.3f}s, {sum(counts.values())} 个请求, "
+                      f"Telegram {messages} 条, Sheets {rows} 行 ===")
+                for key, count in sorted(counts.items()):
+                    print(f"  {key:<28} {count:>6}")
+                for key, count in sorted(injected.items()):
+                    print(f"  注入 {key:<23} {count:>6}")
+                print("  阶段耗时:")
+                for stage, seconds in sorted(stages.items(), key=lambda kv: -kv[1]):
+                    print(f"  {stage:<20} {seconds * 1000:>10.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""实时模式离线基准
+
+用法: python benchmarks/bench_stream.py [--trades 300] [--latency-ms 30] [--resolve-delay 0.2]
+
+启动 stub_api（Data API / Gamma / Telegram / Sheets）和 stub_ws（CLOB market 频道）替身，
+按 polymarket_agent stream 模式的流程订阅所有市场资产，然后：
+1. 推送前一半交易对应的 last_trade_price 事件，测量从推送到完成判定的时间
+2. 断开所有 WebSocket 连接，等待重连并确认资产全部重新订阅
+3. 推送后一半交易，确认重连后的事件同样进入判定流程
+
+需要 websocket-client。
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from io import StringIO
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.join(BENCH_DIR, ".."))
+
+from bench_run_task import configure_env  # noqa: E402
+from stub_api import StubServer, StubState, generate_fixtures  # noqa: E402
+from stub_ws import StubWebSocketServer, trade_event  # noqa: E402
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="实时模式离线基准")
+    parser.add_argument("--trades", type=int, default=300, help="合成数据的交易笔数")
+    parser.add_argument("--wallets", type=int, default=120, help="合成数据的钱包数")
+    parser.add_argument("--latency-ms", type=float, default=30)
+    parser.add_argument("--jitter-ms", type=float, default=10)
+    parser.add_argument("--resolve-delay", type=float, default=0.2, help="STREAM_RESOLVE_DELAY（秒）")
+    parser.add_argument("--timeout", type=float, default=30)
+    return parser.parse_args()
+
+
+def wait_for(condition, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def pump(agent, state, stream, resolver, expected, timeout):
+    """驱动 drain → resolve → process_trades，直到处理了 expected 笔交易，返回 (处理笔数, 警报数)"""
+    processed = alerts = 0
+    deadline = time.monotonic() + timeout
+    while processed < expected and time.monotonic() < deadline:
+        resolver.add(stream.drain(timeout=0.05))
+        trades = resolver.resolve()
+        if trades:
+            processed += len(trades)
+            alerts += len(agent.process_trades(state, trades))
+            state.flush()
+        elif not resolver.pending and not stream.events.qsize():
+            time.sleep(0.01)
+    return processed, alerts
+
+
+def main():
+    args = parse_args()
+    fixtures = generate_fixtures(trades=args.trades, wallets=args.wallets, now=int(time.time()))
+    stub_state = StubState(fixtures, args.latency_ms, args.jitter_ms)
+    with StubServer(stub_state) as stub, StubWebSocketServer() as ws:
+        configure_env(stub.base_url, False)
+        os.environ.update({"CLOB_WS_URL": ws.url, "STREAM_RESOLVE_DELAY": str(args.resolve_delay)})
+        import polymarket_agent as agent
+        if not agent.stream_available():
+            raise SystemExit("需要 websocket-client: pip install websocket-client")
+
+        trades = [t for t in fixtures["trades"] if agent.trade_amount(t) >= agent.MIN_BET_USD]
+        first, second = trades[:len(trades) // 2], trades[len(trades) // 2:]
+
+        with tempfile.TemporaryDirectory(prefix="bench_stream_") as workdir:
+            previous = os.getcwd()
+            os.chdir(workdir)
+            try:
+                with redirect_stdout(StringIO()):
+                    state = agent.MonitorState()
+                    stream = agent.start_trade_stream(state)
+                state.trade_stream = stream
+                resolver = agent.StreamResolver(min_bet=state.rules.min_bet)
+                assets = set(state.market_cache.token_ids())
+                if not wait_for(lambda: ws.subscribed_assets >= assets, args.timeout):
+                    raise SystemExit("订阅超时")
+                print(f"替身: {stub.base_url}  {ws.url}  {len(assets)} 个资产, {stream.stats()['connections']} 个连接")
+
+                stub_state.reset()
+                start = time.perf_counter()
+                for trade in first:
+                    ws.publish(trade_event(trade))
+                with redirect_stdout(StringIO()):
+                    processed, alerts = pump(agent, state, stream, resolver, len(first), args.timeout)
+                elapsed = time.perf_counter() - start
+                print(f"\n=== 推送 {len(first)} 个事件: {elapsed:.3f}s 内判定 {processed} 笔, {alerts} 条警报, "
+                      f"{sum(stub_state.counts.values())} 个请求 ===")
+                for key, count in sorted(stub_state.counts.items()):
+                    print(f"  {key:<28} {count:>6}")
+
+                connections_before = ws.connections_total
+                start = time.perf_counter()
+                ws.drop_connections()
+                resubscribed = wait_for(lambda: ws.connections_total > connections_before
+                                        and ws.subscribed_assets >= assets, args.timeout)
+                print(f"\n=== 断线重连: {'重新订阅完成' if resubscribed else '超时'} "
+                      f"{time.perf_counter() - start:.3f}s ===")
+
+                for trade in second:
+                    ws.publish(trade_event(trade))
+                with redirect_stdout(StringIO()):
+                    processed, alerts = pump(agent, state, stream, resolver, len(second), args.timeout)
+                print(f"=== 重连后推送 {len(second)} 个事件: 判定 {processed} 笔, {alerts} 条警报 ===")
+                print(f"\n实时流统计: {stream.stats()}")
+                with redirect_stdout(StringIO()):
+                    stream.close()
+                    state.close()
+            finally:
+                os.chdir(previous)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,334 @@
+"""Polymarket Data API / Gamma API / Telegram / Google Sheets 的本地替身
+
+用于离线基准测试：从 fixtures 回放 /trades、/activity、/events、/markets 响应，
+Telegram 和 Sheets 只记录请求；可配置注入的延迟和错误率，并统计每个接口的请求数。
+
+fixtures 目录结构（均为 JSON）：
+    trades.json      /trades 响应（按时间倒序的交易列表）
+    activity.json    {钱包地址: 活动记录列表 或 {"count", "first", "last", "name"} 摘要}
+    events.json      Gamma /events 响应（事件列表，内含 markets）
+
+可以用 record_fixtures() 从线上录制，也可以用 generate_fixtures() 生成确定性的合成数据。
+
+单独运行：python benchmarks/stub_api.py [--fixtures DIR] [--port 8765] [--latency-ms 50]
+"""
+import argparse
+import json
+import os
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+HOUR = 3600
+DAY = 24 * HOUR
+
+# 合成市场标题（覆盖各类别）；替身不导入 polymarket_agent，以免在设置环境变量前加载配置
+TITLES = [
+    "Will Donald Trump win the 2028 US Presidential Election?",
+    "NYC Mayoral Election: Zohran Mamdani vs Andrew Cuomo",
+    "Fed decision in December?",
+    "Russia x Ukraine ceasefire in 2026?",
+    "Senate control after the 2026 midterms",
+    "Bitcoin above $120,000 on December 31?",
+    "Will Ethereum hit $5,000 in January?",
+    "Solana ETF approved by SEC in 2026?",
+    "Lakers vs. Celtics",
+    "Super Bowl Champion 2027",
+    "Will Real Madrid win the Champions League?",
+    "S&P 500 closes above 7000 this year?",
+    "Will NVIDIA be the largest company by market cap on June 30?",
+    "US recession in 2026?",
+    "Will Taylor Swift release a new album in 2026?",
+    "Highest grossing movie of 2026?",
+]
+
+
+def generate_fixtures(trades=300, wallets=120, new_wallet_ratio=0.2, seed=7, now=None):
+    """生成确定性的合成 fixtures：一部分新钱包（活动少、刚创建），其余为老钱包"""
+    rng = random.Random(seed)
+    now = int(now or time.time())
+    wallet_ids = [f"0x{rng.getrandbits(160):040x}" for _ in range(wallets)]
+    activity = {}
+    for i, wallet in enumerate(wallet_ids):
+        if rng.random() < new_wallet_ratio:
+            count = rng.randint(1, 8)
+            first = now - rng.randint(1, 9) * DAY
+        else:
+            count = rng.choice([15, 60, 300, 1200, 4000])
+            first = now - rng.randint(30, 900) * DAY
+        activity[wallet] = {"count": count, "first": first, "last": now - rng.randint(0, 6) * HOUR,
+                            "name": f"trader{i}"}
+
+    markets = []
+    events = []
+    for i, title in enumerate(TITLES):
+        condition_id = f"0x{i:064x}"
+        tokens = [str(rng.getrandbits(64)), str(rng.getrandbits(64))]
+        markets.append((condition_id, title, tokens))
+        events.append({
+            "id": str(1000 + i),
+            "slug": f"event-{i}",
+            "tags": [],
+            "markets": [{
+                "conditionId": condition_id,
+                "slug": f"market-{i}",
+                "question": title,
+                "endDate": "2026-12-31T00:00:00Z",
+                "liquidityNum": rng.randint(1_000, 2_000_000),
+                "volumeNum": rng.randint(10_000, 50_000_000),
+                "clobTokenIds": json.dumps(tokens),
+            }],
+        })
+
+    trade_list = []
+    ts = now
+    for i in range(trades):
+        ts -= rng.randint(1, 40)
+        wallet = rng.choice(wallet_ids)
+        market_index = rng.randrange(len(markets))
+        condition_id, title, tokens = markets[market_index]
+        price = round(rng.uniform(0.02, 0.98), 3)
+        cash = round(rng.uniform(3000, 80000), 2)
+        trade_list.append({
+            "proxyWallet": wallet,
+            "side": rng.choice(["BUY", "SELL"]),
+            "conditionId": condition_id,
+            "asset": rng.choice(tokens),
+            "slug": f"market-{market_index}",
+            "title": title,
+            "outcome": rng.choice(["Yes", "No", "Trump", "Over"]),
+            "price": price,
+            "size": round(cash / price, 2),
+            "usdcSize": cash,
+            "timestamp": ts,
+            "transactionHash": f"0x{rng.getrandbits(256):064x}",
+        })
+    return {"trades": trade_list, "activity": activity, "events": events}
+
+
+def load_fixtures(directory):
+    fixtures = {}
+    for name in ("trades", "activity", "events"):
+        path = os.path.join(directory, f"{name}.json")
+        with open(path, "r", encoding="utf-8") as f:
+            fixtures[name] = json.load(f)
+    return fixtures
+
+
+def save_fixtures(fixtures, directory):
+    os.makedirs(directory, exist_ok=True)
+    for name, data in fixtures.items():
+        with open(os.path.join(directory, f"{name}.json"), "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+
+
+def record_fixtures(directory, trade_limit=500, min_bet=3000, activity_limit=500):
+    """从线上录制 fixtures（需要网络）：最近的大额交易、相关钱包的活动记录和未关闭事件"""
+    import requests
+
+    trades = requests.get("https://data-api.polymarket.com/trades", timeout=30, params={
+        "limit": trade_limit, "filterType": "CASH", "filterAmount": min_bet, "takerOnly": "true"}).json()
+    activity = {}
+    for wallet in sorted({t["proxyWallet"] for t in trades if t.get("proxyWallet")}):
+        activity[wallet] = requests.get("https://data-api.polymarket.com/activity", timeout=30,
+                                        params={"user": wallet, "limit": activity_limit}).json()
+    events = requests.get("https://gamma-api.polymarket.com/events", timeout=60,
+                          params={"closed": "false", "limit": 500}).json()
+    save_fixtures({"trades": trades, "activity": activity, "events": events}, directory)
+
+
+def _synthesize_activity(summary, offset, limit, ascending):
+    """按摘要生成第 offset 起的 limit 条活动记录（时间在 first 和 last 之间均匀分布）"""
+    count = summary["count"]
+    step = (summary["last"] - summary["first"]) / max(1, count - 1)
+    records = []
+    for i in range(offset, min(count, offset + limit)):
+        index = i if ascending else count - 1 - i
+        records.append({"timestamp": int(summary["first"] + index * step), "type": "TRADE",
+                        "name": summary.get("name", "")})
+    return records
+
+
+class StubState:
+    """替身服务器的配置和统计"""
+
+    def __init__(self, fixtures, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, rate_limit_rate=0.0, seed=1):
+        self.fixtures = fixtures
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.counts = Counter()
+        self.injected = Counter()
+        self.telegram_messages = []
+        self.sheet_rows = []
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._markets = {m["conditionId"]: dict(m, events=[{k: v for k, v in e.items() if k != "markets"}])
+                         for e in fixtures.get("events", []) for m in e.get("markets", [])}
+
+    def reset(self):
+        with self._lock:
+            self.counts.clear()
+            self.injected.clear()
+            self.telegram_messages.clear()
+            self.sheet_rows.clear()
+
+    def draw(self):
+        """返回 (延迟秒数, 注入的状态码或 None)"""
+        with self._lock:
+            delay = max(0.0, self.latency_ms + self._rng.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+            roll = self._rng.random()
+        if roll < self.rate_limit_rate:
+            return delay, 429
+        if roll < self.rate_limit_rate + self.error_rate:
+            return delay, 502
+        return delay, None
+
+    def count(self, key, injected=None):
+        with self._lock:
+            self.counts[key] += 1
+            if injected:
+                self.injected[f"{key} {injected}"] += 1
+
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True  # 头和正文分两次写出，避免 keep-alive 下的延迟确认等待
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status, payload, headers=None):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _inject(self, key):
+            delay, status = state.draw()
+            time.sleep(delay)
+            state.count(key, status)
+            if status == 429:
+                self._send(429, {"ok": False, "parameters": {"retry_after": 1}}, {"Retry-After": "1"})
+                return True
+            if status:
+                self._send(status, {"error": "injected"})
+                return True
+            return False
+
+        def do_GET(self):
+            parsed = urlparse(self.path)
+            query = parse_qs(parsed.query)
+            first = {k: v[0] for k, v in query.items()}
+            path = parsed.path
+            if self._inject(f"GET {path}"):
+                return
+            limit = int(first.get("limit", 100))
+            offset = int(first.get("offset", 0))
+            if path in ("/activity", "/trades") and "user" in first:
+                data = state.fixtures["activity"].get(first["user"], [])
+                ascending = first.get("sortDirection", "").upper() == "ASC"
+                if isinstance(data, dict):
+                    self._send(200, _synthesize_activity(data, offset, limit, ascending))
+                else:
+                    records = list(reversed(data)) if ascending else data
+                    self._send(200, records[offset:offset + limit])
+            elif path == "/trades":
+                trades = state.fixtures["trades"]
+                if "market" in first:
+                    wanted = set(first["market"].split(","))
+                    trades = [t for t in trades if t.get("conditionId") in wanted]
+                if first.get("filterType") == "CASH" and "filterAmount" in first:
+                    min_cash = float(first["filterAmount"])
+                    trades = [t for t in trades if float(t.get("usdcSize") or t["size"] * t["price"]) >= min_cash]
+                self._send(200, trades[offset:offset + limit])
+            elif path == "/events":
+                events = state.fixtures.get("events", [])
+                if first.get("order") == "id":
+                    events = sorted(events, key=lambda e: int(e.get("id") or 0),
+                                    reverse=first.get("ascending") != "true")
+                self._send(200, events[offset:offset + limit])
+            elif path == "/markets":
+                ids = query.get("condition_ids", [])
+                self._send(200, [state._markets[c] for c in ids if c in state._markets])
+            else:
+                self._send(404, {"error": "not found"})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            path = urlparse(self.path).path
+            key = "POST /telegram" if path.endswith("/sendMessage") else f"POST {path}"
+            if self._inject(key):
+                return
+            if key == "POST /telegram":
+                with state._lock:
+                    state.telegram_messages.append(payload.get("text", ""))
+                self._send(200, {"ok": True, "result": {}})
+            elif path == "/sheets":
+                rows = payload.get("rows", [payload])
+                with state._lock:
+                    state.sheet_rows.extend(rows)
+                self._send(200, {"status": "success", "count": len(rows)})
+            else:
+                self._send(404, {"error": "not found"})
+
+    return Handler
+
+
+class StubServer:
+    """在后台线程运行替身服务器；base_url 可直接用作 DATA_API_URL / GAMMA_API_URL 等"""
+
+    def __init__(self, state, host="127.0.0.1", port=0):
+        self.state = state
+        self.httpd = ThreadingHTTPServer((host, port), make_handler(state))
+        self.httpd.daemon_threads = True
+        self.base_url = f"http://{host}:{self.httpd.server_address[1]}"
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="stub-api", daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Polymarket API 本地替身")
+    parser.add_argument("--fixtures", help="fixtures 目录，不指定则使用合成数据")
+    parser.add_argument("--record", metavar="DIR", help="从线上录制 fixtures 到 DIR 后退出")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0)
+    args = parser.parse_args()
+
+    if args.record:
+        record_fixtures(args.record)
+        print(f"已录制到 {args.record}")
+        return
+    fixtures = load_fixtures(args.fixtures) if args.fixtures else generate_fixtures()
+    state = StubState(fixtures, args.latency_ms, args.jitter_ms, args.error_rate, args.rate_limit_rate)
+    with StubServer(state, port=args.port) as server:
+        print(f"替身服务器运行在 {server.base_url}，Ctrl+C 退出")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
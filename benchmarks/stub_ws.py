@@ -0,0 +1,193 @@
+"""CLOB WebSocket market 频道的本地替身
+
+只依赖标准库的最小 RFC 6455 服务器：完成握手、解码客户端（带掩码）的文本帧、
+响应 "PING"，并记录每个连接的订阅。publish() 把 last_trade_price 事件推送给
+订阅了对应资产的连接；drop_connections() 直接断开所有连接，用于验证重连和重新订阅。
+
+    with StubWebSocketServer() as ws:
+        os.environ["CLOB_WS_URL"] = ws.url
+        ...
+        ws.publish(trade_event(trade))
+"""
+import base64
+import hashlib
+import json
+import socket
+import struct
+import threading
+
+_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+def trade_event(trade):
+    """把 Data API /trades 格式的交易转换为 market 频道的 last_trade_price 事件"""
+    return {
+        "event_type": "last_trade_price",
+        "asset_id": trade.get("asset"),
+        "market": trade.get("conditionId"),
+        "price": str(trade.get("price")),
+        "size": str(trade.get("size")),
+        "side": trade.get("side"),
+        "fee_rate_bps": "0",
+        "timestamp": str(int(trade.get("timestamp") or 0) * 1000),
+    }
+
+
+def _recv_exact(sock, n):
+    data = b""
+    while len(data) < n:
+        chunk = sock.recv(n - len(data))
+        if not chunk:
+            raise ConnectionError("closed")
+        data += chunk
+    return data
+
+
+def _frame(payload, opcode=0x1):
+    header = bytes([0x80 | opcode])
+    length = len(payload)
+    if length < 126:
+        header += bytes([length])
+    elif length < 1 << 16:
+        header += bytes([126]) + struct.pack("!H", length)
+    else:
+        header += bytes([127]) + struct.pack("!Q", length)
+    return header + payload
+
+
+class _Client:
+    def __init__(self, sock):
+        self.sock = sock
+        self.assets = set()
+        self.lock = threading.Lock()
+
+    def send_text(self, text):
+        with self.lock:
+            self.sock.sendall(_frame(text.encode("utf-8")))
+
+    def read_message(self):
+        """返回 (opcode, payload)；只处理不分片的帧"""
+        first, second = _recv_exact(self.sock, 2)
+        opcode = first & 0x0F
+        length = second & 0x7F
+        if length == 126:
+            length = struct.unpack("!H", _recv_exact(self.sock, 2))[0]
+        elif length == 127:
+            length = struct.unpack("!Q", _recv_exact(self.sock, 8))[0]
+        mask = _recv_exact(self.sock, 4) if second & 0x80 else None
+        payload = _recv_exact(self.sock, length)
+        if mask:
+            payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+        return opcode, payload
+
+
+class StubWebSocketServer:
+    """在后台线程运行的 market 频道替身；url 可直接用作 CLOB_WS_URL"""
+
+    def __init__(self, host="127.0.0.1", port=0):
+        self._listener = socket.create_server((host, port))
+        self.url = f"ws://{host}:{self._listener.getsockname()[1]}/ws/market"
+        self.subscriptions = []  # 收到的订阅消息（按顺序）
+        self.connections_total = 0
+        self._clients = []
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._accept_loop, name="stub-ws", daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stopped.set()
+        self._listener.close()
+        self.drop_connections()
+
+    @property
+    def subscribed_assets(self):
+        with self._lock:
+            return set().union(*(c.assets for c in self._clients)) if self._clients else set()
+
+    def publish(self, event):
+        """推送事件给订阅了该资产的连接，返回收到的连接数"""
+        text = json.dumps([event])
+        with self._lock:
+            targets = [c for c in self._clients if event.get("asset_id") in c.assets]
+        for client in targets:
+            try:
+                client.send_text(text)
+            except OSError:
+                pass
+        return len(targets)
+
+    def drop_connections(self):
+        with self._lock:
+            clients, self._clients = self._clients, []
+        for client in clients:
+            try:
+                client.sock.shutdown(socket.SHUT_RDWR)
+                client.sock.close()
+            except OSError:
+                pass
+
+    def _accept_loop(self):
+        while not self._stopped.is_set():
+            try:
+                sock, _ = self._listener.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(sock,), daemon=True).start()
+
+    def _handshake(self, sock):
+        request = b""
+        while b"\r\n\r\n" not in request:
+            chunk = sock.recv(4096)
+            if not chunk:
+                raise ConnectionError("closed during handshake")
+            request += chunk
+        headers = {}
+        for line in request.decode("latin-1").split("\r\n")[1:]:
+            if ":" in line:
+                key, value = line.split(":", 1)
+                headers[key.strip().lower()] = value.strip()
+        accept = base64.b64encode(hashlib.sha1((headers["sec-websocket-key"] + _GUID).encode()).digest())
+        sock.sendall(b"HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                     b"Sec-WebSocket-Accept: " + accept + b"\r\n\r\n")
+
+    def _serve(self, sock):
+        client = _Client(sock)
+        try:
+            self._handshake(sock)
+            with self._lock:
+                self._clients.append(client)
+                self.connections_total += 1
+            while True:
+                opcode, payload = client.read_message()
+                if opcode == 0x8:  # close
+                    with client.lock:
+                        sock.sendall(_frame(b"", 0x8))
+                    return
+                if opcode == 0x9:  # ping 帧
+                    with client.lock:
+                        sock.sendall(_frame(payload, 0xA))
+                    continue
+                if opcode != 0x1:
+                    continue
+                text = payload.decode("utf-8")
+                if text == "PING":
+                    client.send_text("PONG")
+                    continue
+                message = json.loads(text)
+                with self._lock:
+                    self.subscriptions.append(message)
+                    client.assets.update(message.get("assets_ids") or [])
+        except (OSError, ConnectionError, ValueError, KeyError):
+            pass
+        finally:
+            with self._lock:
+                if client in self._clients:
+                    self._clients.remove(client)
+            try:
+                sock.close()
+            except OSError:
+                pass
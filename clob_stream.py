@@ -0,0 +1,279 @@
+"""CLOB WebSocket market 频道实时成交流
+
+订阅 Polymarket CLOB 的 market 频道，从 last_trade_price 事件中筛出成交额
+（price * size）达到阈值的成交，放入有界队列，由扫描线程补齐钱包信息后走原有判定流程。
+
+- 资产（token id）较多时拆分到多个连接，每个连接最多 assets_per_connection 个
+- 资产列表更新时补充订阅新增的资产、退订不再列出的资产（已关闭的市场）；
+  大部分资产已退订的连接关闭，剩余资产并入其他连接
+- 断线后按带抖动的指数退避重连，并重新发送完整订阅
+- 按协议每 ping_interval 秒发送一次 "PING" 保活
+- 队列满时丢弃新事件并设置 overflowed 标记，由消费方改用 /trades 轮询补齐，不会漏单
+
+依赖 websocket-client（可选，创建 ClobTradeStream 时才导入）；未安装时 stream_available() 返回 False。
+market 频道的成交事件不含钱包地址，因此这里只负责发现大额成交所在的市场。
+"""
+import importlib.util
+import json
+import queue
+import random
+import threading
+import time
+
+websocket = None
+
+
+def stream_available():
+    return importlib.util.find_spec("websocket") is not None
+
+
+def _load_websocket():
+    global websocket
+    if websocket is None:
+        import websocket as module
+        websocket = module
+
+
+def parse_trade_events(message, min_cash):
+    """解析一条 market 频道消息，返回成交额达到 min_cash 的成交列表
+
+    消息可以是单个事件或事件列表；只处理 event_type 为 last_trade_price 的事件。
+    """
+    try:
+        payload = json.loads(message)
+    except ValueError:
+        return []
+    events = payload if isinstance(payload, list) else [payload]
+    trades = []
+    for event in events:
+        if not isinstance(event, dict) or event.get("event_type") != "last_trade_price":
+            continue
+        try:
+            price = float(event.get("price") or 0)
+            size = float(event.get("size") or 0)
+            ts = float(event.get("timestamp") or 0)
+        except (TypeError, ValueError):
+            continue
+        cash = price * size
+        if cash < min_cash:
+            continue
+        trades.append({
+            "asset_id": event.get("asset_id"),
+            "condition_id": event.get("market"),
+            "price": price,
+            "size": size,
+            "side": event.get("side"),
+            "cash": cash,
+            "timestamp": ts / 1000 if ts > 1e10 else ts,
+        })
+    return trades
+
+
+class _Connection:
+    """单个 WebSocket 连接：负责一组资产的订阅、收包、保活和重连"""
+
+    def __init__(self, stream, index):
+        self.stream = stream
+        self.index = index
+        self.assets = set()
+        self._added = set()
+        self._removed = set()
+        self._lock = threading.Lock()
+        self._ws = None
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"clob-ws-{index}", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def add_assets(self, asset_ids):
+        with self._lock:
+            new = set(asset_ids) - self.assets
+            self.assets |= new
+            self._added |= new
+            self._removed -= new
+
+    def remove_assets(self, asset_ids):
+        with self._lock:
+            gone = self.assets & set(asset_ids)
+            self.assets -= gone
+            self._added -= gone
+            self._removed |= gone
+
+    def _running(self):
+        return not (self.stream.stopped.is_set() or self._stopped.is_set())
+
+    def close(self):
+        self._stopped.set()
+        ws = self._ws
+        if ws is not None:
+            try:
+                ws.close()
+            except Exception:
+                pass
+        if self._thread.is_alive():
+            self._thread.join(5)
+
+    def _subscribe(self, ws, full):
+        with self._lock:
+            if full:
+                assets, self._added, self._removed = sorted(self.assets), set(), set()
+                message = {"assets_ids": assets, "type": "market"}
+            else:
+                assets, self._added = sorted(self._added), set()
+                message = {"assets_ids": assets, "operation": "subscribe"}
+        if assets:
+            ws.send(json.dumps(message))
+
+    def _unsubscribe(self, ws):
+        with self._lock:
+            assets, self._removed = sorted(self._removed), set()
+        if assets:
+            ws.send(json.dumps({"assets_ids": assets, "operation": "unsubscribe"}))
+
+    def _run(self):
+        stream = self.stream
+        attempt = 0
+        while self._running():
+            try:
+                ws = websocket.create_connection(stream.url, timeout=stream.connect_timeout)
+                self._ws = ws
+                ws.settimeout(1.0)
+                self._subscribe(ws, full=True)
+                if attempt:
+                    stream.count("reconnects")
+                attempt = 0
+                last_ping = time.monotonic()
+                while self._running():
+                    if self._added:
+                        self._subscribe(ws, full=False)
+                    if self._removed:
+                        self._unsubscribe(ws)
+                    now = time.monotonic()
+                    if now - last_ping >= stream.ping_interval:
+                        ws.send("PING")
+                        last_ping = now
+                    try:
+                        message = ws.recv()
+                    except websocket.WebSocketTimeoutException:
+                        continue
+                    if not message:
+                        raise websocket.WebSocketConnectionClosedException("empty frame")
+                    if message == "PONG":
+                        continue
+                    stream.handle_message(message)
+            except Exception as e:
+                if not self._running():
+                    break
+                stream.count("errors")
+                delay = random.uniform(0, min(stream.backoff_max, stream.backoff_base * (2 ** attempt)))
+                attempt += 1
+                print(f"⚠️ CLOB WebSocket 连接 {self.index} 断开: {e}，{delay:.1f}s 后重连")
+                self._stopped.wait(delay)
+            finally:
+                ws, self._ws = self._ws, None
+                if ws is not None:
+                    try:
+                        ws.close()
+                    except Exception:
+                        pass
+
+
+class ClobTradeStream:
+    """订阅 market 频道并产出大额成交事件（线程安全）"""
+
+    def __init__(self, url, min_cash, queue_size=10000, assets_per_connection=500,
+                 ping_interval=10, connect_timeout=10, backoff_base=1.0, backoff_max=60.0):
+        _load_websocket()
+        self.url = url
+        self.min_cash = min_cash
+        self.assets_per_connection = max(1, assets_per_connection)
+        self.ping_interval = ping_interval
+        self.connect_timeout = connect_timeout
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.events = queue.Queue(maxsize=queue_size)
+        self.overflowed = threading.Event()
+        self.stopped = threading.Event()
+        self.counters = {"messages": 0, "qualified": 0, "dropped": 0, "reconnects": 0, "errors": 0,
+                         "unsubscribed": 0, "retired": 0}
+        self._counter_lock = threading.Lock()
+        self._connections = []
+        self._next_index = 0
+        self._assets = set()
+
+    def count(self, name, value=1):
+        with self._counter_lock:
+            self.counters[name] += value
+
+    def handle_message(self, message):
+        self.count("messages")
+        for trade in parse_trade_events(message, self.min_cash):
+            try:
+                self.events.put_nowait(trade)
+                self.count("qualified")
+            except queue.Full:
+                # 消费跟不上：丢弃并通知消费方用 /trades 轮询补齐
+                self.count("dropped")
+                self.overflowed.set()
+
+    def set_assets(self, asset_ids):
+        """订阅资产列表：新增的资产补充订阅到已有连接或新连接，不再列出的资产退订
+
+        退订后剩余资产不到 assets_per_connection 的四分之一、且连接数多于所需的连接关闭，
+        剩余资产和新增资产一起重新分配。
+        """
+        wanted = [a for a in dict.fromkeys(asset_ids) if a]
+        removed = self._assets.difference(wanted)
+        if removed:
+            for connection in self._connections:
+                connection.remove_assets(removed)
+            self._assets -= removed
+            self.count("unsubscribed", len(removed))
+        needed = -(-len(wanted) // self.assets_per_connection)
+        for connection in sorted(self._connections, key=lambda c: len(c.assets)):
+            if connection.assets and (len(self._connections) <= needed
+                                      or len(connection.assets) > self.assets_per_connection // 4):
+                break
+            self._connections.remove(connection)
+            connection.close()
+            self._assets -= connection.assets
+            self.count("retired")
+
+        new = [a for a in wanted if a not in self._assets]
+        self._assets.update(new)
+        for connection in self._connections:
+            room = self.assets_per_connection - len(connection.assets)
+            if room > 0 and new:
+                connection.add_assets(new[:room])
+                new = new[room:]
+        while new:
+            connection = _Connection(self, self._next_index)
+            self._next_index += 1
+            connection.add_assets(new[:self.assets_per_connection])
+            new = new[self.assets_per_connection:]
+            self._connections.append(connection)
+            connection.start()
+
+    def drain(self, timeout, max_items=1000):
+        """等待最多 timeout 秒，取出已到达的事件（最多 max_items 条）"""
+        items = []
+        try:
+            items.append(self.events.get(timeout=timeout))
+            while len(items) < max_items:
+                items.append(self.events.get_nowait())
+        except queue.Empty:
+            pass
+        return items
+
+    def stats(self):
+        with self._counter_lock:
+            stats = dict(self.counters)
+        stats.update({"connections": len(self._connections), "assets": len(self._assets),
+                      "queued": self.events.qsize()})
+        return stats
+
+    def close(self):
+        self.stopped.set()
+        for connection in self._connections:
+            connection.close()
@@ -0,0 +1,378 @@
+"""按日期和类别分区的 Parquet 警报历史
+
+目录结构（Hive 分区，可直接用 pyarrow.dataset / DuckDB / pandas 读取）：
+
+    alert_history/date=2026-10-17/category=政治/part-20261017T120000-1a2b3c4d.parquet
+
+- 每次运行把本轮警报按分区各写一个 part 文件，不改写已有文件
+- compact() 把同一分区的多个 part 文件合并为一个，避免小文件越积越多
+- query() 先按 date / category 目录裁剪分区，再只读取需要的列
+- 时间戳无法解析的行不写入（不能确定所属的日期分区），计入 skipped
+
+合并时先写临时文件和清单 _compacting-*.json（记录合并文件名和被替换的 part 文件），
+再把临时文件改名为合并文件、删除旧 part 文件、最后删除清单。中途崩溃时：合并文件已存在，
+读取时忽略清单中的旧 part 文件，下次 compact() 补完删除；合并文件不存在则清单作废。
+
+依赖 pyarrow（可选）；未安装时 parquet_available() 返回 False，调用方应跳过。
+pyarrow 导入较慢，只在第一次真正读写 Parquet 时才导入，不影响没有警报的扫描的启动时间。
+
+命令行：
+    python polymarket_agent.py history query [--wallet 0x..] [--market 关键词] [--category 政治]
+                                             [--since 2026-10-01] [--until 2026-10-17] [--columns a,b] [--limit 50]
+    python polymarket_agent.py history compact [--min-files 2]
+    python polymarket_agent.py history import insider_alerts_history.csv
+"""
+import argparse
+import csv
+import importlib.util
+import json
+import os
+import sys
+import uuid
+from datetime import datetime, timezone
+
+pa = pc = ds = pq = None
+
+DEFAULT_COLUMNS = ["timestamp", "user_address", "user_name", "bet_size_usdc", "side", "price_percent",
+                   "market", "category", "account_age_days", "trade_count", "transaction_hash"]
+
+
+def parquet_available():
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def _load_pyarrow():
+    global pa, pc, ds, pq
+    if pa is None:
+        import pyarrow
+        import pyarrow.compute
+        import pyarrow.dataset
+        import pyarrow.parquet
+        pa, pc, ds, pq = pyarrow, pyarrow.compute, pyarrow.dataset, pyarrow.parquet
+
+
+def _schema():
+    """文件内的列（date 和 category 只作为分区目录，不重复写入文件）"""
+    return pa.schema([
+        ("timestamp", pa.timestamp("us", tz="UTC")),
+        ("user_address", pa.string()),
+        ("user_name", pa.string()),
+        ("bet_size_usdc", pa.float64()),
+        ("outcome", pa.string()),
+        ("side", pa.string()),
+        ("price_percent", pa.float64()),
+        ("market_type", pa.string()),
+        ("market", pa.string()),
+        ("account_age_days", pa.int64()),
+        ("trade_count", pa.int64()),
+        ("transaction_hash", pa.string()),
+        ("trade_id", pa.string()),
+        ("market_end_date", pa.string()),
+        ("market_liquidity", pa.float64()),
+        ("market_volume", pa.float64()),
+        ("market_tags", pa.string()),
+        ("rules", pa.string()),
+        ("wallet_volume_24h", pa.float64()),
+        ("wallet_volume_7d", pa.float64()),
+        ("wallet_markets", pa.int64()),
+        ("wallet_largest_bet", pa.float64()),
+    ])
+
+
+def _conform(table):
+    """把旧文件（缺少后来新增的列）补齐为当前 schema，缺的列填空值"""
+    schema = _schema()
+    columns = [table.column(f.name) if f.name in table.column_names else pa.nulls(len(table), f.type)
+               for f in schema]
+    return pa.Table.from_arrays(columns, schema=pa.schema([
+        pa.field(f.name, table.schema.field(f.name).type if f.name in table.column_names else f.type)
+        for f in schema
+    ])).cast(schema)
+
+
+def _partitioning():
+    return ds.partitioning(pa.schema([("date", pa.string()), ("category", pa.string())]), flavor="hive")
+
+
+def _to_float(value):
+    try:
+        return float(value) if value not in (None, "") else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_int(value):
+    value = _to_float(value)
+    return int(value) if value is not None else None
+
+
+def _to_datetime(value):
+    """解析 ISO 时间，无法解析时返回 None"""
+    if isinstance(value, datetime):
+        dt = value
+    else:
+        try:
+            dt = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+def normalize_row(row):
+    """把 CSV 格式的警报行（"未知" 等占位文本）转换为带类型的记录，返回 (date, category, record)
+
+    时间戳无法解析时返回 None。
+    """
+    ts = _to_datetime(row.get("timestamp"))
+    if ts is None:
+        return None
+    record = {
+        "timestamp": ts,
+        "user_address": (row.get("user_address") or "").lower(),
+        "user_name": row.get("user_name") or "",
+        "bet_size_usdc": _to_float(row.get("bet_size_usdc")),
+        "outcome": row.get("outcome") or "",
+        "side": row.get("side") or "",
+        "price_percent": _to_float(row.get("price_percent")),
+        "market_type": row.get("market_type") or "",
+        "market": row.get("market") or "",
+        "account_age_days": _to_int(row.get("account_age_days")),
+        "trade_count": _to_int(row.get("trade_count")),
+        "transaction_hash": row.get("transaction_hash") or "",
+        "trade_id": row.get("trade_id") or "",
+        "market_end_date": row.get("market_end_date") or "",
+        "market_liquidity": _to_float(row.get("market_liquidity")),
+        "market_volume": _to_float(row.get("market_volume")),
+        "market_tags": row.get("market_tags") or "",
+        "rules": row.get("rules") or "",
+        "wallet_volume_24h": _to_float(row.get("wallet_volume_24h")),
+        "wallet_volume_7d": _to_float(row.get("wallet_volume_7d")),
+        "wallet_markets": _to_int(row.get("wallet_markets")),
+        "wallet_largest_bet": _to_float(row.get("wallet_largest_bet")),
+    }
+    category = (row.get("category") or "其他").replace("/", "_")
+    return ts.strftime("%Y-%m-%d"), category, record
+
+
+class ParquetHistory:
+    """分区 Parquet 警报历史：add() 缓存本轮警报，flush() 按分区各写一个文件"""
+
+    def __init__(self, root="alert_history", compact_min_files=24):
+        self.root = root
+        self.compact_min_files = compact_min_files
+        self.skipped = 0
+        self._pending = {}
+
+    def _partition_dir(self, date, category):
+        return os.path.join(self.root, f"date={date}", f"category={category}")
+
+    def add(self, row):
+        """缓存一行警报，时间戳无法解析时跳过并返回 False"""
+        normalized = normalize_row(row)
+        if normalized is None:
+            self.skipped += 1
+            print(f"⚠️ 警报历史: 时间戳无法解析，跳过 ({row.get('timestamp')!r}, {row.get('trade_id') or row.get('transaction_hash') or ''})")
+            return False
+        date, category, record = normalized
+        self._pending.setdefault((date, category), []).append(record)
+        return True
+
+    def flush(self):
+        """写出缓存的警报，返回写入的行数"""
+        pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        _load_pyarrow()
+        written = 0
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+        for (date, category), records in pending.items():
+            directory = self._partition_dir(date, category)
+            os.makedirs(directory, exist_ok=True)
+            table = pa.Table.from_pylist(records, schema=_schema())
+            path = os.path.join(directory, f"part-{stamp}-{uuid.uuid4().hex[:8]}.parquet")
+            tmp_path = os.path.join(directory, f"_tmp-{os.path.basename(path)}")
+            pq.write_table(table, tmp_path, compression="zstd")
+            os.replace(tmp_path, path)
+            written += len(records)
+        return written
+
+    @staticmethod
+    def _manifests(directory, names):
+        """分区内未完成的合并清单，返回 [(清单路径, 合并文件名, 被替换的文件名集合)]"""
+        manifests = []
+        for name in names:
+            if name.startswith("_compacting-") and name.endswith(".json"):
+                path = os.path.join(directory, name)
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        data = json.load(f)
+                    manifests.append((path, data["output"], set(data["replaces"])))
+                except (OSError, ValueError, KeyError):
+                    continue
+        return manifests
+
+    def partitions(self, since=None, until=None, category=None):
+        """返回 [(分区目录, [part 文件...])]，可按日期范围和类别只列出匹配的分区
+
+        合并文件已经写好、但旧 part 文件还没删完的分区，不列出这些旧文件。
+        """
+        result = []
+        if not os.path.isdir(self.root):
+            return result
+        for date_dir in sorted(os.listdir(self.root)):
+            date_path = os.path.join(self.root, date_dir)
+            if not date_dir.startswith("date=") or not os.path.isdir(date_path):
+                continue
+            date = date_dir[len("date="):]
+            if (since and date < since) or (until and date > until):
+                continue
+            for category_dir in sorted(os.listdir(date_path)):
+                directory = os.path.join(date_path, category_dir)
+                if not category_dir.startswith("category=") or not os.path.isdir(directory):
+                    continue
+                if category and category_dir[len("category="):] != category:
+                    continue
+                names = os.listdir(directory)
+                superseded = set()
+                for _, output, replaces in self._manifests(directory, names):
+                    if output in names:
+                        superseded |= replaces
+                files = sorted(f for f in names if f.endswith(".parquet") and not f.startswith(("_", "."))
+                               and f not in superseded)
+                result.append((directory, [os.path.join(directory, f) for f in files]))
+        return result
+
+    def _recover(self, directory):
+        """完成中途中断的合并：合并文件已存在时删除剩下的旧文件，否则丢弃清单和临时文件"""
+        names = os.listdir(directory)
+        for path, output, replaces in self._manifests(directory, names):
+            if output in names:
+                for name in replaces & set(names):
+                    os.remove(os.path.join(directory, name))
+            tmp_path = os.path.join(directory, f"_tmp-{output}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            os.remove(path)
+
+    def compact(self, min_files=None):
+        """把文件数达到 min_files 的分区合并为一个按时间排序的文件，返回合并的分区数"""
+        min_files = max(2, min_files or self.compact_min_files)
+        compacted = 0
+        for directory, _ in self.partitions():
+            self._recover(directory)
+        for directory, files in self.partitions():
+            if len(files) < min_files:
+                continue
+            _load_pyarrow()
+            table = pa.concat_tables([_conform(pq.ParquetFile(f).read()) for f in files])
+            table = table.sort_by("timestamp")
+            stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+            name = f"compacted-{stamp}-{uuid.uuid4().hex[:8]}.parquet"
+            tmp_path = os.path.join(directory, f"_tmp-{name}")
+            pq.write_table(table, tmp_path, compression="zstd")
+            # 先写清单再改名：合并文件一出现，读取方就能知道哪些旧文件已被它替换
+            manifest = os.path.join(directory, f"_compacting-{name[:-len('.parquet')]}.json")
+            with open(f"{manifest}.tmp", "w", encoding="utf-8") as f:
+                json.dump({"output": name, "replaces": [os.path.basename(p) for p in files]}, f)
+            os.replace(f"{manifest}.tmp", manifest)
+            os.replace(tmp_path, os.path.join(directory, name))
+            for f in files:
+                os.remove(f)
+            os.remove(manifest)
+            compacted += 1
+        return compacted
+
+    def query(self, wallet=None, market=None, category=None, since=None, until=None, columns=None, limit=None):
+        """按钱包、市场关键词、类别和日期范围查询，返回 pyarrow.Table
+
+        since / until 为 YYYY-MM-DD（含两端）；date 和 category 条件只读取匹配的分区目录。
+        """
+        _load_pyarrow()
+        files = [f for _, part_files in self.partitions(since, until, category) for f in part_files]
+        if not files:
+            return pa.table({c: [] for c in (columns or DEFAULT_COLUMNS)})
+        # 显式指定 schema：新增列之前写入的文件按空值读取；只读取未被合并文件替换的 part 文件
+        schema = pa.schema(list(_schema()) + [pa.field("date", pa.string()), pa.field("category", pa.string())])
+        dataset = ds.dataset(files, format="parquet", schema=schema, partitioning=_partitioning(),
+                             partition_base_dir=self.root)
+        conditions = []
+        if since:
+            conditions.append(ds.field("date") >= since)
+        if until:
+            conditions.append(ds.field("date") <= until)
+        if category:
+            conditions.append(ds.field("category") == category)
+        if wallet:
+            conditions.append(ds.field("user_address") == wallet.lower())
+        if market:
+            conditions.append(pc.match_substring(ds.field("market"), market, ignore_case=True))
+        expression = None
+        for condition in conditions:
+            expression = condition if expression is None else expression & condition
+        table = dataset.to_table(columns=columns or DEFAULT_COLUMNS, filter=expression)
+        if "timestamp" in table.column_names:
+            table = table.sort_by([("timestamp", "descending")])
+        if limit:
+            table = table.slice(0, limit)
+        return table
+
+
+def import_csv(history, path, chunk_size=10000):
+    """把旧的 CSV 历史导入分区存储，返回导入的行数（时间戳无法解析的行计入 history.skipped）"""
+    total = 0
+    with open(path, "r", newline="", encoding="utf-8-sig") as f:
+        for i, row in enumerate(csv.DictReader(f), 1):
+            history.add(row)
+            if i % chunk_size == 0:
+                total += history.flush()
+    return total + history.flush()
+
+
+def main(argv=None, root="alert_history"):
+    parser = argparse.ArgumentParser(prog="polymarket_agent.py history", description="Parquet 警报历史")
+    parser.add_argument("--root", default=root, help="历史目录")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    q = sub.add_parser("query", help="查询警报")
+    q.add_argument("--wallet")
+    q.add_argument("--market", help="市场标题关键词（不区分大小写）")
+    q.add_argument("--category")
+    q.add_argument("--since", help="起始日期 YYYY-MM-DD")
+    q.add_argument("--until", help="结束日期 YYYY-MM-DD")
+    q.add_argument("--columns", help="逗号分隔的列名")
+    q.add_argument("--limit", type=int, default=100)
+    q.add_argument("--format", choices=["csv", "json"], default="csv")
+
+    c = sub.add_parser("compact", help="合并分区内的小文件")
+    c.add_argument("--min-files", type=int, default=2)
+
+    i = sub.add_parser("import", help="从 CSV 历史导入")
+    i.add_argument("csv_path")
+
+    args = parser.parse_args(argv)
+    if not parquet_available():
+        raise SystemExit("Parquet 历史需要 pyarrow: pip install pyarrow")
+    history = ParquetHistory(args.root)
+
+    if args.command == "compact":
+        print(f"🗜️ 已合并 {history.compact(args.min_files)} 个分区")
+    elif args.command == "import":
+        imported = import_csv(history, args.csv_path)
+        skipped = f"，跳过 {history.skipped} 行（时间戳无法解析）" if history.skipped else ""
+        print(f"📦 已导入 {imported} 行到 {args.root}{skipped}")
+    else:
+        columns = args.columns.split(",") if args.columns else None
+        table = history.query(args.wallet, args.market, args.category, args.since, args.until, columns, args.limit)
+        rows = table.to_pylist()
+        if args.format == "json":
+            for row in rows:
+                print(json.dumps(row, ensure_ascii=False, default=str))
+        else:
+            writer = csv.DictWriter(sys.stdout, fieldnames=table.column_names)
+            writer.writeheader()
+            writer.writerows(rows)
+        print(f"# {len(rows)} 行", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
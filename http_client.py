@@ -0,0 +1,204 @@
+"""共享 HTTP 客户端
+
+所有对外请求都经过这里：
+- 每个主机一个 requests.Session，复用 TCP/TLS 连接
+- 每个主机一个令牌桶限速，并限制同时进行的请求数
+- 429 / 5xx / 连接错误时按指数退避（带随机抖动）重试，优先遵循 Retry-After
+- 非幂等请求（POST 等）读取超时时不重试：服务端可能已经处理了请求，重发会产生重复数据
+- 按接口统计请求数、重试数、错误数和延迟
+"""
+import random
+import re
+import threading
+import time
+from collections import deque
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+_ID_SEGMENT = re.compile(r"^(0x[0-9a-fA-F]+|[0-9]+|[A-Za-z0-9_-]{20,})$")
+
+
+class TokenBucket:
+    """令牌桶：平均每秒 rate 个请求，最多累积 capacity 个"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(1.0, rate))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """取一个令牌，不足时阻塞等待，返回等待的秒数"""
+        start = time.monotonic()
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return now - start
+                delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+
+
+class EndpointStats:
+    """单个接口的请求统计，延迟只保留最近的样本"""
+
+    def __init__(self, max_samples=1000):
+        self.requests = 0
+        self.retries = 0
+        self.errors = 0
+        self.throttled_seconds = 0.0
+        self.latencies = deque(maxlen=max_samples)
+
+    def summary(self):
+        samples = sorted(self.latencies)
+        result = {
+            "requests": self.requests,
+            "retries": self.retries,
+            "errors": self.errors,
+            "throttled_s": round(self.throttled_seconds, 3),
+        }
+        if samples:
+            result.update({
+                "avg_ms": round(sum(samples) / len(samples) * 1000, 1),
+                "p50_ms": round(samples[len(samples) // 2] * 1000, 1),
+                "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000, 1),
+                "max_ms": round(samples[-1] * 1000, 1),
+            })
+        return result
+
+
+def endpoint_key(method, url):
+    """把 URL 归一化为接口名：去掉查询参数，地址/ID/Bot Token 等路径段替换为占位符"""
+    parsed = urlparse(url)
+    segments = []
+    for segment in parsed.path.split("/"):
+        if segment.startswith("bot") and ":" in segment:
+            segment = "bot{token}"
+        elif _ID_SEGMENT.match(segment):
+            segment = "{id}"
+        segments.append(segment)
+    return f"{method} {parsed.netloc}{'/'.join(segments)}"
+
+
+class HttpClient:
+    """按主机管理连接池、限速和重试的 HTTP 客户端（线程安全）"""
+
+    def __init__(self, rate_limits=None, default_rate=None, per_host_limit=4,
+                 max_retries=3, backoff_base=0.5, backoff_max=30.0):
+        self.rate_limits = dict(rate_limits or {})
+        self.default_rate = default_rate
+        self.per_host_limit = max(1, per_host_limit)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._buckets = {}
+        self._slots = {}
+        self._stats = {}
+
+    def _host_state(self, host):
+        with self._lock:
+            session = self._sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.per_host_limit)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self._sessions[host] = session
+                rate = self.rate_limits.get(host, self.default_rate)
+                self._buckets[host] = TokenBucket(rate) if rate else None
+                self._slots[host] = threading.BoundedSemaphore(self.per_host_limit)
+            return session, self._buckets[host], self._slots[host]
+
+    def _endpoint_stats(self, key):
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = EndpointStats()
+            return stats
+
+    def _backoff(self, attempt, response=None):
+        """退避时间：有 Retry-After 时遵循它，否则为带完全抖动的指数退避"""
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+            if retry_after:
+                try:
+                    return min(self.backoff_max, float(retry_after))
+                except ValueError:
+                    pass
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def request(self, method, url, max_retries=None, idempotent=None, **kwargs):
+        """发送请求；可重试的错误在重试用尽后返回最后一次响应或抛出最后一次异常
+
+        max_retries 可按请求覆盖默认重试次数（0 表示由调用方自行处理重试）。
+        idempotent 默认按方法判断；非幂等请求在请求已发出后超时（ReadTimeout）时直接抛出，不重发。
+        """
+        max_retries = self.max_retries if max_retries is None else max_retries
+        idempotent = method.upper() in IDEMPOTENT_METHODS if idempotent is None else idempotent
+        host = urlparse(url).netloc
+        session, bucket, slot = self._host_state(host)
+        stats = self._endpoint_stats(endpoint_key(method, url))
+        attempt = 0
+        while True:
+            if bucket is not None:
+                waited = bucket.acquire()
+                with self._lock:
+                    stats.throttled_seconds += waited
+            response = None
+            error = None
+            start = time.perf_counter()
+            try:
+                with slot:
+                    response = session.request(method, url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                error = e
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                stats.requests += 1
+                stats.latencies.append(elapsed)
+                if error is not None or response.status_code >= 400:
+                    stats.errors += 1
+
+            retryable = error is not None or response.status_code in RETRY_STATUS
+            if (not idempotent and isinstance(error, requests.exceptions.Timeout)
+                    and not isinstance(error, requests.exceptions.ConnectTimeout)):
+                retryable = False
+            if not retryable or attempt >= max_retries:
+                if error is not None:
+                    raise error
+                return response
+
+            delay = self._backoff(attempt, response)
+            with self._lock:
+                stats.retries += 1
+            attempt += 1
+            time.sleep(delay)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def stats(self):
+        """返回 {接口: 统计} 字典"""
+        with self._lock:
+            return {key: stats.summary() for key, stats in sorted(self._stats.items())}
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+            self._buckets.clear()
+            self._slots.clear()
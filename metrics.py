@@ -0,0 +1,172 @@
+"""扫描流程的计时和计数
+
+- Metrics.span(stage) 记录各阶段的调用次数、累计耗时和最长耗时
+- Metrics.incr(name) 记录事件计数（拉取的交易、重复交易、缓存命中等）
+- render_prometheus() 把快照渲染为 Prometheus 文本格式，MetricsServer 在守护进程模式下提供 /metrics
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StageStats:
+    """单个阶段的累计耗时"""
+
+    __slots__ = ("calls", "seconds", "max_seconds")
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+
+    def add(self, elapsed):
+        self.calls += 1
+        self.seconds += elapsed
+        self.max_seconds = max(self.max_seconds, elapsed)
+
+    def summary(self):
+        return {"calls": self.calls, "seconds": round(self.seconds, 4), "max_seconds": round(self.max_seconds, 4)}
+
+
+class Metrics:
+    """线程安全的阶段计时和事件计数（进程内累计）"""
+
+    def __init__(self):
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._counters = {}
+
+    def record(self, stage, elapsed):
+        with self._lock:
+            stats = self._stages.get(stage)
+            if stats is None:
+                stats = self._stages[stage] = StageStats()
+            stats.add(elapsed)
+
+    @contextmanager
+    def span(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def timed_iter(self, stage, iterable):
+        """包装迭代器：只把产出每个元素所等待的时间计入 stage，不含调用方的处理时间"""
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.record(stage, time.perf_counter() - start)
+                return
+            self.record(stage, time.perf_counter() - start)
+            yield item
+
+    def incr(self, name, value=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def snapshot(self):
+        """返回 {"stages": {...}, "counters": {...}} 的副本"""
+        with self._lock:
+            return {
+                "uptime_seconds": round(time.time() - self.started_at, 1),
+                "stages": {stage: stats.summary() for stage, stats in sorted(self._stages.items())},
+                "counters": dict(sorted(self._counters.items())),
+            }
+
+
+def write_json_summary(path, summary):
+    """写入 JSON 运行摘要（先写临时文件再替换）"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2, default=str)
+    os.replace(tmp_path, path)
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+
+def render_prometheus(summary, prefix="polymarket"):
+    """把运行摘要渲染为 Prometheus 文本格式
+
+    summary 为 Metrics.snapshot() 的结果，可附加 "http"（HttpClient.stats()）
+    和 "gauges"（{名称: 数值}）两项。
+    """
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f"# HELP {prefix}_{name} {help_text}")
+        lines.append(f"# TYPE {prefix}_{name} {kind}")
+        for labels, value in samples:
+            label_text = ",".join(f'{k}="{_label(v)}"' for k, v in labels.items())
+            lines.append(f"{prefix}_{name}{{{label_text}}} {value}" if label_text else f"{prefix}_{name} {value}")
+
+    stages = summary.get("stages", {})
+    metric("stage_seconds_total", "counter", "Cumulative seconds spent per scan stage.",
+           [({"stage": s}, v["seconds"]) for s, v in stages.items()])
+    metric("stage_calls_total", "counter", "Number of times each scan stage ran.",
+           [({"stage": s}, v["calls"]) for s, v in stages.items()])
+    metric("stage_max_seconds", "gauge", "Longest single run of each scan stage.",
+           [({"stage": s}, v["max_seconds"]) for s, v in stages.items()])
+    metric("events_total", "counter", "Pipeline event counters.",
+           [({"event": name}, value) for name, value in summary.get("counters", {}).items()])
+
+    http = summary.get("http", {})
+    for field, name, help_text in (
+        ("requests", "http_requests_total", "HTTP requests sent per endpoint, including retries."),
+        ("retries", "http_retries_total", "HTTP retries per endpoint."),
+        ("errors", "http_errors_total", "HTTP errors (status >= 400 or connection failures) per endpoint."),
+        ("throttled_s", "http_throttled_seconds_total", "Seconds spent waiting on the client-side rate limiter."),
+    ):
+        metric(name, "counter", help_text, [({"endpoint": e}, s.get(field, 0)) for e, s in http.items()])
+    metric("http_latency_p95_seconds", "gauge", "p95 latency of recent requests per endpoint.",
+           [({"endpoint": e}, s["p95_ms"] / 1000) for e, s in http.items() if "p95_ms" in s])
+
+    for name, value in summary.get("gauges", {}).items():
+        metric(name, "gauge", name.replace("_", " ") + ".", [({}, value)])
+    metric("uptime_seconds", "gauge", "Seconds since the process started.", [({}, summary.get("uptime_seconds", 0))])
+    return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """在后台线程提供 /metrics（Prometheus 文本）和 /metrics.json；provider 返回最新的运行摘要"""
+
+    def __init__(self, port, provider, host="0.0.0.0"):
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                path = self.path.split("?", 1)[0]
+                if path == "/metrics":
+                    body = render_prometheus(provider()).encode("utf-8")
+                    content_type = "text/plain; version=0.0.4; charset=utf-8"
+                elif path == "/metrics.json":
+                    body = json.dumps(provider(), ensure_ascii=False, default=str).encode("utf-8")
+                    content_type = "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.port = self.httpd.server_address[1]
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="metrics", daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
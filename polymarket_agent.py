@@ -1,29 +1,157 @@
+import time
+_IMPORT_START = time.perf_counter()
 import requests
-import pandas as pd
 from datetime import datetime, timezone
 import os
-import time
 import json
+import csv
+from collections import OrderedDict, deque
 import hashlib
 import re
+import sqlite3
+import signal
+import threading
+import multiprocessing
+import queue
+from concurrent.futures import ThreadPoolExecutor
+
+from http_client import HttpClient
+from alert_rules import load_rules
+from alert_stats import AlertStats
+from clob_stream import ClobTradeStream, stream_available
+from history_store import ParquetHistory, parquet_available
+from metrics import Metrics, MetricsServer, write_json_summary
+from state_snapshot import restore_snapshot, save_snapshot
+from wallet_index import WalletIndex
+
+# 模块导入耗时（冷启动时主要是 requests）；pyarrow、websocket-client 只在用到时才导入
+IMPORT_SECONDS = time.perf_counter() - _IMPORT_START
 
 # --- 配置区 ---
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
 CHAT_ID = "@polyinsidermonitor"
+# Telegram 发送队列：同一频道两条消息的最小间隔（秒）和每分钟上限
+TELEGRAM_MIN_INTERVAL = float(os.getenv("TELEGRAM_MIN_INTERVAL", "1"))
+TELEGRAM_PER_MINUTE = int(os.getenv("TELEGRAM_PER_MINUTE", "20"))
+# 同一市场在该窗口（秒）内的后续警报合并为一条消息发送，0 表示不合并
+TELEGRAM_COALESCE_WINDOW = int(os.getenv("TELEGRAM_COALESCE_WINDOW", "60"))
+# 单条消息最多发送尝试次数，以及退出时仍未发送的消息保存位置（下次运行继续发送）
+TELEGRAM_MAX_ATTEMPTS = int(os.getenv("TELEGRAM_MAX_ATTEMPTS", "5"))
+TELEGRAM_OUTBOX_FILE = os.getenv("TELEGRAM_OUTBOX_FILE", "telegram_outbox.jsonl")
 MIN_BET_USD = 3000
+# 判定规则：账号年龄不超过该天数，或历史交易笔数少于该值，视为可疑
+MAX_ACCOUNT_AGE_DAYS = 10
+MIN_TRADE_COUNT = 10
+# 警报规则配置（JSON，见 alert_rules.py）；文件不存在时使用与上面阈值等价的默认规则
+RULES_FILE = os.getenv("RULES_FILE", "alert_rules.json")
 
-DATA_API_URL = "https://data-api.polymarket.com"
-GAMMA_API_URL = "https://gamma-api.polymarket.com"
+# API 地址可通过环境变量覆盖（例如指向 benchmarks/stub_api.py 的本地替身）
+DATA_API_URL = os.getenv("DATA_API_URL", "https://data-api.polymarket.com")
+GAMMA_API_URL = os.getenv("GAMMA_API_URL", "https://gamma-api.polymarket.com")
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org")
 
 # CSV 文件路径（历史记录）
 CSV_FILE = "insider_alerts_history.csv"
-# 已推送交易的记录文件（用于去重）
+# 是否按天滚动 CSV 文件（insider_alerts_history_YYYY-MM-DD.csv）
+CSV_ROLL_DAILY = os.getenv("CSV_ROLL_DAILY", "").lower() in ("1", "true", "yes")
+# 按日期和类别分区的 Parquet 警报历史（需要安装 pyarrow，未安装时只写 CSV）
+ALERT_HISTORY_ENABLED = os.getenv("ALERT_HISTORY_ENABLED", "1").lower() not in ("0", "false", "no")
+ALERT_HISTORY_DIR = os.getenv("ALERT_HISTORY_DIR", "alert_history")
+# 分区内 part 文件数达到该值时合并（每小时运行一次时约每天合并一次）
+ALERT_HISTORY_COMPACT_FILES = int(os.getenv("ALERT_HISTORY_COMPACT_FILES", "24"))
+# 旧版已推送交易记录文件，存在时会被导入状态数据库（用于去重）
 SENT_TRADES_FILE = "sent_trades.json"
+# 已推送交易记录保留天数
+SENT_TRADES_RETENTION_DAYS = int(os.getenv("SENT_TRADES_RETENTION_DAYS", "7"))
+# 增量拉取游标文件（上次处理到的最新交易时间戳和交易哈希）
+INGEST_CURSOR_FILE = os.getenv("INGEST_CURSOR_FILE", "ingest_cursor.json")
+# /trades 分页大小和单次运行最多拉取的页数
+TRADES_PAGE_SIZE = int(os.getenv("TRADES_PAGE_SIZE", "500"))
+TRADES_MAX_PAGES = int(os.getenv("TRADES_MAX_PAGES", "20"))
 
 # Google Sheets 配置（可选）
 # 设置环境变量 GOOGLE_SHEETS_WEBHOOK 来启用
 # 使用 Google Apps Script Web App 作为简单的写入接口
 GOOGLE_SHEETS_WEBHOOK = os.getenv("GOOGLE_SHEETS_WEBHOOK")
+GOOGLE_SHEETS_TIMEOUT = 15
+# 批量写入：警报先进入本地队列文件，每轮扫描结束时合并为一次请求
+# （需要先部署 GOOGLE_SHEETS_SETUP.md 中支持批量的 Apps Script，再设为 1；默认逐条发送）
+GOOGLE_SHEETS_BATCH = os.getenv("GOOGLE_SHEETS_BATCH", "0").lower() not in ("0", "false", "no")
+SHEETS_SPOOL_FILE = os.getenv("SHEETS_SPOOL_FILE", "sheets_spool.jsonl")
+SHEETS_BATCH_SIZE = int(os.getenv("SHEETS_BATCH_SIZE", "200"))
+
+# Gamma 市场元数据缓存：增量刷新间隔、全量刷新间隔（秒），分页大小和最多页数
+MARKET_CACHE_ENABLED = os.getenv("MARKET_CACHE_ENABLED", "1").lower() not in ("0", "false", "no")
+MARKET_CACHE_REFRESH = int(os.getenv("MARKET_CACHE_REFRESH", str(10 * 60)))
+MARKET_CACHE_FULL_REFRESH = int(os.getenv("MARKET_CACHE_FULL_REFRESH", str(24 * 60 * 60)))
+MARKET_CACHE_PAGE_SIZE = int(os.getenv("MARKET_CACHE_PAGE_SIZE", "500"))
+MARKET_CACHE_MAX_PAGES = int(os.getenv("MARKET_CACHE_MAX_PAGES", "40"))
+MARKET_CACHE_MISS_TTL = int(os.getenv("MARKET_CACHE_MISS_TTL", str(30 * 60)))  # /markets 查不到的市场多久内不再请求
+
+# 钱包信息并发查询配置
+# ENRICH_MAX_WORKERS: 同时查询的钱包数上限
+# ENRICH_PER_HOST_LIMIT: 对同一主机同时进行的请求数上限
+ENRICH_MAX_WORKERS = int(os.getenv("ENRICH_MAX_WORKERS", "8"))
+ENRICH_PER_HOST_LIMIT = int(os.getenv("ENRICH_PER_HOST_LIMIT", "4"))
+
+# HTTP 限速（每秒请求数，按主机），429/5xx 时的最大重试次数
+HTTP_RATE_LIMITS = {
+    "data-api.polymarket.com": float(os.getenv("DATA_API_RATE", "15")),
+    "gamma-api.polymarket.com": float(os.getenv("GAMMA_API_RATE", "10")),
+    "polymarket.com": float(os.getenv("POLYMARKET_WEB_RATE", "5")),
+}
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "3"))
+
+# 实时模式（python polymarket_agent.py stream）：订阅 CLOB WebSocket market 频道的成交，需要 websocket-client
+CLOB_WS_URL = os.getenv("CLOB_WS_URL", "wss://ws-subscriptions-clob.polymarket.com/ws/market")
+# 待解析成交队列上限，满了之后改用 /trades 轮询补齐
+STREAM_QUEUE_SIZE = int(os.getenv("STREAM_QUEUE_SIZE", "10000"))
+STREAM_ASSETS_PER_CONNECTION = int(os.getenv("STREAM_ASSETS_PER_CONNECTION", "500"))
+# 成交出现在 Data API 之前的等待时间（秒）和最多查询次数
+STREAM_RESOLVE_DELAY = float(os.getenv("STREAM_RESOLVE_DELAY", "2"))
+STREAM_RESOLVE_ATTEMPTS = int(os.getenv("STREAM_RESOLVE_ATTEMPTS", "5"))
+
+# 分片：按钱包地址哈希把交易分给多个节点（--shard-index/--shard-count）和本机多个工作进程（--workers），
+# 各进程共享状态库，报警前先在 sent_trades 表认领，保证每笔交易只报警一次
+SHARD_INDEX = int(os.getenv("SHARD_INDEX", "0"))
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", "1"))
+SHARD_WORKERS = int(os.getenv("SHARD_WORKERS", "0"))
+# 等待工作进程结果的超时时间（秒），超时视为工作进程失败，本轮不推进游标
+SHARD_RESULT_TIMEOUT = int(os.getenv("SHARD_RESULT_TIMEOUT", "600"))
+
+# 日志级别：DEBUG 时输出逐笔交易和钱包查询的详细过程，默认只输出 INFO 及以上
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# 每次落盘时写入的 JSON 运行摘要（阶段耗时、事件计数、接口统计），留空则不写
+METRICS_FILE = os.getenv("METRICS_FILE", "run_metrics.json")
+# 守护进程模式下 Prometheus /metrics 端口，0 表示不启动
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+# 守护进程模式：轮询间隔（秒）在最短和最长之间自适应，空闲时按倍数退避
+DAEMON_MIN_INTERVAL = int(os.getenv("DAEMON_MIN_INTERVAL", "15"))
+DAEMON_MAX_INTERVAL = int(os.getenv("DAEMON_MAX_INTERVAL", "300"))
+DAEMON_BACKOFF = float(os.getenv("DAEMON_BACKOFF", "1.5"))
+# 守护进程模式下发送汇总的间隔（秒）
+SUMMARY_INTERVAL = int(os.getenv("SUMMARY_INTERVAL", "3600"))
+# 汇总中列出的热门市场 / 重复出现的钱包个数
+SUMMARY_TOP_N = int(os.getenv("SUMMARY_TOP_N", "5"))
+
+# 本地状态数据库（去重记录、钱包缓存等）
+STATE_DB_FILE = os.getenv("STATE_DB_FILE", "monitor_state.db")
+# 状态快照：状态库不存在时（新的运行环境）启动前从快照恢复，单次运行结束后写回，留空则不使用
+STATE_SNAPSHOT_FILE = os.getenv("STATE_SNAPSHOT_FILE", "")
+# 钱包缓存 TTL（秒）：首笔活动时间不会变化，0 表示永不过期；交易次数可以延迟刷新
+WALLET_FIRST_SEEN_TTL = int(os.getenv("WALLET_FIRST_SEEN_TTL", "0"))
+WALLET_TRADE_COUNT_TTL = int(os.getenv("WALLET_TRADE_COUNT_TTL", str(6 * 60 * 60)))
+# 钱包缓存最多保留的条目数，超出后按最近访问时间淘汰
+WALLET_CACHE_MAX_ENTRIES = int(os.getenv("WALLET_CACHE_MAX_ENTRIES", "50000"))
+# 钱包统计索引：由每笔拉取到的交易增量更新，能在本地判定时不再查询钱包缓存和 API
+WALLET_INDEX_ENABLED = os.getenv("WALLET_INDEX_ENABLED", "1").lower() not in ("0", "false", "no")
+WALLET_INDEX_MAX_ENTRIES = int(os.getenv("WALLET_INDEX_MAX_ENTRIES", "200000"))
+# 每个钱包拉取活动记录的分页大小和最多页数（同一批记录同时用于账号年龄和交易笔数）
+WALLET_ACTIVITY_PAGE_SIZE = int(os.getenv("WALLET_ACTIVITY_PAGE_SIZE", "500"))
+WALLET_ACTIVITY_MAX_PAGES = int(os.getenv("WALLET_ACTIVITY_MAX_PAGES", "2"))
+# Data API 允许的最大 offset（升序查询不可用时，用 offset 查找最早一笔活动）
+FIRST_ACTIVITY_MAX_OFFSET = int(os.getenv("FIRST_ACTIVITY_MAX_OFFSET", "10000"))
 
 # --- 市场分类关键词 ---
 CATEGORY_KEYWORDS = {
@@ -121,6 +249,65 @@ CATEGORY_KEYWORDS = {
 }
 
 
+HTTP_CLIENT = HttpClient(
+    rate_limits=HTTP_RATE_LIMITS,
+    per_host_limit=ENRICH_PER_HOST_LIMIT,
+    max_retries=HTTP_MAX_RETRIES,
+)
+
+
+def http_get(url, **kwargs):
+    """GET 请求（共享连接池、限速、失败重试）"""
+    return HTTP_CLIENT.get(url, **kwargs)
+
+
+def http_post(url, **kwargs):
+    """POST 请求（共享连接池、限速、失败重试）"""
+    return HTTP_CLIENT.post(url, **kwargs)
+
+
+METRICS = Metrics()
+METRICS.record("import", IMPORT_SECONDS)
+
+
+def debug(message):
+    """LOG_LEVEL=DEBUG 时才输出的详细日志"""
+    if LOG_LEVEL == "DEBUG":
+        print(message)
+
+
+def print_http_stats():
+    """打印各接口的请求统计"""
+    for endpoint, stats in HTTP_CLIENT.stats().items():
+        print(f"🌐 {endpoint}: {stats}")
+
+
+def print_stage_stats():
+    """打印各阶段累计耗时"""
+    for stage, stats in sorted(METRICS.snapshot()["stages"].items(), key=lambda kv: -kv[1]["seconds"]):
+        print(f"⏱️ {stage}: {stats['seconds']:.3f}s ({stats['calls']} 次, 最长 {stats['max_seconds']:.3f}s)")
+
+
+# Gamma 市场标签（slug）到类别的映射，类别优先级与 CATEGORY_KEYWORDS 相同
+TAG_CATEGORIES = {
+    "政治": [
+        "politics", "us-politics", "elections", "us-election", "global-elections", "world-elections",
+        "geopolitics", "world", "trump", "congress", "courts", "middle-east", "ukraine", "fed-chair"
+    ],
+    "Crypto": [
+        "crypto", "bitcoin", "ethereum", "solana", "xrp", "crypto-prices", "stablecoins", "airdrops", "memecoins"
+    ],
+    "体育": [
+        "sports", "nba", "nfl", "mlb", "nhl", "soccer", "epl", "champions-league", "ufc", "mma", "tennis",
+        "golf", "boxing", "esports", "f1", "cricket", "ncaa", "olympics"
+    ],
+    "传统金融": [
+        "economy", "finance", "business", "fed", "fed-rates", "stocks", "inflation", "ipos", "earnings",
+        "economic-policy", "commodities"
+    ],
+}
+
+
 def parse_timestamp(time_str):
     """解析时间戳，支持多种格式"""
     if not time_str:
@@ -141,25 +328,342 @@ def parse_timestamp(time_str):
                 dt = dt.replace(tzinfo=timezone.utc)
             return dt
     except Exception as e:
-        print(f"⚠️ DEBUG - 时间解析失败: {e}, 原始值: {time_str}")
+        debug(f"⚠️ 时间解析失败: {e}, 原始值: {time_str}")
     return None
 
 
-def categorize_market(market_title):
-    """根据市场标题分类"""
+def _compile_category_pattern(keywords):
+    """把一个类别的全部关键词编译为一个正则
+
+    关键词两侧不能紧挨英文字母或数字（允许复数 s），避免 "ind" 误中 "Indiana"、
+    "sol" 误中 "solution"；中文关键词两侧不受影响，仍按子串匹配。
+    """
+    words = sorted({k.lower() for k in keywords}, key=len, reverse=True)
+    alternation = "|".join(re.escape(w) for w in words)
+    return re.compile(rf"(?<![a-z0-9])(?:{alternation})s?(?![a-z0-9])")
+
+
+# 模块加载时编译一次，保持 CATEGORY_KEYWORDS 中的类别优先顺序
+CATEGORY_PATTERNS = [(category, _compile_category_pattern(keywords)) for category, keywords in CATEGORY_KEYWORDS.items()]
+
+
+def categorize_market(market_title, market_info=None):
+    """市场分类：优先使用 Gamma 官方标签，没有时根据市场标题关键词分类"""
+    if market_info and market_info.get("category"):
+        return market_info["category"]
     if not market_title:
         return "其他"
     
     title_lower = market_title.lower()
     
-    for category, keywords in CATEGORY_KEYWORDS.items():
-        for keyword in keywords:
-            if keyword.lower() in title_lower:
-                return category
+    for category, pattern in CATEGORY_PATTERNS:
+        if pattern.search(title_lower):
+            return category
     
     return "其他"
 
 
+def _parse_json_list(value):
+    """Gamma 的部分列表字段是 JSON 字符串，统一转为 list"""
+    if isinstance(value, list):
+        return value
+    if isinstance(value, str) and value:
+        try:
+            parsed = json.loads(value)
+            return parsed if isinstance(parsed, list) else []
+        except ValueError:
+            return []
+    return []
+
+
+def _to_float(value):
+    try:
+        return float(value) if value not in (None, "") else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _tag_slugs(*sources):
+    """合并多个 Gamma 对象上的标签 slug（去重，保持顺序）"""
+    tags = []
+    for source in sources:
+        for tag in source.get("tags") or []:
+            label = (tag.get("slug") or tag.get("label")) if isinstance(tag, dict) else tag
+            if label and label not in tags:
+                tags.append(label)
+    return tags
+
+
+def category_from_tags(tags):
+    """根据 Gamma 标签判断类别，无法判断返回 None"""
+    slugs = {str(t).lower() for t in tags}
+    for category, tag_slugs in TAG_CATEGORIES.items():
+        if slugs.intersection(tag_slugs):
+            return category
+    return None
+
+
+class MarketCache:
+    """市场元数据缓存（Gamma API）
+
+    批量从 /events 预取未关闭市场的标签、截止时间、流动性和成交量，保存在状态数据库中，
+    启动时载入内存字典，按 conditionId / slug O(1) 查询。每 MARKET_CACHE_REFRESH 秒
+    增量拉取新事件，每 MARKET_CACHE_FULL_REFRESH 秒全量刷新一次；扫描中遇到缓存里没有的
+    市场，整批合并为一次 /markets 请求补齐。
+
+    全量刷新完整拉完所有页后，删除本次刷新之前写入、且已不在未关闭列表中的市场（已关闭 / 已结算），
+    表和内存不再只增不减，实时流也不会继续订阅这些市场的 token。/markets 查不到的 conditionId
+    在 MARKET_CACHE_MISS_TTL 秒内不再重复请求。
+    """
+
+    COLUMNS = ("condition_id", "slug", "event_slug", "question", "tags", "category",
+               "end_date", "liquidity", "volume", "clob_token_ids", "event_id", "fetched_at")
+
+    def __init__(self, path=None):
+        self._lock = threading.Lock()
+        self._conn = _connect_state_db(path)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS markets (
+                condition_id TEXT PRIMARY KEY,
+                slug TEXT,
+                event_slug TEXT,
+                question TEXT,
+                tags TEXT,
+                category TEXT,
+                end_date TEXT,
+                liquidity REAL,
+                volume REAL,
+                clob_token_ids TEXT,
+                event_id INTEGER,
+                fetched_at REAL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_markets_fetched_at ON markets (fetched_at)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS cache_meta (key TEXT PRIMARY KEY, value REAL)")
+        self._conn.commit()
+        self._misses = {}  # conditionId -> 未命中记录的过期时间
+        self.reload()
+
+    def reload(self):
+        """从状态库重新载入内存索引（其他进程刷新了市场缓存时调用）"""
+        with self._lock:
+            self._synced = (self._meta("full_refresh_at"), time.time())
+            rows = self._conn.execute(f"SELECT {', '.join(self.COLUMNS)} FROM markets").fetchall()
+            self._by_condition = {}
+            self._by_slug = {}
+            for row in rows:
+                self._index(self._row_to_market(row))
+        return len(self._by_condition)
+
+    def sync(self):
+        """分片工作进程调用：由协调进程负责刷新，这里只载入状态库中的变化
+
+        协调进程做过全量刷新（可能删除了已关闭的市场）时整体重新载入，
+        否则只载入上次同步之后写入的市场。
+        """
+        with self._lock:
+            full_at, synced_at = self._synced
+            if self._meta("full_refresh_at") != full_at:
+                full = True
+            else:
+                full = False
+                now = time.time()
+                rows = self._conn.execute(f"SELECT {', '.join(self.COLUMNS)} FROM markets WHERE fetched_at >= ?",
+                                          (synced_at - 1,)).fetchall()
+                for row in rows:
+                    self._index(self._row_to_market(row))
+                self._synced = (full_at, now)
+        if full:
+            self.reload()
+
+    def _row_to_market(self, row):
+        market = dict(zip(self.COLUMNS, row))
+        market["tags"] = json.loads(market["tags"] or "[]")
+        market["clob_token_ids"] = json.loads(market["clob_token_ids"] or "[]")
+        return market
+
+    def _index(self, market):
+        self._by_condition[market["condition_id"]] = market
+        if market.get("slug"):
+            self._by_slug[market["slug"]] = market
+
+    def __len__(self):
+        return len(self._by_condition)
+
+    def get(self, condition_id=None, slug=None):
+        """按 conditionId 或 slug 查询市场元数据，未缓存返回 None"""
+        market = self._by_condition.get(condition_id) if condition_id else None
+        if market is None and slug:
+            market = self._by_slug.get(slug)
+        return market
+
+    def get_for_trade(self, trade):
+        return self.get(trade.get('conditionId'), trade.get('slug'))
+
+    def token_ids(self):
+        """所有已缓存市场的 CLOB token id"""
+        return [token for m in self._by_condition.values() for token in m["clob_token_ids"]]
+
+    def _meta(self, key, default=0.0):
+        row = self._conn.execute("SELECT value FROM cache_meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def _set_meta(self, key, value):
+        self._conn.execute("INSERT OR REPLACE INTO cache_meta (key, value) VALUES (?, ?)", (key, value))
+
+    def _market_record(self, market, event=None):
+        nested = market.get("events") or []
+        if event is None:
+            event = nested[0] if nested else {}
+        tags = _tag_slugs(market, event, *nested)
+        event_id = event.get("id")
+        return {
+            "condition_id": market.get("conditionId"),
+            "slug": market.get("slug"),
+            "event_slug": event.get("slug"),
+            "question": market.get("question"),
+            "tags": tags,
+            "category": category_from_tags(tags),
+            "end_date": market.get("endDate") or event.get("endDate"),
+            "liquidity": _to_float(market.get("liquidityNum", market.get("liquidity"))),
+            "volume": _to_float(market.get("volumeNum", market.get("volume"))),
+            "clob_token_ids": _parse_json_list(market.get("clobTokenIds")),
+            "event_id": int(event_id) if str(event_id or "").isdigit() else None,
+            "fetched_at": time.time(),
+        }
+
+    def _store(self, records):
+        records = [r for r in records if r["condition_id"]]
+        if not records:
+            return 0
+        rows = [tuple(json.dumps(r[c], ensure_ascii=False) if c in ("tags", "clob_token_ids") else r[c]
+                      for c in self.COLUMNS) for r in records]
+        with self._lock:
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO markets ({', '.join(self.COLUMNS)}) VALUES ({', '.join('?' * len(self.COLUMNS))})",
+                rows,
+            )
+            self._conn.commit()
+            for record in records:
+                self._index(record)
+        return len(records)
+
+    def _fetch_events(self, params, stop_at_event_id=None):
+        """分页拉取 /events，返回 (市场记录列表, 最大事件 id, 是否拉完了所有页)"""
+        records = []
+        max_event_id = 0
+        for page in range(MARKET_CACHE_MAX_PAGES):
+            query = dict(params, limit=MARKET_CACHE_PAGE_SIZE, offset=page * MARKET_CACHE_PAGE_SIZE)
+            res = http_get(f"{GAMMA_API_URL}/events", params=query, timeout=30)
+            res.raise_for_status()
+            events = res.json()
+            if not events:
+                break
+            reached = False
+            for event in events:
+                event_id = int(event.get("id") or 0)
+                if stop_at_event_id and event_id <= stop_at_event_id:
+                    reached = True
+                    continue
+                max_event_id = max(max_event_id, event_id)
+                records.extend(self._market_record(m, event) for m in event.get("markets") or [])
+            if reached or len(events) < MARKET_CACHE_PAGE_SIZE:
+                break
+        else:
+            return records, max_event_id, False
+        return records, max_event_id, True
+
+    def _prune(self, before):
+        """删除 before 之前写入的市场（全量刷新后调用：没有被刷新到的即已不在未关闭列表中）"""
+        with self._lock:
+            stale = [row[0] for row in self._conn.execute(
+                "SELECT condition_id FROM markets WHERE fetched_at < ?", (before,))]
+            self._conn.execute("DELETE FROM markets WHERE fetched_at < ?", (before,))
+            for condition_id in stale:
+                market = self._by_condition.pop(condition_id, None)
+                if market and market.get("slug") and self._by_slug.get(market["slug"]) is market:
+                    del self._by_slug[market["slug"]]
+        METRICS.incr("market_cache_pruned", len(stale))
+        return len(stale)
+
+    def refresh(self, force_full=False):
+        """按需全量或增量刷新，失败只打印警告，不影响扫描"""
+        now = time.time()
+        try:
+            with self._lock:
+                full_at = self._meta("full_refresh_at")
+                incremental_at = self._meta("incremental_at")
+                max_event_id = int(self._meta("max_event_id"))
+            if force_full or now - full_at >= MARKET_CACHE_FULL_REFRESH:
+                records, newest, complete = self._fetch_events({"closed": "false"})
+                keys = {"full_refresh_at": now, "incremental_at": now}
+                label = "全量"
+            elif now - incremental_at >= MARKET_CACHE_REFRESH:
+                records, newest, _ = self._fetch_events({"closed": "false", "order": "id", "ascending": "false"},
+                                                        stop_at_event_id=max_event_id)
+                complete = False
+                keys = {"incremental_at": now}
+                label = "增量"
+            else:
+                return 0
+            count = self._store(records)
+            # 只有完整拉完、且确实拿到了市场时才清理，分页被截断或 API 返回空列表时不能据此删除
+            pruned = self._prune(now) if complete and count else 0
+            with self._lock:
+                for key, value in keys.items():
+                    self._set_meta(key, value)
+                self._set_meta("max_event_id", max(max_event_id, newest))
+                self._conn.commit()
+            removed = f", 移除 {pruned} 个已关闭市场" if pruned else ""
+            print(f"🗂️ 市场元数据{label}刷新: {count} 个市场{removed} (缓存共 {len(self)} 个)")
+            return count
+        except Exception as e:
+            print(f"⚠️ 市场元数据刷新失败: {e}")
+            return 0
+
+    def prefetch(self, trades):
+        """把缓存中没有的市场合并成批量请求补齐（每批最多 50 个 conditionId）
+
+        请求成功但没有返回的 conditionId 记为未命中，MARKET_CACHE_MISS_TTL 秒内不再请求；
+        请求失败时不记录，下一轮重试。
+        """
+        now = time.time()
+        missing = set()
+        for t in trades:
+            condition_id = t.get('conditionId')
+            if not condition_id or condition_id in missing or self.get_for_trade(t) is not None:
+                continue
+            if self._misses.get(condition_id, 0) > now:
+                METRICS.incr("market_cache_miss_skipped")
+                continue
+            missing.add(condition_id)
+        missing = sorted(missing)
+        fetched = 0
+        for i in range(0, len(missing), 50):
+            batch = missing[i:i + 50]
+            try:
+                params = [("condition_ids", cid) for cid in batch] + [("include_tag", "true")]
+                res = http_get(f"{GAMMA_API_URL}/markets", params=params, timeout=30)
+                res.raise_for_status()
+                records = [self._market_record(m) for m in res.json() or []]
+                fetched += self._store(records)
+            except Exception as e:
+                print(f"⚠️ 批量获取市场元数据失败: {e}")
+                continue
+            found = {r["condition_id"] for r in records}
+            for condition_id in batch:
+                if condition_id not in found:
+                    self._misses[condition_id] = now + MARKET_CACHE_MISS_TTL
+                    METRICS.incr("market_cache_miss_cached")
+        if len(self._misses) > 10000:
+            self._misses = {k: v for k, v in self._misses.items() if v > now}
+        return fetched
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
 def generate_trade_id(trade):
     """生成交易唯一ID用于去重"""
     # 使用交易的关键字段生成唯一哈希
@@ -167,25 +671,122 @@ def generate_trade_id(trade):
     return hashlib.md5(unique_str.encode()).hexdigest()
 
 
+def _connect_state_db(path=None):
+    """打开本地状态数据库（WAL 模式，允许多个连接和线程共享）"""
+    conn = sqlite3.connect(path or STATE_DB_FILE, timeout=30, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+class SentTradeStore:
+    """已推送交易的去重记录（SQLite）
+
+    按天分桶保存，过期时整桶删除，不需要逐条扫描；每次标记立即写入，
+    运行中途崩溃也不会丢失已推送的记录。
+    """
+
+    BUCKET_SECONDS = 24 * 60 * 60
+
+    def __init__(self, path=None, retention_days=None):
+        self.retention_days = SENT_TRADES_RETENTION_DAYS if retention_days is None else retention_days
+        self._lock = threading.Lock()
+        self._conn = _connect_state_db(path)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS sent_trades (
+                trade_id BLOB PRIMARY KEY,
+                bucket INTEGER NOT NULL
+            ) WITHOUT ROWID"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_sent_trades_bucket ON sent_trades (bucket)")
+        self._conn.commit()
+
+    def _bucket(self, ts):
+        return int(ts // self.BUCKET_SECONDS)
+
+    def __contains__(self, trade_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM sent_trades WHERE trade_id = ?", (bytes.fromhex(trade_id),)
+            ).fetchone()
+        return row is not None
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM sent_trades").fetchone()[0]
+
+    def sent_among(self, trade_ids, chunk_size=500):
+        """批量查询：返回 trade_ids 中已标记过的 ID 集合"""
+        found = set()
+        with self._lock:
+            for i in range(0, len(trade_ids), chunk_size):
+                chunk = [bytes.fromhex(trade_id) for trade_id in trade_ids[i:i + chunk_size]]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT trade_id FROM sent_trades WHERE trade_id IN ({placeholders})", chunk
+                ).fetchall()
+                found.update(bytes(row[0]).hex() for row in rows)
+        return found
+
+    def mark(self, trade_id, ts=None):
+        """标记交易为已发送，返回 False 表示此前已标记过"""
+        ts = datetime.now(timezone.utc).timestamp() if ts is None else ts
+        with self._lock:
+            cur = self._conn.execute(
+                "INSERT OR IGNORE INTO sent_trades (trade_id, bucket) VALUES (?, ?)",
+                (bytes.fromhex(trade_id), self._bucket(ts)),
+            )
+            self._conn.commit()
+        return cur.rowcount == 1
+
+    def release(self, trade_id):
+        """撤销认领（报警发送失败时），下次扫描可以重新处理"""
+        with self._lock:
+            self._conn.execute("DELETE FROM sent_trades WHERE trade_id = ?", (bytes.fromhex(trade_id),))
+            self._conn.commit()
+
+    def expire(self, now=None):
+        """删除超出保留天数的整桶记录"""
+        now = datetime.now(timezone.utc).timestamp() if now is None else now
+        cutoff = self._bucket(now - self.retention_days * self.BUCKET_SECONDS)
+        with self._lock:
+            cur = self._conn.execute("DELETE FROM sent_trades WHERE bucket < ?", (cutoff,))
+            self._conn.commit()
+        return cur.rowcount
+
+    def import_json(self, path):
+        """导入旧版 sent_trades.json（{trade_id: 时间戳}），导入后重命名原文件"""
+        with open(path, 'r') as f:
+            data = json.load(f)
+        rows = [(bytes.fromhex(k), self._bucket(v)) for k, v in data.items()]
+        with self._lock:
+            self._conn.executemany("INSERT OR IGNORE INTO sent_trades (trade_id, bucket) VALUES (?, ?)", rows)
+            self._conn.commit()
+        os.replace(path, path + ".migrated")
+        print(f"✅ 已从 {path} 导入 {len(rows)} 条已推送记录")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
 def load_sent_trades():
     """加载已发送的交易记录"""
+    store = SentTradeStore()
     try:
         if os.path.exists(SENT_TRADES_FILE):
-            with open(SENT_TRADES_FILE, 'r') as f:
-                data = json.load(f)
-                # 只保留最近7天的记录，避免文件过大
-                cutoff = datetime.now(timezone.utc).timestamp() - (7 * 24 * 60 * 60)
-                return {k: v for k, v in data.items() if v > cutoff}
+            store.import_json(SENT_TRADES_FILE)
+        # 只保留最近7天的记录，避免数据无限增长
+        store.expire()
     except Exception as e:
         print(f"⚠️ 加载已发送交易记录失败: {e}")
-    return {}
+    return store
 
 
 def save_sent_trades(sent_trades):
-    """保存已发送的交易记录"""
+    """清理过期的已发送交易记录（每条记录在标记时已写入）"""
     try:
-        with open(SENT_TRADES_FILE, 'w') as f:
-            json.dump(sent_trades, f)
+        sent_trades.expire()
     except Exception as e:
         print(f"⚠️ 保存已发送交易记录失败: {e}")
 
@@ -197,279 +798,1138 @@ def is_trade_sent(trade_id, sent_trades):
 
 def mark_trade_sent(trade_id, sent_trades):
     """标记交易为已发送"""
-    sent_trades[trade_id] = datetime.now(timezone.utc).timestamp()
+    return sent_trades.mark(trade_id)
 
 
-def save_to_csv(alert_data):
-    """保存警报到CSV文件"""
+def load_ingest_cursor():
+    """加载增量拉取游标，不存在时返回 None"""
     try:
-        # 准备数据
-        new_row = pd.DataFrame([alert_data])
+        if os.path.exists(INGEST_CURSOR_FILE):
+            with open(INGEST_CURSOR_FILE, 'r') as f:
+                data = json.load(f)
+                return {"timestamp": int(data["timestamp"]), "tx_hashes": set(data.get("tx_hashes", []))}
+    except Exception as e:
+        print(f"⚠️ 加载拉取游标失败: {e}")
+    return None
+
+
+def save_ingest_cursor(cursor):
+    """保存增量拉取游标（先写临时文件再替换，避免写一半）"""
+    if not cursor:
+        return
+    try:
+        tmp = INGEST_CURSOR_FILE + ".tmp"
+        with open(tmp, 'w') as f:
+            json.dump({"timestamp": cursor["timestamp"], "tx_hashes": sorted(cursor["tx_hashes"])}, f)
+        os.replace(tmp, INGEST_CURSOR_FILE)
+    except Exception as e:
+        print(f"⚠️ 保存拉取游标失败: {e}")
+
+
+def _trade_timestamp(trade):
+    try:
+        return int(float(trade.get('timestamp') or 0))
+    except (TypeError, ValueError):
+        return 0
+
+
+def is_before_cursor(trade, cursor):
+    """判断交易是否已在上次运行中处理过（早于或等于游标）"""
+    if not cursor:
+        return False
+    ts = _trade_timestamp(trade)
+    if ts != cursor["timestamp"]:
+        return ts < cursor["timestamp"]
+    return trade.get('transactionHash', '') in cursor["tx_hashes"]
+
+
+def advance_cursor(cursor, trades):
+    """根据本次拉取到的交易计算新的游标"""
+    if not trades:
+        return cursor
+    newest = max(_trade_timestamp(t) for t in trades)
+    if cursor and newest < cursor["timestamp"]:
+        return cursor
+    tx_hashes = {t.get('transactionHash', '') for t in trades if _trade_timestamp(t) == newest}
+    if cursor and newest == cursor["timestamp"]:
+        tx_hashes |= cursor["tx_hashes"]
+    return {"timestamp": newest, "tx_hashes": tx_hashes}
+
+
+def fetch_new_trades(cursor, page_size=None, max_pages=None, min_bet=None):
+    """分页拉取游标之后的全部新交易（从新到旧），没有游标时只拉取第一页"""
+    min_bet = MIN_BET_USD if min_bet is None else min_bet
+    page_size = page_size or TRADES_PAGE_SIZE
+    max_pages = max_pages or TRADES_MAX_PAGES
+    trades = []
+    seen = set()
+    for page in range(max_pages):
+        params = {"limit": page_size, "offset": page * page_size, "filterType": "CASH",
+                  "filterAmount": min_bet, "takerOnly": "true"}
+        response = http_get(f"{DATA_API_URL}/trades", params=params, timeout=15)
+        batch = response.json()
+        if not batch:
+            break
         
-        # 如果文件存在，追加；否则创建新文件
-        if os.path.exists(CSV_FILE):
-            existing_df = pd.read_csv(CSV_FILE)
-            df = pd.concat([existing_df, new_row], ignore_index=True)
-        else:
-            df = new_row
+        reached_cursor = False
+        for t in batch:
+            if is_before_cursor(t, cursor):
+                reached_cursor = True
+                continue
+            # 翻页期间有新交易插入会导致页间重复
+            key = generate_trade_id(t)
+            if key not in seen:
+                seen.add(key)
+                trades.append(t)
         
-        # 保存到CSV
-        df.to_csv(CSV_FILE, index=False, encoding='utf-8-sig')
-        print(f"✅ 已保存到CSV: {CSV_FILE}")
+        if cursor is None or reached_cursor or len(batch) < page_size:
+            break
+    else:
+        print(f"⚠️ 已达到最大页数 {max_pages}，更早的新交易将在下次运行时无法补齐")
+    
+    print(f"📥 拉取到 {len(trades)} 笔新交易 (共 {page + 1} 页)")
+    return trades
+
+
+class CsvAlertSink:
+    """追加写入的警报 CSV，每次运行只打开一次文件，逐行写入"""
+
+    def __init__(self, path=None, roll_daily=None):
+        self.base_path = path or CSV_FILE
+        self.roll_daily = CSV_ROLL_DAILY if roll_daily is None else roll_daily
+        self.path = None
+        self._file = None
+        self._writer = None
+
+    def _path_for(self, now):
+        if not self.roll_daily:
+            return self.base_path
+        stem, ext = os.path.splitext(self.base_path)
+        return f"{stem}_{now.strftime('%Y-%m-%d')}{ext}"
+
+    def _open(self, path, fieldnames):
+        self.close()
+        header = None
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            # 已有文件沿用原表头，只追加数据行
+            with open(path, "r", newline="", encoding="utf-8-sig") as f:
+                header = next(csv.reader(f), None)
+            missing = [name for name in fieldnames if name not in (header or [])]
+            if header and missing:
+                header = self._extend_header(path, header, missing)
+        self._file = open(path, "a", newline="", encoding="utf-8-sig")
+        self._writer = csv.DictWriter(self._file, fieldnames=header or fieldnames, restval="", extrasaction="ignore")
+        if not header:
+            self._writer.writeheader()
+        self.path = path
+
+    @staticmethod
+    def _extend_header(path, header, missing):
+        """已有文件缺少新增的列时重写一次：表头末尾加上新列，旧数据行的新列留空"""
+        header = header + missing
+        tmp_path = f"{path}.tmp"
+        with open(path, "r", newline="", encoding="utf-8-sig") as src, \
+                open(tmp_path, "w", newline="", encoding="utf-8-sig") as dst:
+            reader = csv.reader(src)
+            next(reader, None)
+            writer = csv.writer(dst)
+            writer.writerow(header)
+            writer.writerows(row + [""] * (len(header) - len(row)) for row in reader)
+            dst.flush()
+            os.fsync(dst.fileno())
+        os.replace(tmp_path, path)
+        print(f"🗂️ {path} 新增列: {', '.join(missing)}")
+        return header
+
+    def write(self, row):
+        """追加一行警报"""
+        path = self._path_for(datetime.now(timezone.utc))
+        if path != self.path or any(key not in self._writer.fieldnames for key in row):
+            self._open(path, list(row.keys()))
+        self._writer.writerow(row)
+        self._file.flush()
+
+    def flush(self):
+        """刷新到磁盘"""
+        if self._file:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        if self._file:
+            self.flush()
+            self._file.close()
+        self._file = None
+        self._writer = None
+        self.path = None
+
+
+def save_to_csv(alert_data, sink=None):
+    """保存警报到CSV文件"""
+    try:
+        if sink is None:
+            sink = CsvAlertSink()
+            try:
+                sink.write(alert_data)
+            finally:
+                sink.close()
+        else:
+            sink.write(alert_data)
+        debug(f"✅ 已保存到CSV: {sink.path or sink.base_path}")
         return True
     except Exception as e:
         print(f"❌ 保存CSV失败: {e}")
         return False
 
 
-def save_to_google_sheets(alert_data):
-    """保存警报到 Google Sheets（通过 Apps Script Web App）"""
-    if not GOOGLE_SHEETS_WEBHOOK:
-        print("⚠️ Google Sheets: 未配置 GOOGLE_SHEETS_WEBHOOK")
-        return False
-    
+def _sheets_request(payload, label):
+    """POST 到 Google Sheets Web App，返回 (状态码, 解析后的 JSON)
+
+    请求失败时返回 (None, None)，响应不是 JSON 时 JSON 为 None。
+    """
     try:
-        print(f"📤 正在发送数据到 Google Sheets...")
-        print(f"   URL: {GOOGLE_SHEETS_WEBHOOK[:50]}...")
+        print(f"📤 正在发送数据到 Google Sheets ({label})...")
+        debug(f"   URL: {GOOGLE_SHEETS_WEBHOOK[:50]}...")
         
-        response = requests.post(
+        response = http_post(
             GOOGLE_SHEETS_WEBHOOK,
-            json=alert_data,
+            json=payload,
             headers={"Content-Type": "application/json"},
-            timeout=15
+            timeout=GOOGLE_SHEETS_TIMEOUT,
+            # Apps Script 超时后往往已经写入了这批行，重发会产生重复行；失败的行留在队列中由下次运行重试
+            max_retries=0,
         )
         
-        print(f"   状态码: {response.status_code}")
-        print(f"   响应: {response.text[:200]}")
+        debug(f"   状态码: {response.status_code}")
+        debug(f"   响应: {response.text[:200]}")
         
-        if response.status_code == 200:
-            try:
-                result = response.json()
-                if result.get("status") == "success":
-                    print(f"✅ 已保存到 Google Sheets")
-                    return True
-                else:
-                    print(f"⚠️ Google Sheets 返回错误: {result.get('message', 'unknown')}")
-                    return False
-            except:
-                # 即使无法解析 JSON，状态码 200 也算成功
-                print(f"✅ 已保存到 Google Sheets (状态码 200)")
-                return True
-        else:
+        if response.status_code != 200:
             print(f"⚠️ Google Sheets 保存失败: HTTP {response.status_code}")
             print(f"   响应内容: {response.text[:500]}")
-            return False
+            return response.status_code, None
+        try:
+            return 200, response.json()
+        except ValueError:
+            return 200, None
     except requests.exceptions.Timeout:
         print(f"⚠️ Google Sheets 请求超时")
-        return False
+        return None, None
     except Exception as e:
         print(f"⚠️ Google Sheets 保存失败: {e}")
         import traceback
         traceback.print_exc()
+        return None, None
+
+
+def post_to_google_sheets(row):
+    """POST 单行到 Google Sheets Web App，返回是否成功"""
+    status, result = _sheets_request(row, "1 行")
+    if status != 200:
         return False
+    if result is None:
+        # 单行请求：即使无法解析 JSON，状态码 200 也算成功
+        print(f"✅ 已保存到 Google Sheets (状态码 200)")
+        return True
+    if isinstance(result, dict) and result.get("status") == "success":
+        print(f"✅ 已保存到 Google Sheets")
+        return True
+    print(f"⚠️ Google Sheets 返回错误: {result.get('message', 'unknown') if isinstance(result, dict) else result}")
+    return False
 
 
-def get_user_profile(address):
-    """获取显示名称和创建时间（通过第一笔交易时间估算）"""
-    try:
-        res = requests.get(f"{DATA_API_URL}/activity?user={address}&limit=1000", timeout=10)
-        if res.status_code == 200:
-            data = res.json()
-            if data and len(data) > 0:
-                earliest_trade = None
-                earliest_time = None
-                
-                for trade in data:
-                    time_str = (trade.get('timestamp') or 
-                               trade.get('time') or 
-                               trade.get('createdAt') or
-                               trade.get('created_at') or
-                               trade.get('date') or
-                               trade.get('blockTimestamp'))
-                    
-                    if time_str:
-                        dt = parse_timestamp(time_str)
-                        if dt:
-                            if earliest_time is None or dt < earliest_time:
-                                earliest_time = dt
-                                earliest_trade = trade
-                
-                if earliest_trade and earliest_time:
-                    print(f"✅ DEBUG - 找到最早交易时间: {earliest_time}")
-                    display_name = (earliest_trade.get('user') or 
-                                   earliest_trade.get('username') or 
-                                   earliest_trade.get('displayName') or 
-                                   address)
-                    return {"name": display_name, "created_at": earliest_time}
-        
-        print(f"⚠️ DEBUG - activity API 无数据，尝试从 trades API 获取...")
-        res2 = requests.get(f"{DATA_API_URL}/trades?user={address}&limit=1000", timeout=10)
-        if res2.status_code == 200:
-            trades = res2.json()
-            if trades and len(trades) > 0:
-                earliest_trade = None
-                earliest_time = None
-                
-                for trade in trades:
-                    time_str = (trade.get('timestamp') or 
-                               trade.get('time') or 
-                               trade.get('createdAt') or
-                               trade.get('created_at') or
-                               trade.get('blockTimestamp'))
-                    
-                    if time_str:
-                        dt = parse_timestamp(time_str)
-                        if dt:
-                            if earliest_time is None or dt < earliest_time:
-                                earliest_time = dt
-                                earliest_trade = trade
-                
-                if earliest_time:
-                    print(f"✅ DEBUG - 从第一笔交易获取创建时间: {earliest_time}")
-                    return {"name": address, "created_at": earliest_time}
-        
-    except Exception as e:
-        print(f"⚠️ 获取用户 Profile 失败 ({address}): {e}")
-        import traceback
-        traceback.print_exc()
-    
-    print(f"⚠️ DEBUG - 无法获取账号创建时间，使用默认值")
-    return {"name": address, "created_at": None}
+def post_sheets_batch(rows):
+    """POST 一批行（{"rows": [...]}），返回 True（已确认写入）、False（失败）或 None（脚本不支持批量）
 
+    只有返回的 count（加上按 trade_id 跳过的 skipped）等于本批行数才算写入成功；
+    旧版单行脚本会把整批当作一行写入并照样返回 success，但不返回 count。
+    """
+    status, result = _sheets_request({"rows": rows}, f"{len(rows)} 行")
+    if status != 200:
+        return False
+    if not isinstance(result, dict):
+        print(f"⚠️ Google Sheets 批量写入的响应无法解析，保留在队列中")
+        return False
+    if result.get("status") != "success":
+        print(f"⚠️ Google Sheets 返回错误: {result.get('message', 'unknown')}")
+        return False
+    if "count" not in result:
+        return None
+    confirmed = (result.get("count") or 0) + (result.get("skipped") or 0)
+    if confirmed != len(rows):
+        print(f"⚠️ Google Sheets 只确认了 {confirmed}/{len(rows)} 行，保留在队列中")
+        return False
+    print(f"✅ 已保存到 Google Sheets ({result['count']} 行{', 跳过已写入的 %d 行' % result['skipped'] if result.get('skipped') else ''})")
+    return True
 
-def get_user_trade_count(address):
-    """获取用户历史交易总数"""
-    try:
-        # 尝试从 profile API 获取交易次数
-        profile_url = f"https://polymarket.com/api/profile/{address}"
-        res = requests.get(profile_url, timeout=10)
-        if res.status_code == 200:
-            data = res.json()
-            # 尝试从 profile 数据中获取交易数
-            if isinstance(data, dict):
-                # 可能的字段名
-                trade_count = (data.get('tradesCount') or 
-                              data.get('trades_count') or 
-                              data.get('totalTrades') or
-                              data.get('numTrades') or
-                              data.get('positionsCount') or
-                              data.get('positions_count'))
-                if trade_count is not None:
-                    print(f"✅ DEBUG - 从 profile API 获取交易次数: {trade_count}")
-                    return int(trade_count)
-        
-        # 备用方案：查询多页交易数据来估算
-        total_count = 0
-        cursor = None
-        max_pages = 10  # 最多查询10页，避免超时
+
+class SheetsSpool:
+    """Google Sheets 批量写入队列
+
+    警报先追加到本地 spool 文件（JSON Lines），flush 时按批合并成一次请求发送；
+    发送失败的行留在文件里，下次运行继续重试。Web App 的响应没有 count（仍是旧版单行脚本）时，
+    本进程之后改为逐行发送。
+    """
+
+    def __init__(self, path=None, batch_size=None):
+        self.path = path or SHEETS_SPOOL_FILE
+        self.batch_size = batch_size or SHEETS_BATCH_SIZE
+        self.single_rows = False
+        self._file = None
+
+    def add(self, row):
+        """追加一行到 spool 文件"""
+        if self._file is None:
+            self._file = open(self.path, "a", encoding="utf-8")
+        self._file.write(json.dumps(row, ensure_ascii=False) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def pending(self):
+        """读取所有待发送的行（包括之前运行遗留的）"""
+        if not os.path.exists(self.path):
+            return []
+        rows = []
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    try:
+                        rows.append(json.loads(line))
+                    except ValueError:
+                        print(f"⚠️ Google Sheets spool 中有无法解析的行，已跳过")
+        return rows
+
+    def _rewrite(self, rows):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+    def flush(self):
+        """按批发送全部待发送的行，返回是否全部发送成功"""
+        self.close()
+        rows = self.pending()
+        if not rows:
+            return True
+        if not GOOGLE_SHEETS_WEBHOOK:
+            print("⚠️ Google Sheets: 未配置 GOOGLE_SHEETS_WEBHOOK")
+            return False
         
-        for page in range(max_pages):
-            url = f"{DATA_API_URL}/activity?user={address}&limit=500"
-            if cursor:
-                url += f"&cursor={cursor}"
-            
-            res = requests.get(url, timeout=10)
-            if res.status_code != 200:
-                break
-                
-            data = res.json()
-            if not data or len(data) == 0:
-                break
-            
-            total_count += len(data)
-            
-            # 如果返回的数据少于 limit，说明已经到最后一页
-            if len(data) < 500:
-                break
-            
-            # 获取下一页的 cursor（如果 API 支持）
-            # 通常是最后一条记录的某个字段
-            if isinstance(data, list) and len(data) > 0:
-                last_item = data[-1]
-                cursor = last_item.get('id') or last_item.get('cursor')
-                if not cursor:
-                    # 如果没有 cursor，使用偏移量
+        sent = 0
+        while sent < len(rows):
+            if self.single_rows:
+                if not post_to_google_sheets(rows[sent]):
                     break
+                sent += 1
+                continue
+            batch = rows[sent:sent + self.batch_size]
+            result = post_sheets_batch(batch)
+            if result is None:
+                print("⚠️ Google Sheets 响应中没有 count，Apps Script 可能还是旧版（不支持批量），改为逐行发送；"
+                      "更新并重新部署 GOOGLE_SHEETS_SETUP.md 中的脚本后可恢复批量写入")
+                self.single_rows = True
+                continue
+            if not result:
+                break
+            sent += len(batch)
         
-        if total_count > 0:
-            print(f"✅ DEBUG - 从 activity API 统计交易次数: {total_count}+")
-            return total_count
-        
-        # 最后备用：从 trades API 获取
-        res = requests.get(f"{DATA_API_URL}/trades?user={address}&limit=500", timeout=10)
-        if res.status_code == 200:
-            trades = res.json()
-            if trades:
-                print(f"✅ DEBUG - 从 trades API 统计交易次数: {len(trades)}+")
-                return len(trades)
-                
-    except Exception as e:
-        print(f"⚠️ DEBUG - 获取交易次数失败: {e}")
-        return 99  # 报错则返回较大值，避免误报
-    return 0
+        remaining = rows[sent:]
+        if remaining:
+            self._rewrite(remaining)
+            print(f"⚠️ Google Sheets: {len(remaining)} 行未发送，下次运行重试")
+        else:
+            os.remove(self.path)
+        return not remaining
 
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
 
-def send_instant_alert(trade_info, profile, bet_count, category):
-    """发送即时报警"""
-    if not TELEGRAM_TOKEN:
-        print("❌ 错误: 未设置 TELEGRAM_TOKEN 环境变量")
-        return False
 
-    age_str = "未知"
-    if profile['created_at']:
-        days = (datetime.now(timezone.utc) - profile['created_at']).days
-        age_str = f"{days} 天"
+def save_to_google_sheets(alert_data, spool=None):
+    """保存警报到 Google Sheets（通过 Apps Script Web App）
 
-    # 根据类别选择emoji
-    category_emoji = {
-        "政治": "🏛️",
-        "Crypto": "₿",
-        "体育": "⚽",
-        "传统金融": "📈",
-        "其他": "❓"
-    }
+    传入 spool 时只写入本地队列，由 spool.flush() 统一批量发送。
+    """
+    if not GOOGLE_SHEETS_WEBHOOK:
+        print("⚠️ Google Sheets: 未配置 GOOGLE_SHEETS_WEBHOOK")
+        return False
     
-    emoji = category_emoji.get(category, "❓")
+    if spool is not None:
+        spool.add(alert_data)
+        debug(f"📝 已加入 Google Sheets 待发送队列")
+        return True
+    return post_to_google_sheets(alert_data)
 
-    # 格式化概率显示
-    price_str = f"{trade_info.get('price_percent')}%" if trade_info.get('price_percent') is not None else "未知"
-    
-    msg = (
-        f"🚨 *疑似内幕交易警报* 🚨\n"
-        f"━━━━━━━━━━━━━━━\n"
-        f"💰 投注金额: `${trade_info['bet_size']}` USDC\n"
-        f"👤 用户: `{profile['name']}`\n"
-        f"📅 账号年龄: `{age_str}`\n"
-        f"📊 历史笔数: `{bet_count}` 次\n"
-        f"🎯 预测结果: *{trade_info['outcome']}*\n"
-        f"↕️ 方向: *{trade_info.get('side', '未知')}*\n"
-        f"📈 买入概率: `{price_str}`\n"
-        f"🏟️ 市场: {trade_info['market']}\n"
-        f"🎲 市场类型: *{trade_info.get('market_type', '未知')}*\n"
-        f"{emoji} 类别: *{category}*\n"
-        f"━━━━━━━━━━━━━━━\n"
-        f"🔍 *特征*: 疑似新账号/低频账号大额交易"
-    )
 
-    url = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendMessage"
-    r = requests.post(url, json={"chat_id": CHAT_ID, "text": msg, "parse_mode": "Markdown"})
-    if r.status_code != 200:
-        print(f"❌ Telegram 发送失败: {r.text}")
-        return False
-    else:
-        print(f"✅ 成功推送交易: {profile['name']}")
+class WalletCache:
+    """钱包信息缓存（SQLite），按 proxyWallet 保存首笔交易时间、显示名称和交易次数"""
+
+    def __init__(self, path=None, first_seen_ttl=None, trade_count_ttl=None, max_entries=None):
+        self.path = path or STATE_DB_FILE
+        self.first_seen_ttl = WALLET_FIRST_SEEN_TTL if first_seen_ttl is None else first_seen_ttl
+        self.trade_count_ttl = WALLET_TRADE_COUNT_TTL if trade_count_ttl is None else trade_count_ttl
+        self.max_entries = WALLET_CACHE_MAX_ENTRIES if max_entries is None else max_entries
+        self.counters = {"profile_hit": 0, "profile_miss": 0, "count_hit": 0, "count_miss": 0, "evicted": 0}
+        self._lock = threading.Lock()
+        self._conn = _connect_state_db(self.path)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS wallet_cache (
+                address TEXT PRIMARY KEY,
+                name TEXT,
+                first_seen REAL,
+                first_seen_at REAL,
+                trade_count INTEGER,
+                trade_count_at REAL,
+                last_access REAL
+            )"""
+        )
+        # trade_count_exact = 0 表示只知道交易数至少为 trade_count；
+        # first_seen_exact = 0 表示首笔时间只是估算值（旧版本写入），不再作为缓存命中
+        for column in ("trade_count_exact INTEGER DEFAULT 1", "first_seen_exact INTEGER DEFAULT 0"):
+            try:
+                self._conn.execute(f"ALTER TABLE wallet_cache ADD COLUMN {column}")
+            except sqlite3.OperationalError:
+                pass
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_wallet_cache_access ON wallet_cache (last_access)")
+        self._conn.commit()
+
+    def _fresh(self, fetched_at, ttl, now):
+        return fetched_at is not None and (ttl <= 0 or now - fetched_at < ttl)
+
+    def _touch(self, address, now):
+        self._conn.execute("UPDATE wallet_cache SET last_access = ? WHERE address = ?", (now, address))
+        self._conn.commit()
+
+    def get_profile(self, address):
+        """读取缓存的 Profile，未命中或已过期返回 None"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT name, first_seen, first_seen_at, first_seen_exact FROM wallet_cache WHERE address = ?", (address,)
+            ).fetchone()
+            if row and row[1] is not None and row[3] and self._fresh(row[2], self.first_seen_ttl, now):
+                self.counters["profile_hit"] += 1
+                self._touch(address, now)
+                return {"name": row[0] or address, "created_at": datetime.fromtimestamp(row[1], tz=timezone.utc)}
+            self.counters["profile_miss"] += 1
+        return None
+
+    def put_profile(self, address, profile, exact=True):
+        """写入 Profile（只缓存确切查到首笔活动时间的结果）"""
+        if not exact or not profile or not profile.get("created_at"):
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                """INSERT INTO wallet_cache (address, name, first_seen, first_seen_at, first_seen_exact, last_access)
+                VALUES (?, ?, ?, ?, 1, ?)
+                ON CONFLICT(address) DO UPDATE SET
+                    name = excluded.name, first_seen = excluded.first_seen, first_seen_at = excluded.first_seen_at,
+                    first_seen_exact = 1, last_access = excluded.last_access""",
+                (address, profile.get("name"), profile["created_at"].timestamp(), now, now),
+            )
+            self._conn.commit()
+
+    def get_trade_count(self, address, at_least=None):
+        """读取缓存的交易次数，未命中、已过期或精度不够时返回 None
+
+        at_least 为 None 时需要精确值；否则缓存的下限值达到 at_least 也算命中。
+        """
+        entry = self.get_trade_count_entry(address, at_least)
+        return entry[0] if entry else None
+
+    def get_trade_count_entry(self, address, at_least=None):
+        """同 get_trade_count，命中时返回 (交易次数, 查询时间)"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT trade_count, trade_count_at, trade_count_exact FROM wallet_cache WHERE address = ?", (address,)
+            ).fetchone()
+            if row and row[0] is not None and self._fresh(row[1], self.trade_count_ttl, now):
+                if row[2] or (at_least is not None and row[0] >= at_least):
+                    self.counters["count_hit"] += 1
+                    self._touch(address, now)
+                    return row[0], row[1]
+            self.counters["count_miss"] += 1
+        return None
+
+    def put_trade_count(self, address, count, exact=True):
+        """写入交易次数（exact=False 表示只是下限）"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                """INSERT INTO wallet_cache (address, trade_count, trade_count_at, trade_count_exact, last_access)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(address) DO UPDATE SET
+                    trade_count = excluded.trade_count, trade_count_at = excluded.trade_count_at,
+                    trade_count_exact = excluded.trade_count_exact, last_access = excluded.last_access""",
+                (address, int(count), now, 1 if exact else 0, now),
+            )
+            self._conn.commit()
+
+    def evict(self):
+        """按最近访问时间淘汰超出上限的条目"""
+        if self.max_entries <= 0:
+            return 0
+        with self._lock:
+            cur = self._conn.execute(
+                """DELETE FROM wallet_cache WHERE address IN (
+                    SELECT address FROM wallet_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?
+                )""",
+                (self.max_entries,),
+            )
+            self._conn.commit()
+            self.counters["evicted"] += cur.rowcount
+            return cur.rowcount
+
+    def stats(self):
+        """返回命中/未命中统计"""
+        with self._lock:
+            return dict(self.counters)
+
+    def close(self):
+        self.evict()
+        with self._lock:
+            self._conn.close()
+
+
+def _record_time(record):
+    """取活动/交易记录的时间"""
+    time_str = (record.get('timestamp') or 
+               record.get('time') or 
+               record.get('createdAt') or
+               record.get('created_at') or
+               record.get('date') or
+               record.get('blockTimestamp'))
+    return parse_timestamp(time_str) if time_str else None
+
+
+def _record_name(record):
+    """取活动/交易记录中的显示名称"""
+    return (record.get('name') or
+            record.get('user') or 
+            record.get('username') or 
+            record.get('displayName') or
+            record.get('pseudonym'))
+
+
+class WalletSnapshot:
+    """单个钱包的活动快照：同一批活动记录一次遍历得出最早时间、显示名称和交易笔数
+
+    trade_count 为 None 表示查询失败；count_exact 为 False 表示只是下限；
+    created_exact 为 False 表示 created_at 只是已拉取记录中的最早时间（估算）。
+    """
+
+    __slots__ = ("address", "name", "created_at", "created_exact", "trade_count", "count_exact")
+
+    def __init__(self, address, name=None, created_at=None, trade_count=None, count_exact=True, created_exact=False):
+        self.address = address
+        self.name = name or address
+        self.created_at = created_at
+        self.created_exact = created_exact
+        self.trade_count = trade_count
+        self.count_exact = count_exact
+
+    @classmethod
+    def from_records(cls, address, records, complete):
+        """从活动记录构建快照，complete 表示已经拿到了该钱包的全部记录"""
+        earliest_time = None
+        earliest_name = None
+        latest_name = None
+        for record in records:
+            name = _record_name(record)
+            if name and latest_name is None:
+                latest_name = name
+            dt = _record_time(record)
+            if dt and (earliest_time is None or dt < earliest_time):
+                earliest_time = dt
+                earliest_name = name
+        # 当前显示名称以最新记录为准
+        return cls(address, latest_name or earliest_name, earliest_time, len(records), complete, created_exact=complete)
+
+    def profile(self):
+        """兼容旧接口的 Profile 字典"""
+        return {"name": self.name, "created_at": self.created_at}
+
+
+def _fetch_activity_pages(endpoint, address, page_size, max_pages):
+    """按 offset 分页拉取钱包的活动/交易记录，返回 (记录列表, 是否已拉完, 是否请求失败)
+
+    请求失败（重试后仍非 200）和“没有记录”要区分开：失败时已拉到的记录只能作为下限。
+    """
+    records = []
+    for page in range(max_pages):
+        res = http_get(f"{DATA_API_URL}/{endpoint}",
+                       params={"user": address, "limit": page_size, "offset": page * page_size}, timeout=10)
+        if res.status_code != 200:
+            debug(f"⚠️ {endpoint} API 返回 {res.status_code}")
+            return records, False, True
+        data = res.json()
+        if not data:
+            return records, True, False
+        records.extend(data)
+        # 如果返回的数据少于 limit，说明已经到最后一页
+        if len(data) < page_size:
+            return records, True, False
+    return records, False, False
+
+
+def _probe_record(endpoint, address, offset):
+    """取按时间倒序排列的第 offset 条记录，不存在返回 None"""
+    res = http_get(f"{DATA_API_URL}/{endpoint}", params={"user": address, "limit": 1, "offset": offset}, timeout=10)
+    res.raise_for_status()
+    data = res.json()
+    return data[0] if data else None
+
+
+def _find_oldest_by_offset(endpoint, address, known):
+    """倍增 + 二分 offset，找到最后一条（最早的）记录，返回 (时间, 是否确切)
+
+    known 为已知存在的记录条数；超过 FIRST_ACTIVITY_MAX_OFFSET 时返回该位置的记录时间（估算）。
+    """
+    lo = max(0, known - 1)
+    lo_record = None
+    hi = None
+    offset = max(1, known)
+    while offset <= FIRST_ACTIVITY_MAX_OFFSET:
+        record = _probe_record(endpoint, address, offset)
+        if record is None:
+            hi = offset
+            break
+        lo, lo_record = offset, record
+        offset *= 2
+    if hi is None:
+        offset = FIRST_ACTIVITY_MAX_OFFSET
+        record = _probe_record(endpoint, address, offset) if lo < offset else lo_record
+        if record is not None:
+            return _record_time(record), False
+        hi = offset
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        record = _probe_record(endpoint, address, mid)
+        if record is None:
+            hi = mid
+        else:
+            lo, lo_record = mid, record
+    if lo_record is None:
+        lo_record = _probe_record(endpoint, address, lo)
+    return (_record_time(lo_record), True) if lo_record else (None, False)
+
+
+def fetch_first_activity_time(endpoint, address, recent):
+    """直接查询钱包最早一笔活动的时间，返回 (时间, 是否确切)
+
+    优先用升序排序只取 1 条；recent 是同一钱包按时间倒序的最新一页记录，用来校验
+    API 确实按升序返回（结果不能晚于这一页里最早的记录），否则改用 offset 查找。
+    """
+    times = [dt for dt in (_record_time(r) for r in recent) if dt]
+    newest_page_min = min(times) if times else None
+    if endpoint == "activity":
+        res = http_get(f"{DATA_API_URL}/activity",
+                       params={"user": address, "limit": 1, "sortBy": "TIMESTAMP", "sortDirection": "ASC"}, timeout=10)
+        if res.status_code == 200:
+            data = res.json()
+            dt = _record_time(data[0]) if data else None
+            if dt and (newest_page_min is None or dt <= newest_page_min):
+                return dt, True
+        debug(f"⚠️ 升序查询不可用，改用 offset 查找最早记录")
+        METRICS.incr("first_activity_offset_fallback")
+    return _find_oldest_by_offset(endpoint, address, len(recent))
+
+
+def fetch_wallet_snapshot(address, at_least=None, need_created=True, page_size=None, max_pages=None):
+    """拉取钱包活动记录生成 WalletSnapshot（activity 无数据时改用 trades）
+
+    - at_least: 只需判断交易数是否达到该值时，只取一页 at_least 条
+    - need_created: 是否需要账号创建时间；记录没拉完时直接查询最早一笔活动
+    """
+    page_size = page_size or WALLET_ACTIVITY_PAGE_SIZE
+    max_pages = max_pages or WALLET_ACTIVITY_MAX_PAGES
+    if at_least:
+        page_size, max_pages = at_least, 1
+    try:
+        failed = False
+        for endpoint in ("activity", "trades"):
+            records, complete, error = _fetch_activity_pages(endpoint, address, page_size, max_pages)
+            failed = failed or error
+            if records:
+                # 前一个来源（activity）请求失败时，trades 的记录不含其他活动，只能作为下限和估算
+                snapshot = WalletSnapshot.from_records(address, records, complete and not failed)
+                if need_created and not complete:
+                    try:
+                        created_at, exact = fetch_first_activity_time(endpoint, address, records)
+                    except Exception as e:
+                        # 探测最早记录失败不影响已拉到的记录，最早时间保留为估算值
+                        debug(f"⚠️ 查询最早活动失败 ({address}): {e}")
+                        METRICS.incr("first_activity_failed")
+                        created_at = None
+                    if created_at:
+                        snapshot.created_at, snapshot.created_exact = created_at, exact and not failed
+                if snapshot.created_at:
+                    debug(f"✅ 找到最早交易时间: {snapshot.created_at}{'' if snapshot.created_exact else ' (估算)'}")
+                debug(f"✅ 从 {endpoint} API 统计交易次数: {snapshot.trade_count}{'' if complete else '+'}")
+                return snapshot
+            debug(f"⚠️ {endpoint} API {'请求失败' if error else '无数据'}")
+        if failed:
+            # 接口故障不能当作“没有任何活动”的新钱包，否则会误报并被缓存
+            METRICS.incr("wallet_lookup_failed")
+            print(f"⚠️ 获取钱包活动失败 ({address})，本次按未知处理")
+            return WalletSnapshot(address)
+        return WalletSnapshot(address, trade_count=0)
+    except Exception as e:
+        print(f"⚠️ 获取钱包活动失败 ({address}): {e}")
+        import traceback
+        traceback.print_exc()
+        METRICS.incr("wallet_lookup_failed")
+        return WalletSnapshot(address)
+
+
+def get_wallet_snapshot(address, cache=None, at_least=None, need_created=True, index=None):
+    """获取钱包快照：依次查询钱包索引、钱包缓存，缺什么查什么
+
+    - 钱包索引能回答（见 wallet_index.WalletIndex.lookup）：不读缓存，不发请求
+    - Profile 和交易数都命中缓存：不发请求
+    - 只缺交易数且只需判断阈值（at_least）：只取一页 at_least 条记录
+    - 缺 Profile：取最新一页记录（笔数、名称）+ 直接查询最早一笔活动（账号年龄）
+    - need_created=False：不需要账号年龄，不查询最早一笔活动，也不报告估算的创建时间
+    """
+    if index is not None:
+        local = index.lookup(address, at_least, need_created)
+        if local is not None:
+            name, first_seen, count, count_exact = local
+            created_at = datetime.fromtimestamp(first_seen, tz=timezone.utc) if first_seen is not None else None
+            return WalletSnapshot(address, name, created_at, count, count_exact, created_exact=first_seen is not None)
+    
+    profile = cache.get_profile(address) if cache is not None else None
+    entry = cache.get_trade_count_entry(address, at_least) if cache is not None else None
+    if entry is not None and (profile is not None or not need_created):
+        count, count_at = entry
+        name, created_at = (profile["name"], profile["created_at"]) if profile is not None else (None, None)
+        snapshot = WalletSnapshot(address, name, created_at, count,
+                                  at_least is None or count < at_least, created_exact=profile is not None)
+        _seed_wallet_index(index, snapshot, fetched=False, count_at=count_at)
+        return snapshot
+    
+    snapshot = fetch_wallet_snapshot(address, at_least=at_least, need_created=need_created and profile is None)
+    if snapshot.trade_count is None:
+        # 查询失败：不写入钱包缓存和索引，下次重新查询
+        if profile is not None:
+            snapshot.name, snapshot.created_at, snapshot.created_exact = profile["name"], profile["created_at"], True
+        return snapshot
+    if profile is not None:
+        snapshot.name, snapshot.created_at, snapshot.created_exact = profile["name"], profile["created_at"], True
+    elif not need_created and not snapshot.created_exact:
+        snapshot.created_at = None
+    
+    if cache is not None:
+        cache.put_profile(address, snapshot.profile(), snapshot.created_exact)
+        if snapshot.trade_count is not None:
+            cache.put_trade_count(address, snapshot.trade_count, snapshot.count_exact)
+    _seed_wallet_index(index, snapshot, fetched=True)
+    return snapshot
+
+
+def _seed_wallet_index(index, snapshot, fetched, count_at=None):
+    """把钱包缓存或 API 查到的结果写入钱包索引，作为之后增量累加的基线
+
+    count_at 为笔数的查询时间（来自钱包缓存时为缓存写入时间），之后的交易在基线上累加。
+    """
+    if index is None:
+        return
+    index.seed(
+        snapshot.address,
+        name=snapshot.name if snapshot.name != snapshot.address else None,
+        first_seen=snapshot.created_at.timestamp() if snapshot.created_at else None,
+        first_seen_exact=snapshot.created_exact,
+        trade_count=snapshot.trade_count,
+        count_exact=snapshot.count_exact,
+        fetched=fetched,
+        count_at=count_at,
+    )
+
+
+def get_user_profile(address, cache=None):
+    """获取显示名称和创建时间（通过最早一笔活动时间估算），优先读取钱包缓存"""
+    if cache is not None:
+        profile = cache.get_profile(address)
+        if profile is not None:
+            return profile
+    return get_wallet_snapshot(address, cache).profile()
+
+
+def get_user_trade_count(address, cache=None, at_least=None):
+    """获取用户历史交易总数，优先读取钱包缓存
+
+    指定 at_least 时只需要判断是否达到该笔数：拿到一页 at_least 条记录就停止，
+    返回值达到 at_least 时只表示“至少这么多”。
+    """
+    if cache is not None:
+        count = cache.get_trade_count(address, at_least)
+        if count is not None:
+            return count
+    snapshot = fetch_wallet_snapshot(address, at_least=at_least, need_created=False)
+    if snapshot.trade_count is None:
+        return 99  # 报错则返回较大值，避免误报（不写入缓存）
+    if cache is not None:
+        cache.put_trade_count(address, snapshot.trade_count, snapshot.count_exact)
+    return snapshot.trade_count
+
+
+def format_trade_count(count, at_least=MIN_TRADE_COUNT):
+    """按判定所需精度显示交易笔数，达到阈值时显示为 "N+"，未查询时显示为 "未知" """
+    if count is None:
+        return "未知"
+    return f"{count}+" if at_least and count >= at_least else str(count)
+
+
+def enrich_wallet(address, cache=None, at_least=None, need_created=True, index=None):
+    """查询单个钱包的 Profile 和历史交易数（at_least 见 get_user_trade_count）"""
+    snapshot = get_wallet_snapshot(address, cache, at_least, need_created, index)
+    bet_count = snapshot.trade_count
+    if bet_count is None:
+        bet_count = 99  # 报错则返回较大值，避免误报
+    return snapshot.profile(), bet_count
+
+
+def iter_enriched(candidates, max_workers=None, cache=None, at_least=None, index=None):
+    """并发查询候选交易的钱包信息，按交易原顺序产出 (candidate, profile, bet_count)
+
+    candidates 中每项需包含 "address" 字段，可以用 "at_least" / "need_created" 覆盖默认要求；
+    "need_wallet" 为 False 的候选不查询，产出 (candidate, None, None)。
+    同一钱包只查询一次，多个候选要求不同时按最严格的要求查询。
+    """
+    requirements = {}
+    for c in candidates:
+        if c.get("need_wallet") is False:
+            continue
+        need_count, need_created = c.get("at_least", at_least), c.get("need_created", True)
+        previous = requirements.get(c["address"])
+        if previous is not None:
+            need_count = None if previous[0] is None or need_count is None else max(previous[0], need_count)
+            need_created = previous[1] or need_created
+        requirements[c["address"]] = (need_count, need_created)
+    if not requirements:
+        for c in candidates:
+            yield c, None, None
+        return
+    workers = max(1, min(max_workers or ENRICH_MAX_WORKERS, len(requirements)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="enrich") as pool:
+        futures = {address: pool.submit(enrich_wallet, address, cache, need_count, need_created, index)
+                   for address, (need_count, need_created) in requirements.items()}
+        for c in candidates:
+            if c.get("need_wallet") is False:
+                yield c, None, None
+                continue
+            profile, bet_count = futures[c["address"]].result()
+            yield c, profile, bet_count
+
+
+def send_telegram_message(text, chat_id=None, max_retries=None):
+    """调用 Telegram sendMessage，返回响应"""
+    url = f"{TELEGRAM_API_URL}/bot{TELEGRAM_TOKEN}/sendMessage"
+    return http_post(url, json={"chat_id": chat_id or CHAT_ID, "text": text, "parse_mode": "Markdown"},
+                     timeout=15, max_retries=max_retries)
+
+
+class TelegramOutbox:
+    """Telegram 发送队列
+
+    由后台线程按频道限速发送（最小间隔 + 每分钟上限），遇到 429 按 retry_after 暂停，
+    遇到 5xx/网络错误指数退避重试。同一市场刚发过消息时，窗口内的后续警报会合并成
+    一条消息。关闭时仍未发出的消息写入文件，下次运行继续发送。
+    """
+
+    MAX_MESSAGE_LEN = 3800  # Telegram 单条消息上限 4096 字符，留出合并标题的余量
+
+    def __init__(self, chat_id=None, min_interval=None, per_minute=None, coalesce_window=None, path=None):
+        self.chat_id = chat_id or CHAT_ID
+        self.min_interval = TELEGRAM_MIN_INTERVAL if min_interval is None else min_interval
+        self.per_minute = TELEGRAM_PER_MINUTE if per_minute is None else per_minute
+        self.coalesce_window = TELEGRAM_COALESCE_WINDOW if coalesce_window is None else coalesce_window
+        self.path = path or TELEGRAM_OUTBOX_FILE
+        self.counters = {"sent": 0, "coalesced": 0, "rate_limited": 0, "failed": 0, "spooled": 0}
+        self._items = []
+        self._cond = threading.Condition()
+        self._closing = False
+        self._deadline = None
+        self._last_send = 0.0
+        self._recent_sends = deque()
+        self._paused_until = 0.0
+        self._last_sent_by_key = OrderedDict()  # 按发送时间排序，只保留合并窗口内发送过的 key
+        self._load_spooled()
+        self._worker = threading.Thread(target=self._run, name="telegram-outbox", daemon=True)
+        self._worker.start()
+
+    def __len__(self):
+        with self._cond:
+            return len(self._items)
+
+    def _load_spooled(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        data = json.loads(line)
+                        self._items.append(self._new_item(data["texts"], data.get("key"), 0.0))
+            print(f"📨 从 {self.path} 恢复 {len(self._items)} 条未发送的 Telegram 消息")
+        except Exception as e:
+            print(f"⚠️ 读取 Telegram 待发送消息失败: {e}")
+
+    def _new_item(self, texts, key, hold_until):
+        return {"texts": list(texts), "key": key, "hold_until": hold_until, "retry_at": 0.0, "attempts": 0}
+
+    def enqueue(self, text, key=None):
+        """放入发送队列，立即返回"""
+        now = time.monotonic()
+        with self._cond:
+            hold_until = 0.0
+            if key and self.coalesce_window > 0:
+                for item in self._items:
+                    if item["key"] == key and sum(len(t) for t in item["texts"]) + len(text) < self.MAX_MESSAGE_LEN:
+                        item["texts"].append(text)
+                        self.counters["coalesced"] += 1
+                        return
+                # 该市场刚发过消息：等到窗口结束再发，期间的同市场警报合并进来
+                last = self._last_sent_by_key.get(key)
+                if last is not None and now - last < self.coalesce_window:
+                    hold_until = last + self.coalesce_window
+            self._items.append(self._new_item([text], key, hold_until))
+            self._cond.notify()
+
+    def _rate_wait(self, now):
+        wait = max(0.0, self._paused_until - now, self._last_send + self.min_interval - now)
+        while self._recent_sends and now - self._recent_sends[0] >= 60:
+            self._recent_sends.popleft()
+        if self.per_minute > 0 and len(self._recent_sends) >= self.per_minute:
+            wait = max(wait, self._recent_sends[0] + 60 - now)
+        return wait
+
+    def _next_item(self, now):
+        """在锁内调用：返回 (可以发送的消息, None) 或 (None, 需要等待的秒数)"""
+        waits = []
+        for item in self._items:
+            ready_at = item["retry_at"] if self._closing else max(item["retry_at"], item["hold_until"])
+            if ready_at <= now:
+                rate_wait = self._rate_wait(now)
+                if rate_wait > 0:
+                    return None, rate_wait
+                return item, None
+            waits.append(ready_at - now)
+        return None, (min(waits) if waits else None)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    now = time.monotonic()
+                    if self._closing and (not self._items or now >= self._deadline):
+                        return
+                    item, wait = self._next_item(now)
+                    if item is not None:
+                        break
+                    if self._closing:
+                        wait = min(wait if wait is not None else float("inf"), self._deadline - now)
+                    self._cond.wait(wait)
+                self._items.remove(item)
+                self._last_send = now
+                self._recent_sends.append(now)
+                if item["key"]:
+                    self._last_sent_by_key[item["key"]] = now
+                    self._last_sent_by_key.move_to_end(item["key"])
+                # 超出合并窗口的 key 不再影响入队，删除，守护进程长期运行时不会无限增长
+                while self._last_sent_by_key and now - next(iter(self._last_sent_by_key.values())) >= self.coalesce_window:
+                    self._last_sent_by_key.popitem(last=False)
+            try:
+                self._deliver(item)
+            except Exception as e:
+                # 发送线程不能因为意外异常退出，否则之后的警报都会积压在队列里
+                print(f"⚠️ Telegram 发送异常: {e}")
+                self._retry(item, None)
+
+    def _render(self, texts):
+        if len(texts) == 1:
+            return texts[0]
+        return f"📦 *同一市场 {len(texts)} 笔警报*\n\n" + "\n\n".join(texts)
+
+    def _requeue(self, item, retry_at):
+        with self._cond:
+            item["retry_at"] = retry_at
+            self._items.insert(0, item)
+            self._cond.notify()
+
+    def _retry(self, item, r):
+        """按 5xx 处理：未超过 TELEGRAM_MAX_ATTEMPTS 时指数退避后重新入队，否则放弃"""
+        if item["attempts"] < TELEGRAM_MAX_ATTEMPTS:
+            self._requeue(item, time.monotonic() + min(60, 2 ** item["attempts"]))
+            return
+        self.counters["failed"] += 1
+        print(f"❌ Telegram 发送失败: {r.text if r is not None else '网络错误'}")
+
+    def _deliver(self, item):
+        item["attempts"] += 1
+        try:
+            r = send_telegram_message(self._render(item["texts"]), self.chat_id, max_retries=0)
+            status = r.status_code
+        except Exception as e:
+            # 连接错误、超时以及 ChunkedEncodingError 等其他异常都当作 5xx 退避重试
+            r, status = None, None
+            print(f"⚠️ Telegram 请求失败: {e}")
+        
+        if status == 200:
+            self.counters["sent"] += 1
+            merged = f" (合并 {len(item['texts'])} 条警报)" if len(item["texts"]) > 1 else ""
+            print(f"✅ Telegram 已发送{merged}")
+            return
+        if status == 429:
+            # 被限流：按 retry_after 暂停整个频道，这次不计入尝试次数
+            retry_after = 5
+            try:
+                retry_after = float(r.json()["parameters"]["retry_after"]) or retry_after
+            except Exception:
+                pass  # 响应不是预期的 JSON 结构时用默认值
+            self.counters["rate_limited"] += 1
+            item["attempts"] -= 1
+            with self._cond:
+                self._paused_until = time.monotonic() + retry_after
+            print(f"⏳ Telegram 限流，{retry_after}s 后重试")
+            self._requeue(item, 0.0)
+            return
+        if status is None or status >= 500:
+            self._retry(item, r)
+            return
+        # 4xx（例如消息格式错误）：放弃
+        self.counters["failed"] += 1
+        print(f"❌ Telegram 发送失败: {r.text if r is not None else '网络错误'}")
+
+    def close(self, timeout=60):
+        """发送完队列中的消息（最多等待 timeout 秒），剩余消息写入文件"""
+        with self._cond:
+            self._closing = True
+            self._deadline = time.monotonic() + timeout
+            self._cond.notify_all()
+        self._worker.join(timeout + 30)
+        with self._cond:
+            remaining = list(self._items)
+            self._items.clear()
+        try:
+            if remaining:
+                with open(self.path, "w", encoding="utf-8") as f:
+                    for item in remaining:
+                        f.write(json.dumps({"texts": item["texts"], "key": item["key"]}, ensure_ascii=False) + "\n")
+                self.counters["spooled"] = len(remaining)
+                print(f"⚠️ {len(remaining)} 条 Telegram 消息未发送，已保存到 {self.path}")
+            elif os.path.exists(self.path):
+                os.remove(self.path)
+        except Exception as e:
+            print(f"⚠️ 保存 Telegram 待发送消息失败: {e}")
+        print(f"📨 Telegram 发送统计: {self.counters}")
+
+
+def format_instant_alert(trade_info, profile, bet_count, category):
+    """生成即时报警消息文本"""
+    age_str = "未知"
+    if profile['created_at']:
+        days = (datetime.now(timezone.utc) - profile['created_at']).days
+        age_str = f"{days} 天"
+
+    # 根据类别选择emoji
+    category_emoji = {
+        "政治": "🏛️",
+        "Crypto": "₿",
+        "体育": "⚽",
+        "传统金融": "📈",
+        "其他": "❓"
+    }
+    
+    emoji = category_emoji.get(category, "❓")
+
+    # 格式化概率显示
+    price_str = f"{trade_info.get('price_percent')}%" if trade_info.get('price_percent') is not None else "未知"
+    
+    msg = (
+        f"🚨 *疑似内幕交易警报* 🚨\n"
+        f"━━━━━━━━━━━━━━━\n"
+        f"💰 投注金额: `${trade_info['bet_size']}` USDC\n"
+        f"👤 用户: `{profile['name']}`\n"
+        f"📅 账号年龄: `{age_str}`\n"
+        f"📊 历史笔数: `{format_trade_count(bet_count, trade_info.get('trade_count_at_least', MIN_TRADE_COUNT))}` 次\n"
+        f"🎯 预测结果: *{trade_info['outcome']}*\n"
+        f"↕️ 方向: *{trade_info.get('side', '未知')}*\n"
+        f"📈 买入概率: `{price_str}`\n"
+        f"🏟️ 市场: {trade_info['market']}\n"
+        f"🎲 市场类型: *{trade_info.get('market_type', '未知')}*\n"
+        f"{emoji} 类别: *{category}*\n"
+        f"{format_market_context(trade_info)}"
+        f"{format_wallet_activity(trade_info)}"
+        f"━━━━━━━━━━━━━━━\n"
+        f"🔍 *特征*: {trade_info.get('feature') or '疑似新账号/低频账号大额交易'}"
+    )
+    return msg
+
+
+def format_market_context(trade_info):
+    """市场背景信息（截止时间、流动性、成交量），没有元数据时为空"""
+    lines = []
+    if trade_info.get('end_date'):
+        lines.append(f"⏰ 截止: `{str(trade_info['end_date'])[:10]}`")
+    if trade_info.get('liquidity') is not None:
+        lines.append(f"💧 流动性: `${trade_info['liquidity']:,.0f}`")
+    if trade_info.get('volume') is not None:
+        lines.append(f"📊 成交量: `${trade_info['volume']:,.0f}`")
+    return "".join(f"{line}\n" for line in lines)
+
+
+def format_wallet_activity(trade_info):
+    """钱包近期活动（钱包索引统计的滚动成交额、市场数），没有统计时为空"""
+    activity = trade_info.get('wallet_activity')
+    if not activity:
+        return ""
+    return (f"🧾 近24h/7d成交: `${activity['volume_24h']:,.0f}` / `${activity['volume_7d']:,.0f}`，"
+            f"涉及 `{activity['markets_touched']}` 个市场\n")
+
+
+def send_instant_alert(trade_info, profile, bet_count, category, outbox=None):
+    """发送即时报警；传入 outbox 时放入发送队列，不阻塞扫描"""
+    if not TELEGRAM_TOKEN:
+        print("❌ 错误: 未设置 TELEGRAM_TOKEN 环境变量")
+        return False
+
+    msg = format_instant_alert(trade_info, profile, bet_count, category)
+    if outbox is not None:
+        outbox.enqueue(msg, key=trade_info['market'])
+        debug(f"📨 已加入 Telegram 发送队列: {profile['name']}")
+        return True
+
+    r = send_telegram_message(msg)
+    if r.status_code != 200:
+        print(f"❌ Telegram 发送失败: {r.text}")
+        return False
+    else:
+        print(f"✅ 成功推送交易: {profile['name']}")
         return True
 
 
-def send_hourly_summary(category_counts, total_count):
-    """发送每小时汇总报告"""
+def send_hourly_summary(window, outbox=None, day_window=None):
+    """发送每小时汇总报告，已发送或加入发送队列时返回 True
+
+    window / day_window 为 AlertStats.window() 的结果（上次汇总以来 / 最近 24 小时），
+    由持久化的分桶计数得出，不依赖本次运行拉取到的交易。
+    """
+    total_count = window["alerts"]
     if not TELEGRAM_TOKEN or total_count == 0:
-        return
+        return False
     
     now = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:00 UTC")
     
     summary_lines = []
-    for category, count in sorted(category_counts.items(), key=lambda x: -x[1]):
+    for category, count in sorted(window["categories"].items(), key=lambda x: -x[1]):
         if count > 0:
             emoji = {"政治": "🏛️", "Crypto": "₿", "体育": "⚽", "传统金融": "📈", "其他": "❓"}.get(category, "❓")
             summary_lines.append(f"{emoji} {category}: {count} 笔")
@@ -478,170 +1938,924 @@ def send_hourly_summary(category_counts, total_count):
         f"📊 *每小时内幕交易汇总* 📊\n"
         f"━━━━━━━━━━━━━━━\n"
         f"🕐 时间: {now}\n"
-        f"📈 总计: *{total_count}* 笔可疑交易\n"
+        f"📈 总计: *{total_count}* 笔可疑交易 (${window['volume']:,.0f})\n"
         f"━━━━━━━━━━━━━━━\n"
         f"*分类统计:*\n" + "\n".join(summary_lines)
     )
+    if window.get("capped"):
+        start = datetime.fromtimestamp(window["since"], timezone.utc).strftime("%H:%M UTC")
+        msg += (f"\n\n⚠️ 距上次汇总已超过 {window['seconds'] // 60:.0f} 分钟，"
+                f"只统计 {start} 之后的警报，更早的未发送汇总的警报不计入")
+    if window["top_markets"]:
+        msg += "\n\n*热门市场:*\n" + "\n".join(
+            f"🏟️ {m['market']}: {m['alerts']} 笔 (${m['volume']:,.0f})" for m in window["top_markets"]
+        )
+    if day_window is not None:
+        if day_window["repeat_wallets"]:
+            msg += "\n\n*24 小时内重复出现的钱包:*\n" + "\n".join(
+                f"👤 `{w['name'] or w['address'][:10]}`: {w['alerts']} 笔 (${w['volume']:,.0f})"
+                for w in day_window["repeat_wallets"]
+            )
+        msg += f"\n\n📅 近 24 小时: {day_window['alerts']} 笔 (${day_window['volume']:,.0f})"
+    
+    if outbox is not None:
+        outbox.enqueue(msg)
+        return True
     
-    url = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendMessage"
-    r = requests.post(url, json={"chat_id": CHAT_ID, "text": msg, "parse_mode": "Markdown"})
+    r = send_telegram_message(msg)
     if r.status_code != 200:
         print(f"❌ 汇总消息发送失败: {r.text}")
-    else:
-        print(f"✅ 成功发送每小时汇总")
+        return False
+    print(f"✅ 成功发送每小时汇总")
+    return True
 
 
-def run_task():
-    print(f"开始扫描 (阈值: ${MIN_BET_USD})...")
-    params = {"limit": 100, "filterType": "CASH", "filterAmount": MIN_BET_USD, "takerOnly": "true"}
-    
-    # 加载已发送的交易记录（用于去重）
-    sent_trades = load_sent_trades()
+def send_summary(state, seconds=60 * 60):
+    """汇总上次汇总以来（最多 seconds 秒）的警报并发送；多节点分片共享状态库时只由 0 号节点发送
+
+    定时任务的间隔不固定（可能不到一小时），从上次汇总覆盖到的时间点开始统计，
+    同一条警报只出现在一次汇总里；发送或加入队列后才推进这个时间点。
+    """
+    if state.alert_stats is None or SHARD_INDEX != 0:
+        return None
+    with METRICS.span("summary"):
+        window = state.alert_stats.window(seconds, SUMMARY_TOP_N, since=state.alert_stats.summary_until(),
+                                          closed=True)
+        day_window = state.alert_stats.window(24 * 60 * 60, SUMMARY_TOP_N)
+    # 没有警报时也推进：这段时间没有需要汇总的内容，下次不必因此截断窗口
+    if send_hourly_summary(window, state.telegram_outbox, day_window) or window["alerts"] == 0:
+        state.alert_stats.mark_summary(window["until"])
+    return window
+
+
+def new_category_counts():
+    return {"政治": 0, "Crypto": 0, "体育": 0, "传统金融": 0, "其他": 0}
+
+
+class MonitorState:
+    """扫描期间共享的状态：去重记录、拉取游标、钱包缓存和 CSV 输出
+
+    单次运行时随进程结束而关闭；守护进程模式下常驻内存，每轮扫描后落盘。
+    分片工作进程传入 outputs（见 ShardPool），CSV / 历史 / Sheets / Telegram 输出交回协调进程写出，
+    并传入 owner=False：游标和去重记录的清理只由协调进程负责，工作进程不加载、不保存游标；
+    协调进程传入 enrich=False，不加载钱包索引。
+    """
+
+    def __init__(self, outputs=None, enrich=True, owner=True):
+        self.rules = load_rules(RULES_FILE, MIN_BET_USD, MAX_ACCOUNT_AGE_DAYS, MIN_TRADE_COUNT)
+        if self.rules.source:
+            print(f"📋 已从 {self.rules.source} 加载 {len(self.rules)} 条警报规则: {', '.join(r.name for r in self.rules.rules)}")
+        self.owner = owner
+        self.sent_trades = load_sent_trades() if owner else SentTradeStore()
+        self.cursor = load_ingest_cursor() if owner else None
+        self.wallet_cache = WalletCache()
+        self.wallet_index = None
+        # 分片工作进程不计数，由协调进程在写出输出时统一记录
+        self.alert_stats = AlertStats(_connect_state_db()) if outputs is None else None
+        if WALLET_INDEX_ENABLED and enrich:
+            self.wallet_index = WalletIndex(_connect_state_db(), WALLET_TRADE_COUNT_TTL, WALLET_INDEX_MAX_ENTRIES)
+        self.market_cache = MarketCache() if MARKET_CACHE_ENABLED else None
+        self.trade_stream = None
+        self.shard_pool = None
+        if outputs is not None:
+            self.csv_sink = outputs["csv"]
+            self.sheets_spool = outputs["sheets"]
+            self.telegram_outbox = outputs["telegram"]
+            self.alert_history = outputs["history"]
+        else:
+            self.csv_sink = CsvAlertSink()
+            self.sheets_spool = SheetsSpool() if GOOGLE_SHEETS_BATCH else None
+            self.telegram_outbox = TelegramOutbox() if TELEGRAM_TOKEN else None
+            self.alert_history = None
+            if ALERT_HISTORY_ENABLED and parquet_available():
+                self.alert_history = ParquetHistory(ALERT_HISTORY_DIR, ALERT_HISTORY_COMPACT_FILES)
+        # 用于统计分类
+        self.category_counts = new_category_counts()
+        # 最近一轮扫描的概况（写入运行摘要）
+        self.last_scan = None
+
+    def flush(self):
+        """保存去重记录和游标，刷新 CSV，批量发送 Google Sheets 队列，写入运行摘要"""
+        with METRICS.span("persistence"):
+            if self.owner:
+                save_sent_trades(self.sent_trades)
+                save_ingest_cursor(self.cursor)
+            self.csv_sink.flush()
+            if self.wallet_index is not None:
+                self.wallet_index.flush()
+            if self.alert_stats is not None:
+                self.alert_stats.flush()
+            if self.alert_history is not None:
+                try:
+                    self.alert_history.flush()
+                    self.alert_history.compact()
+                except Exception as e:
+                    print(f"⚠️ 写入 Parquet 警报历史失败: {e}")
+        if self.sheets_spool is not None and GOOGLE_SHEETS_WEBHOOK:
+            with METRICS.span("sheets_flush"):
+                self.sheets_spool.flush()
+        write_run_summary(self)
+
+    def summary(self):
+        """运行摘要：阶段耗时、事件计数、接口统计和缓存状态（守护进程模式下可在其他线程调用）"""
+        summary = METRICS.snapshot()
+        summary["http"] = HTTP_CLIENT.stats()
+        for name, value in self.wallet_cache.stats().items():
+            summary["counters"][f"wallet_cache_{name}"] = value
+        if self.wallet_index is not None:
+            for name, value in self.wallet_index.stats().items():
+                summary["counters"][f"wallet_index_{name}"] = value
+        if self.alert_stats is not None:
+            for name, value in self.alert_stats.stats().items():
+                summary["counters"][f"alert_stats_{name}"] = value
+        gauges = {"market_cache_markets": len(self.market_cache) if self.market_cache is not None else 0}
+        if self.telegram_outbox is not None:
+            for name, value in self.telegram_outbox.counters.items():
+                summary["counters"][f"telegram_{name}"] = value
+            gauges["telegram_queue_length"] = len(self.telegram_outbox)
+        if self.trade_stream is not None:
+            for name, value in self.trade_stream.stats().items():
+                summary["counters"][f"stream_{name}"] = value
+        if self.shard_pool is not None:
+            summary["shards"] = self.shard_pool.stats()
+        summary["gauges"] = gauges
+        summary["last_scan"] = self.last_scan
+        return summary
+
+    def close(self):
+        if self.shard_pool is not None:
+            self.shard_pool.close()
+        if self.telegram_outbox is not None:
+            with METRICS.span("telegram_drain"):
+                self.telegram_outbox.close()
+        self.flush()
+        print(f"🗃️ 钱包缓存统计: {self.wallet_cache.stats()}")
+        self.wallet_cache.close()
+        if self.wallet_index is not None:
+            print(f"🗂️ 钱包索引统计: {self.wallet_index.stats()}")
+            self.wallet_index.close()
+        if self.alert_stats is not None:
+            self.alert_stats.close()
+        self.sent_trades.close()
+        if self.market_cache is not None:
+            self.market_cache.close()
+        self.csv_sink.close()
+        print_http_stats()
+        print_stage_stats()
+
+
+SIDE_DISPLAY = {"BUY": "买入 (Buy)", "SELL": "卖出 (Sell)"}
+
+
+def trade_amount(trade):
+    """交易金额（USDC）：优先取 usdcSize / amount / cash，没有时用 price * size 估算"""
+    raw_amt = trade.get('usdcSize') or trade.get('amount') or trade.get('cash')
+    if raw_amt is None:
+        try:
+            raw_amt = float(trade.get('price', 0)) * float(trade.get('size', 0))
+        except:
+            raw_amt = 0
+    return float(raw_amt)
+
+
+def format_side(side):
+    """交易方向 (BUY/SELL) 的显示文本"""
+    side = (side or '').upper()
+    return SIDE_DISPLAY.get(side) or side or "未知"
+
+
+def price_to_percent(price):
+    """买入概率：price 是 0-1 之间的值，转换为百分比，无法解析时返回 None"""
+    if price is None:
+        return None
+    try:
+        return round(float(price) * 100, 1)
+    except:
+        return None
+
+
+def market_type_of(outcome):
+    """判断市场类型：Yes/No 是二元市场，其他是多选市场"""
+    if outcome and outcome.lower() in ['yes', 'no']:
+        return "Yes/No 二元"
+    return "多可能性"
+
+
+def select_candidates(trades, sent_trades, min_bet=None):
+    """整批去重和金额过滤，返回需要查询钱包信息的候选交易（保持原顺序）
+
+    先按金额和地址过滤，只为通过的交易生成去重 ID，再用一次批量查询排除已推送的交易；
+    每个候选项附带预先算好的方向、概率和市场类型。
+    """
+    min_bet = MIN_BET_USD if min_bet is None else min_bet
+    survivors = []
+    for t in trades:
+        amt = trade_amount(t)
+        address = t.get('proxyWallet')
+        if amt >= min_bet and address:
+            survivors.append((t, generate_trade_id(t), amt, address))
+    already_sent = sent_trades.sent_among([s[1] for s in survivors])
+
+    candidates = []
+    for t, trade_id, amt, address in survivors:
+        if trade_id in already_sent:
+            debug(f"⏭️ 跳过已推送的交易: {trade_id[:8]}...")
+            continue
+        debug(f"检查交易: 用户 {address[:10]}... 金额: ${amt}")
+        candidates.append({
+            "trade": t, "trade_id": trade_id, "amount": amt, "address": address,
+            "side_display": format_side(t.get('side')),
+            "price_percent": price_to_percent(t.get('price')),
+            "market_type": market_type_of(t.get('outcome', '')),
+        })
+    METRICS.incr("trades_duplicate", len(already_sent))
+    return candidates
+
+
+def scan_once(state):
+    """拉取一轮新交易并逐笔判定，返回 (新交易数, 本轮警报列表)"""
+    with METRICS.span("fetch"):
+        trades = fetch_new_trades(state.cursor, min_bet=state.rules.min_bet)
+    METRICS.incr("trades_fetched", len(trades))
     
-    # 用于统计分类
-    category_counts = {"政治": 0, "Crypto": 0, "体育": 0, "传统金融": 0, "其他": 0}
-    alerts_this_run = []
+    if not trades:
+        print("当前无符合条件的交易。")
+        return 0, []
+
+    alerts = dispatch_trades(state, trades)
     
-    try:
-        response = requests.get(f"{DATA_API_URL}/trades", params=params, timeout=15)
-        trades = response.json()
-        
-        if not trades:
-            print("当前无符合条件的交易。")
-            return
+    # 全部处理完后再推进游标
+    state.cursor = advance_cursor(state.cursor, trades)
+    return len(trades), alerts
 
-        for t in trades:
-            # 生成交易ID并检查是否已发送
-            trade_id = generate_trade_id(t)
-            if is_trade_sent(trade_id, sent_trades):
-                print(f"⏭️ 跳过已推送的交易: {trade_id[:8]}...")
+
+def process_trades(state, trades, alerts=None):
+    """对一批交易去重、过滤、查询钱包并判定，返回本批警报列表（轮询和实时流共用）
+
+    传入 alerts 列表时警报追加到其中，中途出错时调用方仍能拿到已经输出的警报。
+    """
+    alerts = [] if alerts is None else alerts
+    trades = owned_trades(trades)
+
+    # 每笔交易都更新钱包索引（同一笔交易重复送达时只计一次）
+    if state.wallet_index is not None:
+        with METRICS.span("indexing"):
+            for t in trades:
+                address = t.get('proxyWallet')
+                if address:
+                    state.wallet_index.observe(generate_trade_id(t), address, _trade_timestamp(t),
+                                               trade_amount(t), t.get('conditionId'))
+    
+    # 第一步：去重和金额过滤（按所有规则中最低的金额阈值），筛出候选交易
+    engine = state.rules
+    with METRICS.span("dedup"):
+        candidates = select_candidates(trades, state.sent_trades, engine.min_bet)
+    METRICS.incr("candidates", len(candidates))
+    
+    # 市场元数据：按需刷新缓存（分片工作进程只从状态库同步协调进程的刷新），并把本批未缓存的市场合并为一次请求
+    if state.market_cache is not None and candidates:
+        with METRICS.span("market_metadata"):
+            if state.owner:
+                state.market_cache.refresh()
+            else:
+                state.market_cache.sync()
+            state.market_cache.prefetch([c["trade"] for c in candidates])
+    
+    # 第二步：按金额和类别筛出每笔交易可能命中的规则，并确定需要查询哪些钱包信息
+    rule_candidates = []
+    with METRICS.span("categorization"):
+        for c in candidates:
+            t = c["trade"]
+            c["market_title"] = t.get('title') or "未知市场"
+            c["market_info"] = state.market_cache.get_for_trade(t) if state.market_cache is not None else None
+            if state.market_cache is not None:
+                METRICS.incr("market_cache_hit" if c["market_info"] else "market_cache_miss")
+            c["category"] = categorize_market(c["market_title"], c["market_info"])
+            c["rules"] = engine.applicable(c["amount"], c["category"])
+            if not c["rules"]:
                 continue
+            c["need_wallet"], c["at_least"], c["need_created"] = engine.wallet_requirements(c["rules"])
+            rule_candidates.append(c)
+    METRICS.incr("rule_candidates", len(rule_candidates))
+    
+    # 第三步：并发查询钱包信息（每个钱包一次，满足所有规则的需要），按交易顺序评估全部规则
+    enriched = iter_enriched(rule_candidates, cache=state.wallet_cache, index=state.wallet_index)
+    for c, profile, bet_count in METRICS.timed_iter("enrichment", enriched):
+        t = c["trade"]
+        trade_id = c["trade_id"]
+        amt = c["amount"]
+        address = c["address"]
+        side_display = c["side_display"]
+        price_percent = c["price_percent"]
+        market_type = c["market_type"]
+        market_title = c["market_title"]
+        market_info = c["market_info"]
+        category = c["category"]
+        outcome = t.get('outcome', '')
+        if profile is None:
+            # 命中的规则都不检查钱包，没有查询钱包信息
+            profile = {"name": address, "created_at": None}
+        
+        days_old = None
+        if profile['created_at']:
+            days_old = (datetime.now(timezone.utc) - profile['created_at']).days
+        
+        matched = engine.evaluate(c["rules"], days_old, bet_count)
+        if not matched:
+            continue
+        METRICS.incr("suspicious")
+        for rule in matched:
+            METRICS.incr(f"rules.{rule.name}")
+        rule_names = ",".join(r.name for r in matched)
+        destinations = engine.destinations(matched)
+        
+        trade_data = {
+            "bet_size": round(amt, 2),
+            "outcome": outcome,
+            "market": market_title,
+            "side": side_display,
+            "price_percent": price_percent,
+            "market_type": market_type,
+            "trade_count_at_least": c["at_least"],
+        }
+        wallet_activity = state.wallet_index.describe(address) if state.wallet_index is not None else None
+        if wallet_activity:
+            trade_data["wallet_activity"] = wallet_activity
+        if not c["need_wallet"]:
+            trade_data["feature"] = f"大额交易 (规则: {rule_names})"
+        if market_info:
+            trade_data.update({
+                "end_date": market_info.get("end_date"),
+                "liquidity": market_info.get("liquidity"),
+                "volume": market_info.get("volume"),
+            })
+        
+        # 先认领再输出：INSERT OR IGNORE 成功的进程才报警，多个进程/节点共享状态库时每笔交易只报警一次
+        if not mark_trade_sent(trade_id, state.sent_trades):
+            METRICS.incr("claims_lost")
+            debug(f"⏭️ 交易已被其他进程认领: {trade_id[:8]}...")
+            continue
+        
+        # 只有命中的规则包含 telegram 目的地时才推送（默认规则下只有政治类别）
+        telegram_sent = True
+        if "telegram" in destinations:
+            with METRICS.span("alerting"):
+                telegram_sent = send_instant_alert(trade_data, profile, bet_count, category, state.telegram_outbox)
+        else:
+            debug(f"⏭️ 命中规则 {rule_names} 不推送 TG: {category}")
+        
+        if not telegram_sent:
+            # 发送失败：撤销认领，下次扫描重试
+            state.sent_trades.release(trade_id)
+        else:
+            # 更新分类统计
+            state.category_counts[category] = state.category_counts.get(category, 0) + 1
             
-            raw_amt = t.get('usdcSize') or t.get('amount') or t.get('cash')
-            if raw_amt is None:
-                try:
-                    raw_amt = float(t.get('price', 0)) * float(t.get('size', 0))
-                except:
-                    raw_amt = 0
-                    
-            amt = float(raw_amt)
-            
-            if amt < MIN_BET_USD:
+            csv_data = {
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "user_address": address,
+                "user_name": profile['name'],
+                "bet_size_usdc": round(amt, 2),
+                "outcome": outcome,
+                "side": side_display,
+                "price_percent": price_percent if price_percent is not None else "未知",
+                "market_type": market_type,
+                "market": market_title,
+                "category": category,
+                "account_age_days": days_old if days_old is not None else "未知",
+                "trade_count": bet_count if bet_count is not None else "未知",
+                "transaction_hash": t.get('transactionHash', ''),
+                "trade_id": trade_id,
+                "market_end_date": (market_info or {}).get("end_date") or "",
+                "market_liquidity": (market_info or {}).get("liquidity") or "",
+                "market_volume": (market_info or {}).get("volume") or "",
+                "market_tags": ",".join((market_info or {}).get("tags") or []),
+                "rules": rule_names,
+                "wallet_volume_24h": (wallet_activity or {}).get("volume_24h", ""),
+                "wallet_volume_7d": (wallet_activity or {}).get("volume_7d", ""),
+                "wallet_markets": (wallet_activity or {}).get("markets_touched", ""),
+                "wallet_largest_bet": (wallet_activity or {}).get("largest_bet", ""),
+            }
+            with METRICS.span("persistence"):
+                if "csv" in destinations:
+                    save_to_csv(csv_data, state.csv_sink)
+                if "history" in destinations and state.alert_history is not None:
+                    state.alert_history.add(csv_data)
+                if "sheets" in destinations:
+                    save_to_google_sheets(csv_data, state.sheets_spool)
+            METRICS.incr(f"alerts.{category}")
+            if state.alert_stats is not None:
+                state.alert_stats.record_alert(csv_data)
+            alerts.append(csv_data)
+    
+    return alerts
+
+
+class StreamResolver:
+    """把实时流中的大额成交解析为带钱包地址的完整交易
+
+    market 频道的事件没有钱包地址：按市场合并后用一次 /trades?market= 请求查出对应交易。
+    Data API 比链上成交晚几秒，查不到时稍后重试，超过次数后留给下一次轮询补齐。
+    """
+
+    MATCH_SLACK = 5  # 事件时间和 Data API 时间戳之间允许的误差（秒）
+
+    def __init__(self, delay=None, attempts=None, seen_size=10000, min_bet=None):
+        self.delay = STREAM_RESOLVE_DELAY if delay is None else delay
+        self.min_bet = MIN_BET_USD if min_bet is None else min_bet
+        self.attempts = STREAM_RESOLVE_ATTEMPTS if attempts is None else attempts
+        self.pending = {}
+        self._seen = deque(maxlen=seen_size)
+        self._seen_set = set()
+
+    def add(self, events):
+        """登记新到达的成交事件，同一市场的事件合并为一次查询"""
+        now = time.monotonic()
+        for event in events:
+            condition_id = event.get("condition_id")
+            if not condition_id:
                 continue
-                
+            entry = self.pending.get(condition_id)
+            if entry is None:
+                self.pending[condition_id] = {"since": event["timestamp"], "attempts": 0, "due": now + self.delay}
+            else:
+                entry["since"] = min(entry["since"], event["timestamp"])
+
+    def _remember(self, trade_id):
+        """记录已交给判定流程的交易，返回 False 表示之前已处理过"""
+        if trade_id in self._seen_set:
+            return False
+        if len(self._seen) == self._seen.maxlen:
+            self._seen_set.discard(self._seen[0])
+        self._seen.append(trade_id)
+        self._seen_set.add(trade_id)
+        return True
+
+    def resolve(self, chunk_size=50):
+        """查询已到期的市场，返回新发现的交易"""
+        now = time.monotonic()
+        due = [condition_id for condition_id, entry in self.pending.items() if entry["due"] <= now]
+        found = []
+        for i in range(0, len(due), chunk_size):
+            chunk = due[i:i + chunk_size]
+            params = {"market": ",".join(chunk), "limit": 500, "filterType": "CASH",
+                      "filterAmount": self.min_bet, "takerOnly": "true"}
+            try:
+                batch = http_get(f"{DATA_API_URL}/trades", params=params, timeout=15).json()
+            except Exception as e:
+                print(f"⚠️ 实时成交解析失败: {e}")
+                batch = []
+            by_market = {}
+            for t in batch if isinstance(batch, list) else []:
+                by_market.setdefault(t.get("conditionId"), []).append(t)
+            for condition_id in chunk:
+                entry = self.pending[condition_id]
+                recent = [t for t in by_market.get(condition_id, [])
+                          if _trade_timestamp(t) >= entry["since"] - self.MATCH_SLACK]
+                if recent:
+                    del self.pending[condition_id]
+                    found.extend(t for t in recent if self._remember(generate_trade_id(t)))
+                    continue
+                entry["attempts"] += 1
+                if entry["attempts"] >= self.attempts:
+                    del self.pending[condition_id]
+                    METRICS.incr("stream_unresolved")
+                else:
+                    entry["due"] = now + self.delay * (entry["attempts"] + 1)
+        return found
+
+
+def start_trade_stream(state):
+    """订阅所有已缓存市场的实时成交；缺少依赖或市场缓存时返回 None（退回轮询）"""
+    if not stream_available():
+        print("⚠️ 实时模式需要 websocket-client (pip install websocket-client)，改用轮询")
+        return None
+    if state.market_cache is None:
+        print("⚠️ 实时模式需要市场缓存 (MARKET_CACHE_ENABLED=1)，改用轮询")
+        return None
+    state.market_cache.refresh()
+    stream = ClobTradeStream(CLOB_WS_URL, state.rules.min_bet, STREAM_QUEUE_SIZE, STREAM_ASSETS_PER_CONNECTION)
+    stream.set_assets(state.market_cache.token_ids())
+    stats = stream.stats()
+    print(f"📡 已订阅 CLOB 实时成交: {stats['assets']} 个资产, {stats['connections']} 个连接")
+    return stream
+
+
+def wallet_hash(address):
+    """钱包地址的稳定哈希（跨进程、跨主机一致，不受 PYTHONHASHSEED 影响）"""
+    return int.from_bytes(hashlib.md5((address or "").lower().encode()).digest()[:8], "big")
+
+
+def shard_of(address, count):
+    """钱包所属的节点分片"""
+    return wallet_hash(address) % count if count > 1 else 0
+
+
+def owned_trades(trades):
+    """节点分片模式下只保留属于本节点的交易"""
+    if SHARD_COUNT <= 1:
+        return trades
+    return [t for t in trades if shard_of(t.get('proxyWallet'), SHARD_COUNT) == SHARD_INDEX]
+
+
+def configure_shard(index, count):
+    """设置本节点的分片；本地文件（游标、CSV、发送队列、运行摘要）按分片加后缀，状态库共享"""
+    global SHARD_INDEX, SHARD_COUNT, INGEST_CURSOR_FILE, CSV_FILE, TELEGRAM_OUTBOX_FILE, SHEETS_SPOOL_FILE, METRICS_FILE
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"分片参数无效: --shard-index {index} --shard-count {count}")
+    SHARD_INDEX, SHARD_COUNT = index, count
+    if count == 1:
+        return
+    suffix = f"shard{index}"
+    stem, ext = os.path.splitext(CSV_FILE)
+    CSV_FILE = f"{stem}_{suffix}{ext}"
+    INGEST_CURSOR_FILE = f"{INGEST_CURSOR_FILE}.{suffix}"
+    TELEGRAM_OUTBOX_FILE = f"{TELEGRAM_OUTBOX_FILE}.{suffix}"
+    SHEETS_SPOOL_FILE = f"{SHEETS_SPOOL_FILE}.{suffix}"
+    if METRICS_FILE:
+        stem, ext = os.path.splitext(METRICS_FILE)
+        METRICS_FILE = f"{stem}_{suffix}{ext}"
+    print(f"🧩 节点分片 {index + 1}/{count}")
+
+
+def dispatch_trades(state, trades):
+    """判定一批交易：有分片进程池时交给工作进程，否则在本进程处理"""
+    if state.shard_pool is not None:
+        return state.shard_pool.process(state, trades)
+    return process_trades(state, trades)
+
+
+class _ForwardedOutput:
+    """分片工作进程中代替 CSV / Parquet 历史 / Sheets 队列 / Telegram 发送队列，只收集输出交回协调进程"""
+
+    def __init__(self):
+        self.items = []
+        self.counters = {}
+        self.path = self.base_path = "协调进程"
+
+    def __len__(self):
+        return 0
+
+    def write(self, row):
+        self.items.append(row)
+
+    add = write
+
+    def enqueue(self, text, key=None):
+        self.items.append((text, key))
+
+    def drain(self):
+        items, self.items = self.items, []
+        return items
+
+    def flush(self):
+        return 0
+
+    def compact(self, min_files=None):
+        return 0
+
+    def close(self):
+        pass
+
+
+def _shard_worker(node_index, node_count, worker_index, workers, inbox, results):
+    """本地分片工作进程：查询钱包、判定并认领分到的交易，把输出交回协调进程"""
+    global METRICS_FILE
+    # Ctrl+C 会发给整个进程组，退出由协调进程统一安排
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    configure_shard(node_index, node_count)
+    METRICS_FILE = ""
+    # 同一台主机上的工作进程共用出口 IP，平分各主机的限速
+    HTTP_CLIENT.rate_limits = {host: rate / workers for host, rate in HTTP_CLIENT.rate_limits.items()}
+    outputs = {name: _ForwardedOutput() for name in ("csv", "history", "sheets", "telegram")}
+    state = MonitorState(outputs=outputs, owner=False)
+    try:
+        while True:
+            trades = inbox.get()
+            if trades is None:
+                break
+            error = None
+            alerts = []
+            try:
+                process_trades(state, trades, alerts)
+            except Exception as e:
+                # 出错之前已认领并输出的警报照常交回，协调进程据此计数
+                import traceback
+                traceback.print_exc()
+                error = f"{type(e).__name__}: {e}"
+            state.flush()
+            results.put({
+                "worker": worker_index,
+                "alerts": alerts,
+                "outputs": {name: output.drain() for name, output in outputs.items()},
+                "metrics": METRICS.snapshot(),
+                "error": error,
+            })
+    finally:
+        state.close()
+
+
+class ShardPool:
+    """本地分片进程池
+
+    协调进程拉取交易，按钱包哈希分给各工作进程（同一钱包总在同一进程，钱包缓存和索引不重复）；
+    工作进程并行查询钱包信息并判定，报警前在共享状态库中认领交易，输出交回协调进程统一写出。
+    任一工作进程失败时本轮抛出异常，协调进程不推进游标，下一轮重新拉取（已认领的交易不会重复报警）。
+    """
+
+    def __init__(self, workers):
+        self.workers = max(1, workers)
+        context = multiprocessing.get_context("spawn")
+        self._results = context.Queue()
+        self._inboxes = [context.Queue(maxsize=2) for _ in range(self.workers)]
+        self._processes = [
+            context.Process(target=_shard_worker, name=f"shard-worker-{i}", daemon=True,
+                            args=(SHARD_INDEX, SHARD_COUNT, i, self.workers, self._inboxes[i], self._results))
+            for i in range(self.workers)
+        ]
+        for process in self._processes:
+            process.start()
+        self._metrics = {}
+        self.counters = {"batches": 0, "trades": 0, "failures": 0}
+        print(f"🧵 已启动 {self.workers} 个分片工作进程")
+
+    def partition(self, trades):
+        """按钱包哈希分组；节点分片之外的交易直接丢弃"""
+        parts = [[] for _ in range(self.workers)]
+        for t in owned_trades(trades):
             address = t.get('proxyWallet')
-            if not address:
+            if address:
+                parts[(wallet_hash(address) // max(1, SHARD_COUNT)) % self.workers].append(t)
+        return parts
+
+    def process(self, state, trades):
+        """分发一批交易并等待全部工作进程完成，返回合并后的警报列表
+
+        市场缓存由协调进程在分发前刷新，工作进程只从状态库同步；任一工作进程出错时抛出 RuntimeError，
+        其 alerts 属性为已输出的警报。
+        """
+        if state.market_cache is not None and trades:
+            with METRICS.span("market_metadata"):
+                state.market_cache.refresh()
+        pending = 0
+        for inbox, part in zip(self._inboxes, self.partition(trades)):
+            if part:
+                inbox.put(part)
+                pending += 1
+                self.counters["trades"] += len(part)
+        self.counters["batches"] += 1
+        alerts = []
+        errors = []
+        deadline = time.monotonic() + SHARD_RESULT_TIMEOUT
+        while pending:
+            try:
+                result = self._results.get(timeout=1)
+            except queue.Empty:
+                dead = [p.name for p in self._processes if not p.is_alive()]
+                if dead or time.monotonic() > deadline:
+                    self.counters["failures"] += 1
+                    raise RuntimeError(f"分片工作进程无响应: {dead or '超时'}")
                 continue
-            
-            print(f"检查交易: 用户 {address[:10]}... 金额: ${amt}")
-            
-            profile = get_user_profile(address)
-            bet_count = get_user_trade_count(address)
-            
-            # 判定逻辑：年龄 <= 10天 OR 交易笔数 < 10
-            is_suspicious = False
-            days_old = None
-            if profile['created_at']:
-                days_old = (datetime.now(timezone.utc) - profile['created_at']).days
-                if days_old <= 10:
-                    is_suspicious = True
-            
-            if bet_count < 10:
-                is_suspicious = True
-            
-            if is_suspicious:
-                market_title = t.get('title') or "未知市场"
-                category = categorize_market(market_title)
-                
-                # 提取交易方向 (BUY/SELL)
-                side = t.get('side', '').upper()
-                if side == 'BUY':
-                    side_display = "买入 (Buy)"
-                elif side == 'SELL':
-                    side_display = "卖出 (Sell)"
-                else:
-                    side_display = side or "未知"
-                
-                # 提取买入概率 (price 是 0-1 之间的值)
-                price = t.get('price')
-                if price is not None:
-                    try:
-                        price_percent = round(float(price) * 100, 1)
-                    except:
-                        price_percent = None
-                else:
-                    price_percent = None
-                
-                # 判断市场类型：Yes/No 是二元市场，其他是多选市场
-                outcome = t.get('outcome', '')
-                if outcome and outcome.lower() in ['yes', 'no']:
-                    market_type = "Yes/No 二元"
-                else:
-                    market_type = "多可能性"
-                
-                trade_data = {
-                    "bet_size": round(amt, 2),
-                    "outcome": outcome,
-                    "market": market_title,
-                    "side": side_display,
-                    "price_percent": price_percent,
-                    "market_type": market_type
-                }
-                
-                # 只推送政治类别到 Telegram
-                should_send_telegram = (category == "政治")
-                telegram_sent = False
-                
-                if should_send_telegram:
-                    telegram_sent = send_instant_alert(trade_data, profile, bet_count, category)
-                else:
-                    print(f"⏭️ 跳过非政治类别的 TG 推送: {category}")
-                    telegram_sent = True  # 标记为"处理完成"以继续保存到 CSV/Sheets
-                
-                if telegram_sent:
-                    # 标记为已发送
-                    mark_trade_sent(trade_id, sent_trades)
-                    
-                    # 更新分类统计
-                    category_counts[category] = category_counts.get(category, 0) + 1
-                    
-                    # 保存到CSV
-                    csv_data = {
-                        "timestamp": datetime.now(timezone.utc).isoformat(),
-                        "user_address": address,
-                        "user_name": profile['name'],
-                        "bet_size_usdc": round(amt, 2),
-                        "outcome": outcome,
-                        "side": side_display,
-                        "price_percent": price_percent if price_percent is not None else "未知",
-                        "market_type": market_type,
-                        "market": market_title,
-                        "category": category,
-                        "account_age_days": days_old if days_old is not None else "未知",
-                        "trade_count": bet_count,
-                        "transaction_hash": t.get('transactionHash', ''),
-                        "trade_id": trade_id
-                    }
-                    save_to_csv(csv_data)
-                    save_to_google_sheets(csv_data)
-                    alerts_this_run.append(csv_data)
-                
-                time.sleep(1)
-        
-        # 保存已发送交易记录
-        save_sent_trades(sent_trades)
-        
-        # 发送每小时汇总
-        total_alerts = sum(category_counts.values())
-        if total_alerts > 0:
-            send_hourly_summary(category_counts, total_alerts)
+            pending -= 1
+            self._metrics[result["worker"]] = result["metrics"]
+            self._emit(state, result)
+            alerts.extend(result["alerts"])
+            if result["error"]:
+                errors.append(f"worker {result['worker']}: {result['error']}")
+        if errors:
+            self.counters["failures"] += 1
+            error = RuntimeError(f"分片工作进程出错: {'; '.join(errors)}")
+            error.alerts = alerts
+            raise error
+        return alerts
+
+    def _emit(self, state, result):
+        """把工作进程的输出写到协调进程的 CSV / 历史 / Sheets / Telegram（每类输出只有一个写入者）"""
+        outputs = result["outputs"]
+        for row in outputs["csv"]:
+            save_to_csv(row, state.csv_sink)
+        if state.alert_history is not None:
+            for row in outputs["history"]:
+                state.alert_history.add(row)
+        for row in outputs["sheets"]:
+            save_to_google_sheets(row, state.sheets_spool)
+        for text, key in outputs["telegram"]:
+            if state.telegram_outbox is not None:
+                state.telegram_outbox.enqueue(text, key=key)
+            else:
+                send_telegram_message(text)
+        for alert in result["alerts"]:
+            category = alert["category"]
+            state.category_counts[category] = state.category_counts.get(category, 0) + 1
+            if state.alert_stats is not None:
+                state.alert_stats.record_alert(alert)
+
+    def stats(self):
+        return {"workers": self.workers, **self.counters, "per_worker": dict(self._metrics)}
+
+    def close(self):
+        for inbox in self._inboxes:
+            try:
+                inbox.put(None, timeout=5)
+            except queue.Full:
+                pass
+        for process in self._processes:
+            process.join(30)
+            if process.is_alive():
+                process.terminate()
+
+
+def write_run_summary(state):
+    """把运行摘要写入 METRICS_FILE"""
+    if not METRICS_FILE:
+        return
+    try:
+        write_json_summary(METRICS_FILE, state.summary())
+    except Exception as e:
+        print(f"⚠️ 写入运行摘要失败: {e}")
+
+
+def run_scan(state):
+    """执行一轮扫描并记录耗时，返回值同 scan_once"""
+    start = time.perf_counter()
+    with METRICS.span("scan"):
+        new_trades, alerts = scan_once(state)
+    state.last_scan = {
+        "finished_at": datetime.now(timezone.utc).isoformat(),
+        "seconds": round(time.perf_counter() - start, 3),
+        "new_trades": new_trades,
+        "alerts": len(alerts),
+    }
+    return new_trades, alerts
+
+
+def snapshot_files():
+    """快照中除状态库以外的文件：{快照内名称: 本地路径}（本地路径可能带分片后缀）"""
+    return {
+        "ingest_cursor.json": INGEST_CURSOR_FILE,
+        "telegram_outbox.jsonl": TELEGRAM_OUTBOX_FILE,
+        "sheets_spool.jsonl": SHEETS_SPOOL_FILE,
+    }
+
+
+def restore_state_snapshot():
+    """冷启动时从 STATE_SNAPSHOT_FILE 恢复状态，失败时从空状态开始"""
+    if not STATE_SNAPSHOT_FILE:
+        return
+    try:
+        with METRICS.span("snapshot_restore"):
+            restored = restore_snapshot(STATE_SNAPSHOT_FILE, STATE_DB_FILE, snapshot_files())
+        if restored:
+            print(f"♻️ 已从快照恢复状态: {', '.join(restored)}")
+    except Exception as e:
+        print(f"⚠️ 恢复状态快照失败，从空状态开始: {e}")
+
+
+def save_state_snapshot():
+    """把状态库、游标和未发送队列写入 STATE_SNAPSHOT_FILE（须在 state.close() 之后调用）"""
+    if not STATE_SNAPSHOT_FILE:
+        return
+    try:
+        with METRICS.span("snapshot_save"):
+            manifest = save_snapshot(STATE_SNAPSHOT_FILE, STATE_DB_FILE, snapshot_files())
+        print(f"💾 状态快照已保存: {STATE_SNAPSHOT_FILE} ({manifest['size'] / 1024:.1f} KB)")
+    except Exception as e:
+        print(f"⚠️ 保存状态快照失败: {e}")
+
+
+def start_monitor(workers=0):
+    """创建扫描状态；workers > 0 时启动本地分片进程池，由工作进程查询钱包"""
+    start = time.perf_counter()
+    with METRICS.span("startup"):
+        restore_state_snapshot()
+        state = MonitorState(enrich=not workers)
+        if workers:
+            state.shard_pool = ShardPool(workers)
+    print(f"🚀 启动耗时 {(time.perf_counter() - start) * 1000:.0f} ms（模块导入 {IMPORT_SECONDS * 1000:.0f} ms）")
+    return state
+
+
+def run_task(workers=0):
+    print(f"开始扫描 (阈值: ${MIN_BET_USD})...")
+    
+    state = start_monitor(workers)
+    try:
+        run_scan(state)
+        state.flush()
         
-        print(f"\n📊 本次扫描完成: {total_alerts} 笔可疑交易")
+        # 发送每小时汇总（最近一小时内所有运行触发的警报）
+        window = send_summary(state)
+        total_alerts = sum(state.category_counts.values())
+        print(f"\n📊 本次扫描完成: {total_alerts} 笔可疑交易"
+              + (f"，本次汇总 {window['alerts']} 笔" if window is not None else ""))
 
     except Exception as e:
+        METRICS.incr("scan_errors")
         print(f"运行时错误: {e}")
         import traceback
         traceback.print_exc()
+    finally:
+        state.close()
+        save_state_snapshot()
+        write_run_summary(state)
+
+
+def next_poll_interval(interval, new_trades):
+    """自适应轮询间隔：有新的大额交易时回到最短间隔，空闲时逐步退避"""
+    if new_trades > 0:
+        return DAEMON_MIN_INTERVAL
+    return min(DAEMON_MAX_INTERVAL, max(DAEMON_MIN_INTERVAL, interval * DAEMON_BACKOFF))
+
+
+def run_daemon(streaming=False, workers=0):
+    """守护进程模式：常驻内存，按自适应间隔持续轮询新交易
+
+    streaming=True 时同时订阅 CLOB 实时成交，大额成交几秒内即进入判定流程；
+    /trades 轮询退为每 DAEMON_MAX_INTERVAL 秒一次的兜底，实时队列溢出时立即补一轮。
+    """
+    mode = "实时" if streaming else "守护进程"
+    print(f"🛰️ {mode}模式启动 (阈值: ${MIN_BET_USD}, 轮询间隔 {DAEMON_MIN_INTERVAL}-{DAEMON_MAX_INTERVAL}s)")
+    stop = threading.Event()
+    
+    def _request_stop(signum, frame):
+        print(f"\n🛑 收到信号 {signum}，完成本轮后退出...")
+        stop.set()
+    
+    signal.signal(signal.SIGINT, _request_stop)
+    signal.signal(signal.SIGTERM, _request_stop)
+    
+    state = start_monitor(workers)
+    metrics_server = None
+    if METRICS_PORT:
+        metrics_server = MetricsServer(METRICS_PORT, state.summary)
+        print(f"📈 Prometheus 指标: http://0.0.0.0:{metrics_server.port}/metrics")
+    stream = start_trade_stream(state) if streaming else None
+    resolver = StreamResolver(min_bet=state.rules.min_bet) if stream is not None else None
+    state.trade_stream = stream
+    interval = DAEMON_MIN_INTERVAL
+    next_poll = 0.0
+    last_summary = time.time()
+    try:
+        while not stop.is_set():
+            if time.monotonic() >= next_poll or (stream is not None and stream.overflowed.is_set()):
+                if stream is not None and stream.overflowed.is_set():
+                    stream.overflowed.clear()
+                    print("⚠️ 实时队列溢出，用轮询补齐")
+                try:
+                    new_trades, alerts = run_scan(state)
+                except Exception as e:
+                    METRICS.incr("scan_errors")
+                    print(f"运行时错误: {e}")
+                    import traceback
+                    traceback.print_exc()
+                    new_trades = 0
+                state.flush()
+                
+                if stream is not None:
+                    # 市场缓存刷新后可能有新市场（补充订阅）或已关闭的市场（退订）；有分片进程池时 process_trades 只在工作进程中运行，
+                    # 协调进程要自己刷新，并重新载入工作进程写入状态库的市场
+                    if state.shard_pool is not None:
+                        state.market_cache.refresh()
+                        state.market_cache.reload()
+                    stream.set_assets(state.market_cache.token_ids())
+                    interval = DAEMON_MAX_INTERVAL
+                    print(f"⏱️ 轮询 {new_trades} 笔新交易，实时流 {stream.stats()}")
+                else:
+                    interval = next_poll_interval(interval, new_trades)
+                    print(f"⏱️ {new_trades} 笔新交易，{interval:.0f}s 后再次轮询")
+                next_poll = time.monotonic() + interval
+            
+            # 每小时发送一次汇总
+            if time.time() - last_summary >= SUMMARY_INTERVAL:
+                send_summary(state, SUMMARY_INTERVAL)
+                state.category_counts = new_category_counts()
+                last_summary = time.time()
+            
+            if stream is None:
+                stop.wait(max(0.0, next_poll - time.monotonic()))
+                continue
+            
+            resolver.add(stream.drain(timeout=1.0))
+            trades = resolver.resolve()
+            if trades:
+                METRICS.incr("stream_trades", len(trades))
+                try:
+                    with METRICS.span("stream"):
+                        dispatch_trades(state, trades)
+                except Exception as e:
+                    METRICS.incr("scan_errors")
+                    print(f"运行时错误: {e}")
+                    import traceback
+                    traceback.print_exc()
+                state.flush()
+    finally:
+        if stream is not None:
+            stream.close()
+        if metrics_server is not None:
+            metrics_server.close()
+        state.close()
+        save_state_snapshot()
+        print("👋 守护进程已退出，状态已保存")
 
 
 def test_user_profile(address=None):
@@ -654,7 +2868,7 @@ def test_user_profile(address=None):
         print("\n📥 从实际交易中获取测试地址...")
         try:
             params = {"limit": 1, "filterType": "CASH", "filterAmount": MIN_BET_USD, "takerOnly": "true"}
-            response = requests.get(f"{DATA_API_URL}/trades", params=params, timeout=15)
+            response = http_get(f"{DATA_API_URL}/trades", params=params, timeout=15)
             trades = response.json()
             if trades and len(trades) > 0:
                 address = trades[0].get('proxyWallet')
@@ -683,10 +2897,65 @@ def test_user_profile(address=None):
     print("=" * 60)
 
 
+def print_alert_stats(argv):
+    """按窗口打印持久化的警报计数（不扫描、不发送）"""
+    import argparse
+    parser = argparse.ArgumentParser(prog="polymarket_agent.py stats", description="警报时间窗口统计")
+    parser.add_argument("--hours", default="1,24,168", help="窗口（小时），逗号分隔")
+    parser.add_argument("--top", type=int, default=SUMMARY_TOP_N, help="列出的热门市场 / 重复钱包个数")
+    args = parser.parse_args(argv)
+    stats = AlertStats(_connect_state_db())
+    try:
+        for hours in [float(h) for h in args.hours.split(",") if h.strip()]:
+            window = stats.window(hours * 3600, args.top)
+            print(f"\n📊 最近 {hours:g} 小时: {window['alerts']} 笔, ${window['volume']:,.0f}"
+                  f"（{window['resolution']}s 分桶）")
+            for category, count in sorted(window["categories"].items(), key=lambda x: -x[1]):
+                print(f"  {category:<10} {count:>6}")
+            for m in window["top_markets"]:
+                print(f"  🏟️ {m['alerts']:>4} 笔 ${m['volume']:>12,.0f}  {m['market']}")
+            for w in window["repeat_wallets"]:
+                print(f"  👤 {w['alerts']:>4} 笔 ${w['volume']:>12,.0f}  {w['address']} {w['name'] or ''}")
+    finally:
+        stats.close()
+
+
+def parse_shard_args(argv):
+    """解析运行模式和分片参数；模式拼写错误时报错退出，不会悄悄按单次运行处理"""
+    import argparse
+    parser = argparse.ArgumentParser(prog="polymarket_agent.py")
+    parser.add_argument("mode", nargs="?", default="run", choices=("run", "daemon", "stream"),
+                        help="run: 单次扫描（默认）；daemon: 持续轮询；stream: 实时流 + 轮询补齐")
+    parser.add_argument("--shard-index", type=int, default=SHARD_INDEX, help="本节点的分片编号（从 0 开始）")
+    parser.add_argument("--shard-count", type=int, default=SHARD_COUNT, help="节点分片总数")
+    parser.add_argument("--workers", type=int, default=SHARD_WORKERS, help="本机分片工作进程数，0 表示单进程")
+    return parser.parse_args(argv)
+
+
 if __name__ == "__main__":
     import sys
     if len(sys.argv) > 1 and sys.argv[1] == "test":
         test_address = sys.argv[2] if len(sys.argv) > 2 else None
         test_user_profile(test_address)
+    elif len(sys.argv) > 1 and sys.argv[1] == "history":
+        import history_store
+        history_store.main(sys.argv[2:], root=ALERT_HISTORY_DIR)
+    elif len(sys.argv) > 1 and sys.argv[1] == "replay":
+        import replay
+        replay.main(sys.argv[2:])
+    elif len(sys.argv) > 1 and sys.argv[1] == "stats":
+        print_alert_stats(sys.argv[2:])
+    elif len(sys.argv) > 1 and sys.argv[1] == "snapshot":
+        import state_snapshot
+        state_snapshot.main(sys.argv[2:], STATE_SNAPSHOT_FILE or "state_snapshot.tar.gz", STATE_DB_FILE,
+                            snapshot_files())
     else:
-        run_task()
+        # run（默认）/ daemon / stream，可加 --shard-index/--shard-count（多节点）和 --workers（本机进程池）
+        args = parse_shard_args(sys.argv[1:])
+        configure_shard(args.shard_index, args.shard_count)
+        if args.mode == "daemon":
+            run_daemon(workers=args.workers)
+        elif args.mode == "stream":
+            run_daemon(streaming=True, workers=args.workers)
+        else:
+            run_task(workers=args.workers)
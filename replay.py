@@ -0,0 +1,304 @@
+"""历史回放 / 回测
+
+把大批历史交易按时间顺序流式送入与实时扫描相同的警报规则（alert_rules.Rule），用来调整
+规则和 MIN_BET_USD、账号年龄、交易笔数阈值：
+
+    python polymarket_agent.py replay trades.jsonl [--activity activity.jsonl]
+        [--labels labels.jsonl] [--rules alert_rules.json | --min-bet 3000,10000 --max-age 10,30 --min-trades 10,20]
+        [--out alerts.jsonl] [--json stats.json]
+
+规则来源：
+- 指定 --min-bet / --max-age / --min-trades 任一项时，按阈值组合生成规则（不限类别，钱包条件任一满足），
+  未指定的项取配置值
+- 否则加载 --rules（默认 RULES_FILE）中实际部署的规则，文件不存在时使用内置默认规则
+
+输入：
+- trades: Data API /trades 格式的交易记录（JSONL，或安装了 pyarrow 时的 Parquet），按时间升序
+- --activity: 钱包活动记录（至少包含 proxyWallet 和 timestamp），按时间升序；
+  提供时账号年龄和交易笔数按它计算，否则按交易文件本身计算（数据起点之前的活动会被忽略）
+- --labels: 已确认的标注 {"transactionHash" 或 "trade_id": ..., "insider": true/false}，用于计算精确率/召回率
+
+每个钱包只保留首笔活动时间和活动计数，内存随钱包数增长，与交易条数无关；
+交易和活动记录按块读取后按时间归并，每笔交易只看到该时刻之前（含同一秒）的钱包活动。
+多条规则在同一遍扫描中同时评估。
+"""
+import argparse
+import heapq
+import itertools
+import json
+import sys
+import time
+
+from alert_rules import Rule, load_rules
+from polymarket_agent import (
+    MAX_ACCOUNT_AGE_DAYS,
+    MIN_BET_USD,
+    MIN_TRADE_COUNT,
+    RULES_FILE,
+    _trade_timestamp,
+    categorize_market,
+    generate_trade_id,
+    trade_amount,
+)
+
+DAY = 24 * 60 * 60
+CHUNK_SIZE = 50000
+
+
+def iter_chunks(path, chunk_size=CHUNK_SIZE):
+    """按块读取 JSONL 或 Parquet 文件，每次产出一个记录列表"""
+    if path.endswith(".parquet"):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise SystemExit("读取 Parquet 需要 pyarrow: pip install pyarrow")
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pylist()
+        return
+
+    with open(path, "r", encoding="utf-8") as f:
+        while True:
+            lines = list(itertools.islice(f, chunk_size))
+            if not lines:
+                return
+            yield [json.loads(line) for line in lines if line.strip()]
+
+
+def iter_records(path, chunk_size=CHUNK_SIZE):
+    for chunk in iter_chunks(path, chunk_size):
+        yield from chunk
+
+
+class WalletHistory:
+    """按钱包累计的首笔活动时间和活动笔数"""
+
+    def __init__(self):
+        self._wallets = {}
+
+    def __len__(self):
+        return len(self._wallets)
+
+    def observe(self, address, ts):
+        entry = self._wallets.get(address)
+        if entry is None:
+            self._wallets[address] = [ts, 1]
+        else:
+            if ts < entry[0]:
+                entry[0] = ts
+            entry[1] += 1
+
+    def get(self, address):
+        """返回 (首笔活动时间, 活动笔数)，没有记录时返回 (None, 0)"""
+        entry = self._wallets.get(address)
+        return (entry[0], entry[1]) if entry else (None, 0)
+
+
+class RuleSet:
+    """一条警报规则（alert_rules.Rule）及其回放统计"""
+
+    def __init__(self, rule):
+        self.rule = rule
+        self.name = rule.name
+        self.min_bet = rule.min_bet
+        self.evaluated = 0
+        self.alerts = 0
+        self.by_category = {}
+        self.true_positive = 0
+        self.false_positive = 0
+        self.false_negative = 0
+
+    def matches(self, amount, category, days_old, bet_count):
+        """金额和类别满足规则、且钱包满足规则的钱包条件时返回 True（与实时扫描相同）"""
+        if not self.rule.accepts(amount, category):
+            return False
+        self.evaluated += 1
+        return self.rule.matches_wallet(days_old, bet_count)
+
+    def record(self, fired, category, label):
+        if fired:
+            self.alerts += 1
+            self.by_category[category] = self.by_category.get(category, 0) + 1
+        if label is None:
+            return
+        if fired and label:
+            self.true_positive += 1
+        elif fired:
+            self.false_positive += 1
+        elif label:
+            self.false_negative += 1
+
+    def summary(self):
+        labelled = self.true_positive + self.false_positive
+        positives = self.true_positive + self.false_negative
+        return {
+            "rule": self.name,
+            "evaluated": self.evaluated,
+            "alerts": self.alerts,
+            "alert_rate": round(self.alerts / self.evaluated, 4) if self.evaluated else None,
+            "by_category": dict(sorted(self.by_category.items(), key=lambda kv: -kv[1])),
+            "true_positive": self.true_positive,
+            "false_positive": self.false_positive,
+            "false_negative": self.false_negative,
+            "precision": round(self.true_positive / labelled, 4) if labelled else None,
+            "recall": round(self.true_positive / positives, 4) if positives else None,
+        }
+
+
+def load_labels(path):
+    """读取标注文件，返回 {transactionHash 或 trade_id: bool}"""
+    labels = {}
+    for record in iter_records(path):
+        key = record.get("transactionHash") or record.get("trade_id")
+        if key:
+            labels[key] = bool(record.get("insider", record.get("label")))
+    return labels
+
+
+def grid_rules(min_bets, max_ages, min_trades):
+    """按阈值组合生成规则"""
+    return [
+        Rule(f"bet>={min_bet:g}/age<={max_age}/trades<{min_trade}", min_bet,
+             max_account_age_days=max_age, min_trade_count=min_trade)
+        for min_bet in min_bets
+        for max_age in max_ages
+        for min_trade in min_trades
+    ]
+
+
+def _merged_events(trades_path, activity_path, chunk_size):
+    """按时间归并交易和活动记录：同一秒内活动排在交易之前"""
+    trades = ((_trade_timestamp(t), 1, t) for t in iter_records(trades_path, chunk_size))
+    if not activity_path:
+        return trades
+    activity = ((_trade_timestamp(a), 0, a) for a in iter_records(activity_path, chunk_size))
+    return heapq.merge(activity, trades, key=lambda event: (event[0], event[1]))
+
+
+def replay(trades_path, rules, activity_path=None, labels=None, alerts_out=None, chunk_size=CHUNK_SIZE):
+    """回放交易并评估各条规则，返回回放概况"""
+    history = WalletHistory()
+    categories = {}
+    labels = labels or {}
+    min_bet = min(rule.min_bet for rule in rules)
+    stats = {"trades": 0, "activity": 0, "out_of_order": 0, "alerted_trades": 0}
+    last_ts = 0
+    start = time.perf_counter()
+
+    for ts, kind, record in _merged_events(trades_path, activity_path, chunk_size):
+        address = record.get("proxyWallet")
+        if kind == 0:
+            stats["activity"] += 1
+            if address:
+                history.observe(address, ts)
+            continue
+
+        stats["trades"] += 1
+        if ts < last_ts:
+            stats["out_of_order"] += 1
+        last_ts = max(last_ts, ts)
+        if not address:
+            continue
+        if not activity_path:
+            # 没有活动记录时用交易本身累计钱包历史（实时扫描的交易笔数同样包含当前这笔）
+            history.observe(address, ts)
+
+        amount = trade_amount(record)
+        label = labels.get(record.get("transactionHash") or generate_trade_id(record)) if labels else None
+        if amount < min_bet and label is None:
+            continue
+
+        first_seen, bet_count = history.get(address)
+        days_old = (ts - first_seen) // DAY if first_seen is not None else None
+        title = record.get("title") or ""
+        category = categories.get(title)
+        if category is None:
+            category = categories[title] = categorize_market(title)
+        fired_rules = []
+        for rule in rules:
+            fired = rule.matches(amount, category, days_old, bet_count)
+            rule.record(fired, category, label)
+            if fired:
+                fired_rules.append(rule.name)
+
+        if fired_rules:
+            stats["alerted_trades"] += 1
+            if alerts_out is not None:
+                alerts_out.write(json.dumps({
+                    "timestamp": ts,
+                    "user_address": address,
+                    "bet_size_usdc": round(amount, 2),
+                    "market": record.get("title"),
+                    "category": category,
+                    "account_age_days": days_old,
+                    "trade_count": bet_count,
+                    "transaction_hash": record.get("transactionHash", ""),
+                    "rules": fired_rules,
+                }, ensure_ascii=False) + "\n")
+
+    stats["wallets"] = len(history)
+    stats["seconds"] = round(time.perf_counter() - start, 2)
+    stats["trades_per_second"] = round(stats["trades"] / stats["seconds"]) if stats["seconds"] else None
+    return stats
+
+
+def _parse_list(value, cast):
+    return [cast(v) for v in str(value).split(",") if v.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="polymarket_agent.py replay", description="历史交易回放 / 回测")
+    parser.add_argument("trades", help="交易记录 JSONL / Parquet（按时间升序）")
+    parser.add_argument("--activity", help="钱包活动记录 JSONL / Parquet（按时间升序）")
+    parser.add_argument("--labels", help="标注文件 JSONL，用于计算精确率/召回率")
+    parser.add_argument("--rules", default=RULES_FILE, help="警报规则 JSON（默认 RULES_FILE，不存在时用内置默认规则）")
+    parser.add_argument("--min-bet", help="按阈值组合回测：最小金额，可用逗号分隔多个值")
+    parser.add_argument("--max-age", help="按阈值组合回测：账号年龄上限（天），可多个")
+    parser.add_argument("--min-trades", help="按阈值组合回测：交易笔数下限，可多个")
+    parser.add_argument("--out", help="警报输出 JSONL")
+    parser.add_argument("--json", help="统计结果输出 JSON")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    if args.min_bet or args.max_age or args.min_trades:
+        source = "阈值组合"
+        compiled = grid_rules(
+            _parse_list(args.min_bet or MIN_BET_USD, float),
+            _parse_list(args.max_age or MAX_ACCOUNT_AGE_DAYS, int),
+            _parse_list(args.min_trades or MIN_TRADE_COUNT, int),
+        )
+    else:
+        try:
+            engine = load_rules(args.rules, MIN_BET_USD, MAX_ACCOUNT_AGE_DAYS, MIN_TRADE_COUNT)
+        except ValueError as e:
+            raise SystemExit(f"规则配置有误: {e}")
+        source = engine.source or "内置默认规则"
+        compiled = engine.rules
+    rules = [RuleSet(rule) for rule in compiled]
+    labels = load_labels(args.labels) if args.labels else None
+    print(f"🔁 回放 {args.trades}，{len(rules)} 条规则（{source}）{'，标注 %d 条' % len(labels) if labels else ''}")
+
+    alerts_out = open(args.out, "w", encoding="utf-8") if args.out else None
+    try:
+        stats = replay(args.trades, rules, args.activity, labels, alerts_out, args.chunk_size)
+    finally:
+        if alerts_out is not None:
+            alerts_out.close()
+
+    print(f"📥 {stats['trades']} 笔交易, {stats['activity']} 条活动记录, {stats['wallets']} 个钱包, "
+          f"{stats['seconds']}s ({stats['trades_per_second']} 笔/秒)")
+    if stats["out_of_order"]:
+        print(f"⚠️ {stats['out_of_order']} 笔交易时间早于前一笔，输入应按时间升序排列")
+    results = [rule.summary() for rule in rules]
+    for result in results:
+        precision = "-" if result["precision"] is None else f"{result['precision']:.1%}"
+        recall = "-" if result["recall"] is None else f"{result['recall']:.1%}"
+        print(f"📊 {result['rule']}: {result['alerts']}/{result['evaluated']} 笔警报, "
+              f"精确率 {precision}, 召回率 {recall}, 分类 {result['by_category']}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"replay": stats, "rules": results}, f, ensure_ascii=False, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,143 @@
+"""状态快照：把本地状态打包成一个压缩文件，供无状态的运行环境（GitHub Actions）在两次运行之间传递
+
+快照是 gzip 压缩的 tar 包，包含：
+- state.db: 状态库（去重记录、钱包缓存、市场缓存、钱包统计索引）的一致性副本，用 SQLite 在线备份生成并 VACUUM
+- ingest_cursor.json / telegram_outbox.jsonl / sheets_spool.jsonl: 游标和未发送完的队列（存在时）
+- manifest.json: 版本、生成时间和各文件大小
+
+恢复只在本地状态库不存在时进行（冷启动），已有的本地文件不会被覆盖。
+
+    python polymarket_agent.py snapshot info
+    python polymarket_agent.py snapshot save [--path state_snapshot.tar.gz]
+    python polymarket_agent.py snapshot restore [--path state_snapshot.tar.gz]
+"""
+import argparse
+import io
+import json
+import os
+import sqlite3
+import tarfile
+import tempfile
+import time
+from datetime import datetime, timezone
+
+SNAPSHOT_VERSION = 1
+DB_MEMBER = "state.db"
+MANIFEST_MEMBER = "manifest.json"
+
+
+def _add_bytes(tar, name, data):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mtime = int(time.time())
+    tar.addfile(info, io.BytesIO(data))
+
+
+def _copy_database(db_path, directory):
+    """用在线备份复制状态库（不受 WAL 和其他连接影响），再 VACUUM 压缩体积"""
+    copy_path = os.path.join(directory, DB_MEMBER)
+    source = sqlite3.connect(db_path, timeout=30)
+    target = sqlite3.connect(copy_path)
+    try:
+        source.backup(target)
+        target.execute("PRAGMA journal_mode=DELETE")
+        target.execute("VACUUM")
+    finally:
+        target.close()
+        source.close()
+    return copy_path
+
+
+def save_snapshot(path, db_path, files=None):
+    """生成快照，files 为 {快照内名称: 本地路径}，不存在的文件跳过；返回 manifest"""
+    if not os.path.exists(db_path):
+        raise FileNotFoundError(f"状态库不存在: {db_path}")
+    manifest = {
+        "version": SNAPSHOT_VERSION,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "files": {},
+    }
+    directory = os.path.dirname(os.path.abspath(path))
+    with tempfile.TemporaryDirectory(prefix="state_snapshot_") as workdir:
+        copy_path = _copy_database(db_path, workdir)
+        tmp_path = os.path.join(directory, f".{os.path.basename(path)}.tmp")
+        with tarfile.open(tmp_path, "w:gz", compresslevel=6) as tar:
+            tar.add(copy_path, arcname=DB_MEMBER)
+            manifest["files"][DB_MEMBER] = os.path.getsize(copy_path)
+            for name, local_path in (files or {}).items():
+                if local_path and os.path.exists(local_path):
+                    tar.add(local_path, arcname=name)
+                    manifest["files"][name] = os.path.getsize(local_path)
+            _add_bytes(tar, MANIFEST_MEMBER, json.dumps(manifest, ensure_ascii=False, indent=2).encode("utf-8"))
+        os.replace(tmp_path, path)
+    manifest["size"] = os.path.getsize(path)
+    return manifest
+
+
+def read_manifest(path):
+    with tarfile.open(path, "r:gz") as tar:
+        return json.load(tar.extractfile(MANIFEST_MEMBER))
+
+
+def restore_snapshot(path, db_path, files=None):
+    """本地状态库不存在时从快照恢复，返回恢复的文件名列表；没有快照或无需恢复时返回 []
+
+    只按名称提取已知的文件（不使用 extractall），已存在的本地文件保留不动。
+    """
+    if not path or not os.path.exists(path) or os.path.exists(db_path):
+        return []
+    targets = dict(files or {})
+    targets[DB_MEMBER] = db_path
+    restored = []
+    with tarfile.open(path, "r:gz") as tar:
+        manifest = json.load(tar.extractfile(MANIFEST_MEMBER))
+        if manifest.get("version") != SNAPSHOT_VERSION:
+            raise ValueError(f"快照版本不兼容: {manifest.get('version')}")
+        for name in manifest.get("files", {}):
+            local_path = targets.get(name)
+            if not local_path or os.path.exists(local_path):
+                continue
+            member = tar.getmember(name)
+            if not member.isfile():
+                continue
+            if name == DB_MEMBER:
+                # 残留的 WAL 文件属于另一个数据库，不能和恢复的状态库混用
+                for suffix in ("-wal", "-shm"):
+                    if os.path.exists(db_path + suffix):
+                        os.remove(db_path + suffix)
+            parent = os.path.dirname(os.path.abspath(local_path))
+            os.makedirs(parent, exist_ok=True)
+            tmp_path = os.path.join(parent, f".{os.path.basename(local_path)}.restore")
+            with tar.extractfile(member) as src, open(tmp_path, "wb") as dst:
+                dst.write(src.read())
+            os.replace(tmp_path, local_path)
+            restored.append(name)
+    return restored
+
+
+def main(argv, path, db_path, files=None):
+    parser = argparse.ArgumentParser(prog="polymarket_agent.py snapshot", description="状态快照")
+    parser.add_argument("action", choices=("info", "save", "restore"))
+    parser.add_argument("--path", default=path, help="快照文件路径")
+    args = parser.parse_args(argv)
+    if not args.path:
+        raise SystemExit("请用 --path 或 STATE_SNAPSHOT_FILE 指定快照文件")
+    if args.action == "save":
+        start = time.perf_counter()
+        manifest = save_snapshot(args.path, db_path, files)
+        print(f"💾 快照已保存: {args.path} ({manifest['size'] / 1024:.1f} KB, {len(manifest['files'])} 个文件, "
+              f"{time.perf_counter() - start:.2f}s)")
+    elif args.action == "restore":
+        if os.path.exists(db_path):
+            print(f"⏭️ 本地状态库已存在，跳过恢复: {db_path}")
+            return
+        restored = restore_snapshot(args.path, db_path, files)
+        print(f"♻️ 已恢复: {', '.join(restored) if restored else '无'}")
+    else:
+        if not os.path.exists(args.path):
+            raise SystemExit(f"快照不存在: {args.path}")
+        manifest = read_manifest(args.path)
+        print(f"📦 {args.path}: {os.path.getsize(args.path) / 1024:.1f} KB, 版本 {manifest['version']}, "
+              f"生成于 {manifest['created_at']}")
+        for name, size in manifest["files"].items():
+            print(f"  {name:<24} {size / 1024:>10.1f} KB")
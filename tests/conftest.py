@@ -0,0 +1,36 @@
+"""测试共用的替身服务器和 polymarket_agent 模块
+
+polymarket_agent 在导入时读取配置，所以整个测试会话只启动一个 stub_api 替身并导入一次；
+需要注入故障的测试修改 stub.state.error_rate，结束后恢复。
+"""
+import os
+import sys
+import time
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+from bench_run_task import configure_env  # noqa: E402
+from stub_api import StubServer, StubState, generate_fixtures  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def stub(tmp_path_factory):
+    fixtures = generate_fixtures(trades=60, wallets=20, now=int(time.time()))
+    with StubServer(StubState(fixtures)) as server:
+        configure_env(server.base_url, False)
+        os.environ.update({
+            "HTTP_MAX_RETRIES": "1",
+            "STATE_DB_FILE": str(tmp_path_factory.mktemp("state") / "monitor_state.db"),
+        })
+        yield server
+
+
+@pytest.fixture(scope="session")
+def agent(stub):
+    import polymarket_agent
+    polymarket_agent.HTTP_CLIENT.backoff_base = 0.01
+    return polymarket_agent
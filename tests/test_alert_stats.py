@@ -0,0 +1,76 @@
+"""警报分桶计数：滚动窗口、上次汇总之后的窗口、过期清理"""
+import sqlite3
+
+import pytest
+
+from alert_stats import HOUR, MINUTE, AlertStats
+
+NOW = 1_800_000_000.0  # 对齐到整分钟，便于计算桶边界
+
+
+@pytest.fixture
+def stats():
+    s = AlertStats(sqlite3.connect(":memory:"))
+    yield s
+    s.close()
+
+
+def test_window_counts_by_dimension(stats):
+    stats.record("政治", "m1", "0xa", 5000, "alice", ts=NOW - 120)
+    stats.record("政治", "m1", "0xa", 7000, "alice", ts=NOW - 60)
+    stats.record("体育", "m2", "0xb", 3000, ts=NOW - 30)
+    window = stats.window(HOUR, now=NOW)
+    assert window["resolution"] == MINUTE
+    assert window["alerts"] == 3 and window["volume"] == 15000
+    assert window["categories"] == {"政治": 2, "体育": 1}
+    assert window["top_markets"][0] == {"market": "m1", "alerts": 2, "volume": 12000}
+    assert window["repeat_wallets"] == [{"address": "0xa", "name": "alice", "alerts": 2, "volume": 12000}]
+
+
+def test_rolling_window_excludes_older_alerts(stats):
+    stats.record("政治", "m1", "0xa", 5000, ts=NOW - 2 * HOUR)
+    stats.record("政治", "m1", "0xa", 5000, ts=NOW - 10)
+    assert stats.window(HOUR, now=NOW)["alerts"] == 1
+    assert stats.window(24 * HOUR, now=NOW)["alerts"] == 2
+
+
+def test_summary_since_last_sent_does_not_repeat_alerts(stats):
+    stats.record("政治", "m1", "0xa", 5000, ts=NOW - 600)
+    first = stats.window(HOUR, now=NOW, since=stats.summary_until(), closed=True)
+    assert first["alerts"] == 1 and first["until"] == NOW
+    stats.mark_summary(first["until"])
+
+    # 下一次定时任务只隔了 40 分钟：上一轮的警报不再计入
+    later = NOW + 40 * MINUTE + 30
+    stats.record("体育", "m2", "0xb", 3000, ts=later - 90)
+    second = stats.window(HOUR, now=later, since=stats.summary_until(), closed=True)
+    assert second["alerts"] == 1 and second["categories"] == {"体育": 1}
+    assert not second["capped"]
+
+
+def test_alert_in_open_bucket_goes_to_next_summary(stats):
+    stats.record("政治", "m1", "0xa", 5000, ts=NOW + 10)
+    first = stats.window(HOUR, now=NOW + 20, since=NOW - 30 * MINUTE, closed=True)
+    assert first["alerts"] == 0 and first["until"] == NOW
+    stats.mark_summary(first["until"])
+
+    # 汇总之后同一分钟内又记录了一条警报：两条都出现在下一次汇总里，不会丢失
+    stats.record("政治", "m1", "0xa", 5000, ts=NOW + 30)
+    second = stats.window(HOUR, now=NOW + 5 * MINUTE, since=stats.summary_until(), closed=True)
+    assert second["alerts"] == 2 and second["until"] == NOW + 5 * MINUTE
+
+
+def test_summary_since_is_capped_at_window(stats):
+    stats.mark_summary(NOW - 5 * HOUR)
+    stats.record("政治", "m1", "0xa", 5000, ts=NOW - 3 * HOUR)
+    stats.record("政治", "m1", "0xa", 5000, ts=NOW - 10)
+    window = stats.window(HOUR, now=NOW, since=stats.summary_until())
+    assert window["alerts"] == 1 and window["capped"]
+    assert window["since"] == NOW - HOUR + MINUTE
+
+
+def test_expired_buckets_are_pruned(stats):
+    stats.record("政治", "m1", "0xa", 5000, ts=NOW - 4 * HOUR)
+    stats.flush(now=NOW)
+    rows = dict(stats._conn.execute("SELECT resolution, COUNT(*) FROM alert_buckets GROUP BY resolution"))
+    assert MINUTE not in rows and rows[HOUR] == 4
@@ -0,0 +1,61 @@
+"""实时流订阅：资产列表更新时退订已关闭市场的 token，大部分资产已退订的连接关闭后重新分配"""
+import json
+import types
+
+import pytest
+
+import clob_stream
+
+
+class FakeSocket:
+    def __init__(self):
+        self.sent = []
+
+    def send(self, message):
+        self.sent.append(json.loads(message))
+
+
+@pytest.fixture
+def stream(monkeypatch):
+    monkeypatch.setattr(clob_stream, "websocket", types.SimpleNamespace())
+    monkeypatch.setattr(clob_stream._Connection, "start", lambda self: None)
+    stream = clob_stream.ClobTradeStream("ws://stub", 1000, assets_per_connection=4)
+    yield stream
+    stream.close()
+
+
+def tokens(start, stop):
+    return [str(i) for i in range(start, stop)]
+
+
+def test_removed_assets_are_unsubscribed(stream):
+    stream.set_assets(tokens(0, 8))
+    connection = stream._connections[0]
+    ws = FakeSocket()
+    connection._subscribe(ws, full=True)
+
+    stream.set_assets(tokens(1, 8))
+    assert "0" not in connection.assets and stream.stats()["assets"] == 7
+    connection._unsubscribe(ws)
+    assert ws.sent[-1] == {"assets_ids": ["0"], "operation": "unsubscribe"}
+    assert stream.counters["unsubscribed"] == 1
+
+
+def test_mostly_empty_connections_are_rebuilt(stream):
+    stream.set_assets(tokens(0, 12))
+    assert len(stream._connections) == 3
+    retired = stream._connections[1]
+
+    # 第二个连接只剩 1 个资产，第三个连接全部退订：都关闭，剩余资产并入其他连接
+    stream.set_assets(tokens(0, 3) + ["4"])
+    assert retired not in stream._connections
+    assert sorted(a for c in stream._connections for a in c.assets) == ["0", "1", "2", "4"]
+    assert len(stream._connections) == 1 and stream.counters["retired"] == 2
+    assert retired._stopped.is_set()
+
+
+def test_unchanged_assets_keep_connections(stream):
+    stream.set_assets(tokens(0, 6))
+    connections = list(stream._connections)
+    stream.set_assets(tokens(0, 6))
+    assert stream._connections == connections and stream.counters["retired"] == 0
@@ -0,0 +1,34 @@
+"""警报 CSV：已有文件的表头缺少新增的列时补齐，不丢弃新列"""
+import csv
+
+
+def read_rows(path):
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        return list(csv.DictReader(f))
+
+
+def test_existing_file_gains_new_columns(agent, tmp_path):
+    path = tmp_path / "alerts.csv"
+    with open(path, "w", newline="", encoding="utf-8-sig") as f:
+        f.write("timestamp,user_address,market\n2026-01-01T00:00:00+00:00,0xold,Old market\n")
+
+    sink = agent.CsvAlertSink(str(path), roll_daily=False)
+    sink.write({"timestamp": "2026-10-17T00:00:00+00:00", "user_address": "0xnew", "market": "New market",
+                "rules": "default", "wallet_volume_24h": 12000})
+    sink.close()
+
+    rows = read_rows(path)
+    assert list(rows[0]) == ["timestamp", "user_address", "market", "rules", "wallet_volume_24h"]
+    assert rows[0]["user_address"] == "0xold" and rows[0]["rules"] == ""
+    assert rows[1]["rules"] == "default" and rows[1]["wallet_volume_24h"] == "12000"
+
+
+def test_matching_header_is_appended_in_place(agent, tmp_path):
+    path = tmp_path / "alerts.csv"
+    sink = agent.CsvAlertSink(str(path), roll_daily=False)
+    sink.write({"timestamp": "t1", "market": "m1"})
+    sink.close()
+    sink = agent.CsvAlertSink(str(path), roll_daily=False)
+    sink.write({"timestamp": "t2", "market": "m2"})
+    sink.close()
+    assert [row["market"] for row in read_rows(path)] == ["m1", "m2"]
@@ -0,0 +1,78 @@
+"""Parquet 警报历史：合并中途崩溃不重复计数，时间戳无法解析的行跳过"""
+import os
+
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from history_store import ParquetHistory  # noqa: E402
+
+
+def row(ts, trade_id, category="政治"):
+    return {"timestamp": ts, "user_address": "0xA", "bet_size_usdc": "5000", "category": category,
+            "market": "m", "trade_id": trade_id}
+
+
+@pytest.fixture
+def history(tmp_path):
+    history = ParquetHistory(str(tmp_path / "alert_history"))
+    for i in range(3):
+        history.add(row(f"2026-10-17T0{i}:00:00+00:00", f"t{i}"))
+        history.flush()
+    return history
+
+
+def trade_ids(history):
+    return sorted(history.query(columns=["trade_id"]).column("trade_id").to_pylist())
+
+
+def test_crash_after_compacted_file_is_written(history, monkeypatch):
+    real_remove = os.remove
+
+    def crash_on_part(path):
+        if os.path.basename(path).startswith("part-"):
+            raise KeyboardInterrupt("crash")
+        real_remove(path)
+
+    monkeypatch.setattr(os, "remove", crash_on_part)
+    with pytest.raises(KeyboardInterrupt):
+        history.compact(min_files=2)
+    monkeypatch.setattr(os, "remove", real_remove)
+
+    # 合并文件和旧 part 文件都在磁盘上：读取时只算一次
+    (directory, files), = history.partitions()
+    assert len(os.listdir(directory)) == 5 and len(files) == 1
+    assert trade_ids(history) == ["t0", "t1", "t2"]
+
+    # 下一次合并补完删除
+    history.compact(min_files=2)
+    assert os.listdir(directory) == [os.path.basename(files[0])]
+    assert trade_ids(history) == ["t0", "t1", "t2"]
+
+
+def test_crash_before_compacted_file_is_renamed(history, monkeypatch):
+    real_replace = os.replace
+
+    def crash_on_output(src, dst):
+        if os.path.basename(dst).startswith("compacted-"):
+            raise KeyboardInterrupt("crash")
+        real_replace(src, dst)
+
+    monkeypatch.setattr(os, "replace", crash_on_output)
+    with pytest.raises(KeyboardInterrupt):
+        history.compact(min_files=2)
+    monkeypatch.setattr(os, "replace", real_replace)
+
+    assert trade_ids(history) == ["t0", "t1", "t2"]  # 清单作废，旧 part 文件照常读取
+    assert history.compact(min_files=2) == 1
+    (directory, files), = history.partitions()
+    assert os.listdir(directory) == [os.path.basename(files[0])]
+    assert trade_ids(history) == ["t0", "t1", "t2"]
+
+
+def test_unparseable_timestamp_is_skipped(tmp_path):
+    history = ParquetHistory(str(tmp_path / "alert_history"))
+    assert not history.add(row("not a time", "bad"))
+    assert history.add(row("2026-10-17T00:00:00Z", "good"))
+    assert history.flush() == 1 and history.skipped == 1
+    assert [date for date in os.listdir(history.root)] == ["date=2026-10-17"]
@@ -0,0 +1,41 @@
+"""HttpClient 重试策略：非幂等请求读取超时后不重发"""
+import time
+
+import pytest
+import requests
+
+from http_client import HttpClient
+from stub_api import StubServer, StubState
+
+
+def settled(stub, key):
+    """替身在延迟结束后才计数，等进行中的请求处理完再读取"""
+    time.sleep(0.5)
+    return stub.state.counts[key]
+
+
+@pytest.fixture
+def slow_stub():
+    with StubServer(StubState({"trades": [], "events": []}, latency_ms=300)) as server:
+        yield server
+
+
+def test_post_read_timeout_is_not_retried(slow_stub):
+    client = HttpClient(max_retries=3, backoff_base=0.01)
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        client.post(f"{slow_stub.base_url}/sheets", json={"rows": [{"trade_id": "t1"}]}, timeout=0.1)
+    assert settled(slow_stub, "POST /sheets") == 1
+
+
+def test_get_read_timeout_is_retried(slow_stub):
+    client = HttpClient(max_retries=2, backoff_base=0.01)
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        client.get(f"{slow_stub.base_url}/trades", timeout=0.1)
+    assert settled(slow_stub, "GET /trades") == 3
+
+
+def test_post_can_opt_into_retries(slow_stub):
+    client = HttpClient(max_retries=1, backoff_base=0.01)
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        client.post(f"{slow_stub.base_url}/sheets", json={"rows": []}, timeout=0.1, idempotent=True)
+    assert settled(slow_stub, "POST /sheets") == 2
@@ -0,0 +1,72 @@
+"""市场缓存：全量刷新移除已关闭的市场，/markets 查不到的市场在一段时间内不再请求"""
+import time
+
+
+def test_full_refresh_drops_markets_no_longer_listed(agent, stub, tmp_path):
+    cache = agent.MarketCache(str(tmp_path / "state.db"))
+    closed = {"conditionId": "0xclosed", "slug": "closed-market", "question": "Closed?",
+              "clobTokenIds": '["111", "222"]'}
+    record = cache._market_record(closed)
+    record["fetched_at"] = time.time() - 3600
+    cache._store([record])
+    assert cache.get("0xclosed") is not None
+
+    listed = cache.refresh(force_full=True)
+
+    assert listed > 0 and len(cache) == listed
+    assert cache.get("0xclosed") is None and cache.get(slug="closed-market") is None
+    assert "111" not in cache.token_ids()
+    assert cache.reload() == listed  # 状态库中同样已删除
+    cache.close()
+
+
+def test_prefetch_remembers_misses(agent, stub, tmp_path):
+    cache = agent.MarketCache(str(tmp_path / "state.db"))
+    trades = [{"conditionId": "0xunknown"}, {"conditionId": "0xunknown"}]
+    stub.state.reset()
+
+    assert cache.prefetch(trades) == 0
+    assert cache.prefetch(trades) == 0
+    assert stub.state.counts["GET /markets"] == 1
+
+    cache._misses["0xunknown"] = time.time() - 1  # 过期后重新请求
+    cache.prefetch(trades)
+    assert stub.state.counts["GET /markets"] == 2
+    cache.close()
+
+
+def test_failed_prefetch_is_retried(agent, stub, tmp_path):
+    cache = agent.MarketCache(str(tmp_path / "state.db"))
+    stub.state.reset()
+    stub.state.error_rate = 1.0
+    try:
+        cache.prefetch([{"conditionId": "0xunknown"}])
+    finally:
+        stub.state.error_rate = 0.0
+    assert "0xunknown" not in cache._misses
+    cache.close()
+
+
+def test_worker_syncs_coordinator_refresh_without_fetching(agent, stub, tmp_path):
+    path = str(tmp_path / "state.db")
+    coordinator = agent.MarketCache(path)
+    worker = agent.MarketCache(path)
+    stub.state.reset()
+
+    coordinator.refresh(force_full=True)
+    worker.sync()
+    assert len(worker) == len(coordinator) > 0
+
+    coordinator._store([coordinator._market_record({"conditionId": "0xclosed", "clobTokenIds": '["111"]'})])
+    worker.sync()  # 增量同步：只载入上次同步之后写入的市场
+    assert worker.get("0xclosed") is not None
+
+    coordinator._conn.execute("UPDATE markets SET fetched_at = 0 WHERE condition_id = '0xclosed'")
+    coordinator._conn.commit()
+    coordinator.refresh(force_full=True)
+    worker.sync()  # 全量刷新删除了已关闭的市场：整体重新载入
+    assert worker.get("0xclosed") is None and "111" not in worker.token_ids()
+    assert stub.state.counts["GET /events"] == 2
+    assert len(worker) == len(coordinator)
+    coordinator.close()
+    worker.close()
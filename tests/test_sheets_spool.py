@@ -0,0 +1,51 @@
+"""Google Sheets 批量队列：只有 Web App 确认了整批行数才删除队列，旧版脚本改为逐行发送"""
+import os
+
+import pytest
+
+
+@pytest.fixture
+def spool(agent, tmp_path):
+    spool = agent.SheetsSpool(str(tmp_path / "sheets_spool.jsonl"), batch_size=10)
+    for i in range(3):
+        spool.add({"trade_id": f"t{i}", "market": "m"})
+    return spool
+
+
+def fake_responses(monkeypatch, agent, batch_response):
+    calls = []
+
+    def request(payload, label):
+        calls.append(payload)
+        if "rows" in payload:
+            return batch_response
+        return 200, {"status": "success", "count": 1}
+
+    monkeypatch.setattr(agent, "_sheets_request", request)
+    return calls
+
+
+def test_confirmed_batch_clears_spool(agent, stub, spool):
+    stub.state.reset()
+    assert spool.flush()
+    assert not os.path.exists(spool.path)
+    assert [row["trade_id"] for row in stub.state.sheet_rows] == ["t0", "t1", "t2"]
+
+
+@pytest.mark.parametrize("response", [
+    (200, None),  # 200 但不是 JSON
+    (200, {"status": "success", "count": 2}),  # 行数对不上
+    (200, {"status": "error", "message": "boom"}),
+    (None, None),
+])
+def test_unconfirmed_batch_stays_in_spool(agent, monkeypatch, spool, response):
+    fake_responses(monkeypatch, agent, response)
+    assert not spool.flush()
+    assert len(spool.pending()) == 3
+
+
+def test_legacy_script_falls_back_to_single_rows(agent, monkeypatch, spool):
+    calls = fake_responses(monkeypatch, agent, (200, {"status": "success"}))
+    assert spool.flush()
+    assert spool.single_rows and not os.path.exists(spool.path)
+    assert [call.get("trade_id") for call in calls] == [None, "t0", "t1", "t2"]
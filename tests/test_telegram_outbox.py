@@ -0,0 +1,74 @@
+"""Telegram 发送队列：意外异常和格式不对的 429 响应按 5xx 处理重新入队，发送线程不退出"""
+import time
+
+import pytest
+import requests
+
+
+class FakeResponse:
+    def __init__(self, status_code, payload):
+        self.status_code = status_code
+        self.text = str(payload)
+        self._payload = payload
+
+    def json(self):
+        return self._payload
+
+
+@pytest.fixture
+def outbox(agent, tmp_path):
+    box = agent.TelegramOutbox(chat_id="1", min_interval=0, per_minute=0, coalesce_window=0,
+                               path=str(tmp_path / "outbox.jsonl"))
+    yield box
+    box.close(timeout=0)
+
+
+def test_unexpected_request_error_is_retried(agent, outbox, monkeypatch):
+    def broken(*args, **kwargs):
+        raise requests.exceptions.ChunkedEncodingError("connection broken")
+
+    monkeypatch.setattr(agent, "send_telegram_message", broken)
+    item = outbox._new_item(["alert"], None, 0.0)
+    outbox._deliver(item)
+
+    assert outbox._items == [item] and item["retry_at"] > time.monotonic()
+    assert outbox.counters["failed"] == 0
+
+
+def test_rate_limit_with_unexpected_body_pauses_and_requeues(agent, outbox, monkeypatch):
+    monkeypatch.setattr(agent, "send_telegram_message", lambda *a, **k: FakeResponse(429, ["not", "a", "dict"]))
+    item = outbox._new_item(["alert"], None, 0.0)
+    outbox._deliver(item)
+
+    assert outbox._items == [item] and item["attempts"] == 0
+    assert outbox._paused_until > time.monotonic()
+    assert outbox.counters["rate_limited"] == 1
+
+
+def test_worker_survives_errors_outside_the_request(agent, outbox, monkeypatch):
+    monkeypatch.setattr(outbox, "_render", lambda texts: 1 / 0)
+    outbox.enqueue("alert")
+    deadline = time.monotonic() + 5
+    while not outbox._items or outbox._items[0]["attempts"] == 0:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+    assert outbox._worker.is_alive()
+    assert len(outbox) == 1 and outbox.counters["failed"] == 0
+
+
+def test_coalescing_keys_outside_window_are_dropped(agent, monkeypatch, tmp_path):
+    monkeypatch.setattr(agent, "send_telegram_message", lambda *a, **k: FakeResponse(200, {"ok": True}))
+    box = agent.TelegramOutbox(chat_id="1", min_interval=0, per_minute=0, coalesce_window=0.2,
+                               path=str(tmp_path / "outbox.jsonl"))
+    try:
+        box.enqueue("first", key="m1")
+        time.sleep(0.3)
+        box.enqueue("second", key="m2")
+        deadline = time.monotonic() + 5
+        while box.counters["sent"] < 2:
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+        assert list(box._last_sent_by_key) == ["m2"]
+    finally:
+        box.close(timeout=0)
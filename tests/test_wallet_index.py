@@ -0,0 +1,125 @@
+"""钱包统计索引：API 基线与增量累加、下限 / 确切值 / TTL 判定、按需载入和淘汰范围"""
+import sqlite3
+import time
+
+import pytest
+
+from wallet_index import HOUR, WalletIndex
+
+DAY = 24 * HOUR
+
+
+def connect(path):
+    return sqlite3.connect(str(path), check_same_thread=False)
+
+
+@pytest.fixture
+def db(tmp_path):
+    return tmp_path / "state.db"
+
+
+@pytest.fixture
+def index(db):
+    idx = WalletIndex(connect(db), count_ttl=HOUR)
+    yield idx
+    idx.close()
+
+
+def test_observed_wallet_without_baseline_is_not_answered(index):
+    index.observe("t1", "0xa", time.time(), 5000, "m1")
+    assert index.lookup("0xa", at_least=1, need_created=False) is None
+
+
+def test_trades_before_baseline_are_not_counted_twice(index):
+    now = time.time()
+    index.seed("0xa", first_seen=now - 30 * DAY, first_seen_exact=True, trade_count=5, count_exact=True)
+    index.observe("old", "0xa", now - 60, 5000, "m1")  # 已包含在 API 基线笔数里
+    assert index.get("0xa").trade_count == 5
+    index.observe("new", "0xa", now + 60, 5000, "m1")
+    assert index.get("0xa").trade_count == 6
+    index.observe("new", "0xa", now + 60, 5000, "m1")  # 同一笔交易重复送达
+    assert index.get("0xa").trade_count == 6
+    assert index.counters["duplicate"] == 1
+
+
+def test_observed_increments_make_count_a_lower_bound(index):
+    now = time.time()
+    index.seed("0xa", first_seen=now - DAY, first_seen_exact=True, trade_count=3, count_exact=True)
+    assert index.lookup("0xa", at_least=10)[3] is True
+    index.observe("t1", "0xa", now + 10, 5000, "m1")
+    # 基线之后累加的笔数看不到低于金额阈值的交易：低于阈值时不能在本地回答，达到阈值时作为下限
+    assert index.lookup("0xa", at_least=10) is None
+    assert index.lookup("0xa", at_least=4)[2:] == (4, False)
+
+
+def test_cache_seed_counts_trades_after_cache_fetch(index):
+    now = time.time()
+    fetched_at = now - 600
+    index.seed("0xa", first_seen=now - DAY, first_seen_exact=True, trade_count=3, count_exact=True,
+               fetched=False, count_at=fetched_at)
+    index.observe("t1", "0xa", fetched_at - 60, 5000, "m1")  # 缓存写入之前：已包含在缓存的笔数里
+    index.observe("t2", "0xa", now - 60, 5000, "m1")  # 缓存写入之后、播种之前
+    assert index.get("0xa").trade_count == 4
+
+
+def test_exact_count_expires_after_ttl(index):
+    now = time.time()
+    index.seed("0xa", first_seen=now - DAY, first_seen_exact=True, trade_count=3, count_exact=True)
+    name, first_seen, count, exact = index.lookup("0xa", at_least=10)
+    assert (first_seen, count, exact) == (pytest.approx(now - DAY), 3, True)
+    assert index.lookup("0xa", at_least=10, now=now + 2 * HOUR) is None
+
+
+def test_lower_bound_at_threshold_never_expires(index):
+    now = time.time()
+    index.seed("0xa", first_seen=now - DAY, first_seen_exact=True, trade_count=10, count_exact=False)
+    answer = index.lookup("0xa", at_least=10, now=now + 30 * DAY)
+    assert answer[2:] == (10, False)
+
+
+def test_cached_count_is_only_a_lower_bound(index):
+    now = time.time()
+    index.seed("0xa", first_seen=now - DAY, first_seen_exact=True, trade_count=3, count_exact=True, fetched=False)
+    assert index.lookup("0xa", at_least=10) is None
+    assert index.lookup("0xa", at_least=3)[2:] == (3, False)
+
+
+def test_estimated_first_seen_requires_api_when_age_is_needed(index):
+    now = time.time()
+    index.seed("0xa", first_seen=now - DAY, first_seen_exact=False, trade_count=20, count_exact=False)
+    assert index.lookup("0xa", at_least=10, need_created=True) is None
+    assert index.lookup("0xa", at_least=10, need_created=False) == (None, None, 20, False)
+
+
+def test_wallets_are_loaded_on_demand(db, index):
+    now = time.time()
+    index.seed("0xa", first_seen=now - DAY, first_seen_exact=True, trade_count=3, count_exact=True)
+    index.observe("t1", "0xa", now + 10, 7000, "m1")
+    index.flush()
+
+    other = WalletIndex(connect(db), count_ttl=HOUR)
+    assert len(other) == 0
+    assert other.describe("0xa", now=now + 20)["volume_24h"] == 7000
+    assert other.get("0xa").trade_count == 4 and len(other) == 1
+    assert other.counters["loaded"] == 1
+    other.close()
+
+
+def test_eviction_only_touches_own_wallets(db):
+    now = time.time()
+    worker_a = WalletIndex(connect(db), max_entries=3)
+    worker_b = WalletIndex(connect(db), max_entries=3)
+    for i in range(3):
+        worker_b.observe(f"b{i}", f"0xb{i}", now - DAY + i, 5000, "m")
+    worker_b.flush()
+    for i in range(3):
+        worker_a.observe(f"a{i}", f"0xa{i}", now - 100 + i, 5000, "m")
+    worker_a.flush()  # 表中 6 行超过上限，但 worker_a 本次写入的都是有变化的钱包
+    worker_a.observe("a3", "0xa3", now, 5000, "m")
+    worker_a.flush()
+
+    addresses = {row[0] for row in worker_a._conn.execute("SELECT address FROM wallet_index")}
+    assert {"0xb0", "0xb1", "0xb2"} <= addresses  # 其他进程的钱包即使更旧也不删除
+    assert "0xa3" in addresses and worker_a.counters["evicted"] == 3
+    worker_a.close()
+    worker_b.close()
@@ -0,0 +1,71 @@
+"""钱包查询失败时不能当作新钱包（不写缓存、不播种索引、不触发钱包条件）"""
+import pytest
+
+from wallet_index import WalletIndex
+
+
+@pytest.fixture
+def address(stub):
+    return stub.state.fixtures["trades"][0]["proxyWallet"]
+
+
+@pytest.fixture
+def failing_api(stub):
+    stub.state.error_rate = 1.0
+    yield stub
+    stub.state.error_rate = 0.0
+
+
+def test_outage_is_not_a_new_wallet(agent, failing_api, address, tmp_path):
+    cache = agent.WalletCache(str(tmp_path / "state.db"))
+    index = WalletIndex(agent._connect_state_db(str(tmp_path / "state.db")))
+
+    snapshot = agent.get_wallet_snapshot(address, cache, at_least=10, index=index)
+
+    assert snapshot.trade_count is None
+    assert failing_api.state.injected  # 请求确实被注入了 5xx
+    assert cache.get_trade_count(address) is None
+    assert cache.get_profile(address) is None
+    assert index.get(address) is None
+
+    profile, bet_count = agent.enrich_wallet(address, cache, at_least=10, index=index)
+    assert bet_count == 99
+    rules = agent.load_rules(None, agent.MIN_BET_USD, agent.MAX_ACCOUNT_AGE_DAYS, agent.MIN_TRADE_COUNT)
+    assert rules.evaluate(rules.rules, None, bet_count) == []
+    cache.close()
+    index.close()
+
+
+def test_successful_lookup_is_cached(agent, stub, address, tmp_path):
+    cache = agent.WalletCache(str(tmp_path / "state.db"))
+    snapshot = agent.get_wallet_snapshot(address, cache, at_least=10)
+
+    assert snapshot.trade_count is not None
+    assert cache.get_trade_count(address, 10) == snapshot.trade_count
+    cache.close()
+
+
+def test_trades_fallback_after_activity_failure_is_lower_bound(agent, monkeypatch, address):
+    real = agent._fetch_activity_pages
+
+    def activity_fails(endpoint, *args):
+        if endpoint == "activity":
+            return [], False, True
+        return real(endpoint, *args)
+
+    monkeypatch.setattr(agent, "_fetch_activity_pages", activity_fails)
+    snapshot = agent.fetch_wallet_snapshot(address)
+
+    assert snapshot.trade_count  # trades 的记录照常使用
+    assert not snapshot.count_exact and not snapshot.created_exact
+
+
+def test_failed_first_activity_probe_keeps_records(agent, monkeypatch, address):
+    def probe_fails(*args):
+        raise agent.requests.exceptions.HTTPError("502 Server Error")
+
+    monkeypatch.setattr(agent, "fetch_first_activity_time", probe_fails)
+    snapshot = agent.fetch_wallet_snapshot(address, at_least=1)
+
+    assert snapshot.trade_count == 1 and not snapshot.count_exact
+    assert snapshot.created_at is not None and not snapshot.created_exact
@@ -0,0 +1,287 @@
+"""进程内钱包统计索引
+
+每笔拉取到的交易都 O(1) 更新所属钱包的聚合统计：首次/最近出现时间、交易笔数、
+按小时分桶的滚动成交额（24 小时 / 7 天）、涉及的市场数和最大单笔金额。
+索引保存在状态库的 wallet_index 表中，只写回有变化的钱包。
+
+交易笔数和账号年龄的判定以 Data API 的结果为基线：钱包第一次被查询时用 seed() 写入
+（首笔活动时间、历史笔数），之后拉取到的交易在基线上累加。由于只能看到达到金额阈值的交易，
+累加后的笔数是下限：
+- 首笔活动时间确切时，账号年龄可以一直在本地计算
+- 笔数下限已达到判定阈值时一直有效（交易笔数只增不减）
+- 笔数低于阈值的确切值只在 count_ttl 内有效，过期后重新查询 API
+lookup() 无法在本地回答时返回 None，由调用方查询钱包缓存或 API。
+
+启动时不载入整张表：observe / seed / lookup / describe 第一次用到某个钱包时按地址读取一行，
+内存中只保留本进程处理过的钱包（最多 max_entries 个）。多个工作进程 / 节点共享状态库时，
+每个进程只写回、只淘汰自己处理过的钱包，不会按过期的内存副本删除其他进程的记录。
+"""
+import threading
+import time
+import zlib
+from array import array
+from collections import deque
+
+HOUR = 3600
+VOLUME_WINDOW_HOURS = 7 * 24
+MAX_MARKETS = 256  # 每个钱包最多记录的市场数，超过后 markets_touched 显示为下限
+
+
+class WalletStats:
+    """单个钱包的聚合统计
+
+    buckets 为扁平数组 [小时, 成交额, 小时, 成交额, ...]，只保留最近 7 天有成交的小时；
+    markets 保存 conditionId 的 crc32，用来统计涉及的市场数。
+    """
+
+    __slots__ = ("name", "first_seen", "first_seen_exact", "last_seen", "trade_count", "count_exact",
+                 "count_at", "largest_bet", "markets", "buckets", "dirty")
+
+    def __init__(self):
+        self.name = None
+        self.first_seen = None
+        self.first_seen_exact = False
+        self.last_seen = None
+        self.trade_count = 0
+        self.count_exact = None  # None 表示还没有 API 基线
+        self.count_at = None
+        self.largest_bet = 0.0
+        self.markets = set()
+        self.buckets = array("d")
+        self.dirty = True
+
+    def observe(self, ts, amount, market):
+        if self.first_seen is None or (ts < self.first_seen and not self.first_seen_exact):
+            self.first_seen = ts
+        if self.last_seen is None or ts > self.last_seen:
+            self.last_seen = ts
+        # API 基线时间之前的交易已经包含在基线笔数里；之后累加的笔数看不到低于金额阈值的交易，只是下限
+        if self.count_at is None or ts > self.count_at:
+            self.trade_count += 1
+            if self.count_exact:
+                self.count_exact = False
+        if amount > self.largest_bet:
+            self.largest_bet = amount
+        if market and len(self.markets) < MAX_MARKETS:
+            self.markets.add(zlib.crc32(market.encode()))
+        self._add_volume(int(ts // HOUR), amount)
+        self.dirty = True
+
+    def _add_volume(self, hour, amount):
+        buckets = self.buckets
+        if buckets and buckets[-2] == hour:
+            buckets[-1] += amount
+            return
+        if not buckets or buckets[-2] < hour:
+            buckets.extend((hour, amount))
+            self._prune(hour)
+            return
+        # 乱序到达的交易：最多遍历 7 天的小时桶
+        for i in range(len(buckets) - 2, -1, -2):
+            if buckets[i] == hour:
+                buckets[i + 1] += amount
+                return
+            if buckets[i] < hour:
+                buckets[i + 2:i + 2] = array("d", (hour, amount))
+                return
+        if hour > self.buckets[-2] - VOLUME_WINDOW_HOURS:
+            buckets[0:0] = array("d", (hour, amount))
+
+    def _prune(self, current_hour):
+        cutoff = current_hour - VOLUME_WINDOW_HOURS
+        i = 0
+        while i < len(self.buckets) and self.buckets[i] <= cutoff:
+            i += 2
+        if i:
+            del self.buckets[:i]
+
+    def volume(self, hours, now):
+        """最近 hours 小时（含当前小时）的成交额"""
+        cutoff = int(now // HOUR) - hours
+        total = 0.0
+        for i in range(len(self.buckets) - 2, -1, -2):
+            if self.buckets[i] <= cutoff:
+                break
+            total += self.buckets[i + 1]
+        return total
+
+
+class WalletIndex:
+    """钱包统计索引（线程安全），持久化到状态库的 wallet_index 表"""
+
+    def __init__(self, conn, count_ttl=0, max_entries=200000, recent_ids=50000):
+        self._conn = conn
+        self.count_ttl = count_ttl
+        self.max_entries = max_entries
+        self.counters = {"observed": 0, "duplicate": 0, "hit": 0, "miss": 0, "seeded": 0, "loaded": 0,
+                         "evicted": 0, "unloaded": 0}
+        self._lock = threading.Lock()
+        self._wallets = {}
+        # 同一笔交易可能由实时流和轮询各送来一次，按交易 ID 去重（只在进程内）
+        self._recent = deque(maxlen=recent_ids)
+        self._recent_set = set()
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS wallet_index (
+                address TEXT PRIMARY KEY,
+                name TEXT,
+                first_seen REAL,
+                first_seen_exact INTEGER,
+                last_seen REAL,
+                trade_count INTEGER,
+                count_exact INTEGER,
+                count_at REAL,
+                largest_bet REAL,
+                markets BLOB,
+                buckets BLOB
+            )"""
+        )
+        self._conn.commit()
+
+    def __len__(self):
+        """本进程内存中的钱包数"""
+        return len(self._wallets)
+
+    def _load(self, address, create=False):
+        """取内存中的钱包统计，没有时按地址从状态库读取一行；都没有且 create=True 时新建（须持有锁）"""
+        stats = self._wallets.get(address)
+        if stats is not None:
+            return stats
+        row = self._conn.execute("SELECT * FROM wallet_index WHERE address = ?", (address,)).fetchone()
+        if row is not None:
+            stats = WalletStats()
+            (_, stats.name, stats.first_seen, first_seen_exact, stats.last_seen, stats.trade_count,
+             count_exact, stats.count_at, stats.largest_bet, markets, buckets) = row
+            stats.first_seen_exact = bool(first_seen_exact)
+            stats.count_exact = None if count_exact is None else bool(count_exact)
+            stats.markets = set(array("I", markets or b""))
+            stats.buckets = array("d", buckets or b"")
+            stats.dirty = False
+            self.counters["loaded"] += 1
+        elif create:
+            stats = WalletStats()
+        else:
+            return None
+        self._wallets[address] = stats
+        return stats
+
+    def get(self, address):
+        with self._lock:
+            return self._load(address)
+
+    def observe(self, trade_id, address, ts, amount, market):
+        """记录一笔交易，重复的交易 ID 忽略"""
+        with self._lock:
+            if trade_id in self._recent_set:
+                self.counters["duplicate"] += 1
+                return
+            if len(self._recent) == self._recent.maxlen:
+                self._recent_set.discard(self._recent[0])
+            self._recent.append(trade_id)
+            self._recent_set.add(trade_id)
+            stats = self._load(address, create=True)
+            stats.observe(ts, amount, market)
+            self.counters["observed"] += 1
+
+    def seed(self, address, name=None, first_seen=None, first_seen_exact=False, trade_count=None,
+             count_exact=False, fetched=True, count_at=None):
+        """写入 API 查到的基线；fetched=False（来自钱包缓存）时笔数只作为下限
+
+        count_at 为笔数的查询时间（默认现在），之后的交易在基线上累加；来自钱包缓存时传入缓存的写入时间，
+        否则缓存写入之后、现在之前的交易会被当作已包含在基线里。
+        """
+        count_at = time.time() if count_at is None else count_at
+        with self._lock:
+            stats = self._load(address, create=True)
+            if name:
+                stats.name = name
+            if first_seen is not None:
+                if first_seen_exact:
+                    stats.first_seen, stats.first_seen_exact = first_seen, True
+                elif not stats.first_seen_exact:
+                    stats.first_seen = first_seen if stats.first_seen is None else min(first_seen, stats.first_seen)
+            if trade_count is not None:
+                exact = bool(count_exact and fetched)
+                if exact or stats.count_exact is None or trade_count > stats.trade_count:
+                    stats.trade_count = trade_count
+                    stats.count_exact = exact
+                    stats.count_at = count_at
+            stats.dirty = True
+            self.counters["seeded"] += 1
+
+    def lookup(self, address, at_least=None, need_created=True, now=None):
+        """在本地回答判定所需的钱包信息，返回 (名称, 首笔活动时间戳, 交易笔数, 笔数是否确切)，不能回答时返回 None"""
+        now = time.time() if now is None else now
+        with self._lock:
+            stats = self._load(address)
+            answer = None
+            if stats is not None and stats.count_exact is not None and (stats.first_seen_exact or not need_created):
+                if at_least is not None and stats.trade_count >= at_least:
+                    answer = (stats.name, stats.first_seen if stats.first_seen_exact else None, stats.trade_count, False)
+                elif stats.count_exact and (self.count_ttl <= 0 or now - stats.count_at < self.count_ttl):
+                    answer = (stats.name, stats.first_seen if stats.first_seen_exact else None, stats.trade_count, True)
+            self.counters["hit" if answer else "miss"] += 1
+            return answer
+
+    def describe(self, address, now=None):
+        """告警用的钱包统计：24 小时 / 7 天成交额、涉及市场数、最大单笔"""
+        now = time.time() if now is None else now
+        with self._lock:
+            stats = self._load(address)
+            if stats is None:
+                return None
+            return {
+                "volume_24h": round(stats.volume(24, now), 2),
+                "volume_7d": round(stats.volume(VOLUME_WINDOW_HOURS, now), 2),
+                "markets_touched": len(stats.markets),
+                "largest_bet": round(stats.largest_bet, 2),
+            }
+
+    def flush(self):
+        """写回有变化的钱包并执行上限，返回写入条数
+
+        淘汰只针对本进程内存中、本次没有变化的钱包（按最近出现时间从旧到新）：
+        表中的记录超过 max_entries 时删除这些钱包的记录，内存中的钱包超过 max_entries 时只从内存移除。
+        """
+        with self._lock:
+            rows = []
+            for address, s in self._wallets.items():
+                if not s.dirty:
+                    continue
+                rows.append((address, s.name, s.first_seen, int(s.first_seen_exact), s.last_seen, s.trade_count,
+                             None if s.count_exact is None else int(s.count_exact), s.count_at, s.largest_bet,
+                             array("I", s.markets).tobytes(), s.buckets.tobytes()))
+                s.dirty = False
+            self._conn.executemany("INSERT OR REPLACE INTO wallet_index VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            if self.max_entries > 0:
+                self._enforce_limit({row[0] for row in rows})
+            self._conn.commit()
+            return len(rows)
+
+    def _enforce_limit(self, written):
+        """按 max_entries 淘汰本进程处理过的钱包（须持有锁）"""
+        overage = self._conn.execute("SELECT COUNT(*) FROM wallet_index").fetchone()[0] - self.max_entries
+        unload = len(self._wallets) - self.max_entries
+        if overage <= 0 and unload <= 0:
+            return
+        candidates = sorted((a for a in self._wallets if a not in written),
+                            key=lambda a: self._wallets[a].last_seen or 0)
+        evicted = candidates[:max(0, overage)]
+        self._conn.executemany("DELETE FROM wallet_index WHERE address = ?", ((a,) for a in evicted))
+        for address in evicted:
+            del self._wallets[address]
+        self.counters["evicted"] += len(evicted)
+        unloaded = candidates[len(evicted):len(evicted) + max(0, unload - len(evicted))]
+        for address in unloaded:
+            del self._wallets[address]
+        self.counters["unloaded"] += len(unloaded)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats["wallets"] = len(self._wallets)
+            return stats
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._conn.close()